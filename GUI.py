@@ -1,8 +1,17 @@
+import logging
 import tkinter as tk
-from tkinter import ttk, messagebox
+from datetime import date
+from tkinter import ttk, messagebox, filedialog
 from tkinter import font as tkfont
 
 from budget import BudgetTracker, Expense, PERSONAL_USE, JOINT_USE
+from recurring import FREQUENCIES
+from filelock import LockedError
+from importer import import_statement
+from expense_table import ExpenseTable
+from charts import ChartPanel
+from saver import SaveWorker
+from metrics import format_snapshot, setup_logging, start_profiling
 
 # --- Colours & fonts ---
 BG          = "#303030"
@@ -33,9 +42,25 @@ FONT_BOLD  = ("Segoe UI", 10, "bold")
 FONT_TITLE = ("Segoe UI", 14, "bold")
 FONT_SMALL = ("Segoe UI", 9)
 
+# Status messages go to the console; BUDGET_PROFILE=cpu/memory profiles the session
+setup_logging()
+start_profiling()
+log = logging.getLogger("budget.gui")
+
 tracker = BudgetTracker()
-tracker.load_expenses()
-tracker.load_budget()
+try:
+    # Another window or the API server saving to the same files would clobber our saves
+    tracker.lock()
+except LockedError as e:
+    tk.Tk().withdraw()
+    messagebox.showerror("Budget Tracker", f"{e}.\nClose the other Budget Tracker first.")
+    raise SystemExit(1)
+# True if a file exists but could not be read: saving would overwrite it, so nothing is saved
+load_failed = not tracker.load_budget()
+# Saves run on a worker thread; save_all() only queues one
+save_worker = SaveWorker(tracker)
+# True until load_expenses has read the whole file; see still_loading()
+loading = True
 
 # --- Rounded button ---
 
@@ -75,15 +100,51 @@ class RoundedButton(tk.Canvas):
 # --- Helpers ---
 
 def refresh_table():
-    for row in table.get_children():
-        table.delete(row)
-    for i, e in enumerate(tracker.expenses):
-        tag = "odd" if i % 2 == 0 else "even"
-        table.insert("", "end", iid=i, tags=(tag,),
-                     values=(e.date, e.description, f"${e.amount:.2f}", e.use, e.category))
+    table_view.set_query(filter_var.get())
+    update_status()
+
+def load_expenses(loader):
+    # Pull one chunk per event-loop turn so rows and totals appear while the file is parsed
+    global loading, load_failed
+    try:
+        next(loader)
+    except StopIteration:
+        log.info("Expenses loaded from file.")
+    except FileNotFoundError:
+        log.info("No saved expenses found.")
+    except Exception as e:
+        log.error(f"Failed to load expenses from file: {e}")
+        load_failed = True
+    else:
+        # Show the partial store without listening: the loader's appends are not diffs
+        table_view.attach(tracker.expenses, listen=False)
+        # The charts do listen: the loader's chunks arrive as extends they can fold in
+        chart_view.attach(tracker.expenses)
+        update_status()
+        window.after(1, load_expenses, loader)
+        return
+    loading = False
+    table_view.attach(tracker.expenses)
+    chart_view.attach(tracker.expenses)
+    update_status()
+    if load_failed:
+        messagebox.showerror("Budget Tracker", "The saved expenses or budget could not be loaded.\n"
+                             "Changes in this session will not be saved, so the files are left as they are.")
+
+def on_reload(store):
+    # Months of a partitioned file were loaded or dropped: the tracker has a new store
+    table_view.attach(store)
+    chart_view.attach(store)
     update_status()
 
+def load_older():
+    # Scrolled up past the oldest loaded expense: bring in the month before it
+    tracker.load_older()
+
 def update_status():
+    # Drawn at the next idle moment, and only if a total, the budget or the size changed
+    chart_view.request()
+    filter_info.config(text=f"{len(table_view.matches)} matches" if table_view.query else "")
     total = tracker.total_expenses()
     if tracker.budget is not None:
         remaining = tracker.budget - total
@@ -95,13 +156,45 @@ def update_status():
         budget_val.config(text="Not set", fg=SUBTEXT)
         spent_val.config(text=f"${total:.2f}", fg=TEXT)
         remaining_val.config(text="—", fg=SUBTEXT)
+    # Rollup lookups, not scans: cheap enough to run after every change
+    month_spent = tracker.month_spent()
+    month_limit = tracker.limits.limit_for()
+    if month_limit is not None:
+        month_left = month_limit - month_spent
+        month_card_label.config(text="Left this month")
+        month_val.config(text=f"${month_left:.2f}", fg=SUCCESS if month_left >= 0 else BTN_DEL)
+    else:
+        month_card_label.config(text="This month")
+        month_val.config(text=f"${month_spent:.2f}", fg=TEXT)
+
+def update_save_info():
+    stats = save_worker.stats()
+    if load_failed:
+        save_info.config(text="Not saving: the saved files could not be loaded", fg=BTN_DEL)
+    elif stats["queue_depth"] and stats["failures"]:
+        save_info.config(text=f"Save failed, retrying ({stats['queue_depth']} unsaved)", fg=BTN_DEL)
+    elif stats["queue_depth"]:
+        save_info.config(text=f"Saving {stats['queue_depth']} changes…", fg=SUBTEXT)
+    elif stats["last_ms"] is not None:
+        save_info.config(text=f"Saved · {stats['last_ms']:.0f} ms (p50 {stats['p50_ms']:.0f}, "
+                              f"max {stats['max_ms']:.0f})", fg=SUBTEXT)
+    window.after(500, update_save_info)
+
+def still_loading():
+    # Until the load is done nothing records changes, and a save would write the partial store
+    if loading:
+        messagebox.showinfo("Loading", "Expenses are still loading, try again in a moment.")
+    return loading
 
 def save_all():
-    tracker.save_expenses()
-    tracker.save_budget()
+    if not loading and not load_failed:
+        save_worker.request()
 
 def save_and_exit():
-    save_all()
+    if not save_worker.flush() and not messagebox.askyesno(
+            "Save failed", "Some changes could not be saved. Exit anyway?"):
+        return
+    save_worker.close()
     window.destroy()
 
 # --- Styled dialog base ---
@@ -130,6 +223,8 @@ def styled_entry(parent, row, value=""):
 # --- Add Expense ---
 
 def open_add_dialog():
+    if still_loading():
+        return
     dialog = make_dialog("Add Expense")
     field_defs = ["Date (YYYY-MM-DD)", "Description", "Amount", "Category"]
     fields = {}
@@ -155,7 +250,8 @@ def open_add_dialog():
                 messagebox.showerror("Error", "All fields are required.", parent=dialog)
                 return
             tracker.add_expense(Expense(date, description, amount, use, category))
-            refresh_table()
+            table_view.see(tracker.expenses.order[-1])
+            update_status()
             save_all()
             dialog.destroy()
         except ValueError:
@@ -167,25 +263,50 @@ def open_add_dialog():
 # --- Remove Expense ---
 
 def remove_expense():
-    selected = table.selection()
-    if not selected:
+    if still_loading():
+        return
+    expense_id = table_view.selected_id()
+    if expense_id is None:
         messagebox.showwarning("No selection", "Select an expense to remove.")
         return
-    index = int(selected[0])
     if messagebox.askyesno("Confirm", "Remove selected expense?"):
-        tracker.remove_expense(index)
-        refresh_table()
+        tracker.remove_expense_by_id(expense_id)
+        update_status()
         save_all()
 
+# --- Import Statement ---
+
+def import_expenses():
+    if still_loading():
+        return
+    filename = filedialog.askopenfilename(
+        title="Import bank statement",
+        filetypes=[("Statements", "*.csv *.ofx *.qfx"), ("All files", "*.*")])
+    if not filename:
+        return
+    window.config(cursor="watch")
+    window.update_idletasks()
+    try:
+        report = import_statement(tracker, filename)
+    except (OSError, ValueError) as e:
+        messagebox.showerror("Import failed", str(e))
+        return
+    finally:
+        window.config(cursor="")
+    update_status()
+    save_all()
+    messagebox.showinfo("Import", str(report))
+
 # --- Edit Expense ---
 
 def open_edit_dialog():
-    selected = table.selection()
-    if not selected:
+    if still_loading():
+        return
+    expense_id = table_view.selected_id()
+    if expense_id is None:
         messagebox.showwarning("No selection", "Select an expense to edit.")
         return
-    index   = int(selected[0])
-    expense = tracker.expenses[index]
+    expense = tracker.get_expense(expense_id)
 
     dialog = make_dialog("Edit Expense")
     field_defs = [
@@ -216,8 +337,11 @@ def open_edit_dialog():
             if not date or not description or not category:
                 messagebox.showerror("Error", "All fields are required.", parent=dialog)
                 return
-            tracker.edit_expense(index, date, description, amount, use, category)
-            refresh_table()
+            # By id: the expense's position may have changed while the dialog was open
+            if not tracker.edit_expense_by_id(expense_id, date, description, amount, use, category):
+                messagebox.showerror("Error", "The expense no longer exists.", parent=dialog)
+                return
+            update_status()
             save_all()
             dialog.destroy()
         except ValueError:
@@ -229,21 +353,125 @@ def open_edit_dialog():
 # --- Set Budget ---
 
 def open_budget_dialog():
+    if still_loading():
+        return
     dialog = make_dialog("Set Budget")
     styled_label(dialog, "Budget amount:", 1)
     entry = styled_entry(dialog, 1, str(tracker.budget) if tracker.budget is not None else "")
+    styled_label(dialog, "Monthly budget:", 2)
+    monthly = tracker.limits.get()
+    monthly_entry = styled_entry(dialog, 2, str(monthly) if monthly is not None else "")
 
     def submit():
         try:
             amount = float(entry.get().strip())
-            tracker.set_budget(amount)
-            save_all()
-            update_status()
-            dialog.destroy()
+            # Blank removes the every-month budget
+            monthly_text = monthly_entry.get().strip()
+            monthly_amount = float(monthly_text) if monthly_text else None
         except ValueError:
-            messagebox.showerror("Error", "Amount must be a number.", parent=dialog)
+            messagebox.showerror("Error", "Amounts must be numbers.", parent=dialog)
+            return
+        tracker.set_budget(amount)
+        tracker.set_monthly_budget(monthly_amount)
+        save_all()
+        update_status()
+        dialog.destroy()
 
     RoundedButton(dialog, "Set Budget", submit).grid(
+        row=3, column=0, columnspan=2, pady=(16, 24))
+
+# --- Recurring Expenses ---
+
+def open_recurring_dialog():
+    if still_loading():
+        return
+    dialog = make_dialog("Recurring Expenses")
+    rule_columns = (("Description", 180), ("Amount", 90), ("Repeats", 130), ("Next", 110), ("Category", 120))
+    rules_table = ttk.Treeview(dialog, columns=[col for col, _ in rule_columns], show="headings", height=6)
+    for col, width in rule_columns:
+        rules_table.heading(col, text=col)
+        rules_table.column(col, width=width, anchor="center")
+    rules_table.grid(row=1, column=0, columnspan=2, padx=28, pady=(0, 10))
+
+    def refresh():
+        # Only each rule's next occurrence is worked out; none are stored
+        rules_table.delete(*rules_table.get_children())
+        today = date.today().toordinal()
+        for rule in tracker.recurring:
+            due = rule.next_after(today - 1)
+            rules_table.insert("", "end", iid=rule.id, values=(
+                rule.description, f"${rule.amount:.2f}", rule.label,
+                "Ended" if due is None else date.fromordinal(due).isoformat(), rule.category))
+
+    field_defs = [("Description", ""), ("Amount", ""), ("Category", ""),
+                  ("Start (YYYY-MM-DD)", date.today().isoformat()), ("End (blank: never)", ""), ("Every", "1")]
+    fields = {}
+    for i, (label, value) in enumerate(field_defs):
+        styled_label(dialog, label, i + 2)
+        fields[label] = styled_entry(dialog, i + 2, value)
+
+    row = len(field_defs) + 2
+    choices = {}
+    for i, (label, values, default) in enumerate((("Frequency", FREQUENCIES, "monthly"),
+                                                  ("Use", [PERSONAL_USE, JOINT_USE], PERSONAL_USE))):
+        styled_label(dialog, label, row + i)
+        choices[label] = tk.StringVar(value=default)
+        ttk.Combobox(dialog, textvariable=choices[label], values=values, state="readonly",
+                     width=23, font=FONT).grid(row=row + i, column=1, padx=(0, 28), pady=7)
+
+    def add():
+        description = fields["Description"].get().strip()
+        category    = fields["Category"].get().strip()
+        if not description or not category:
+            messagebox.showerror("Error", "Description and category are required.", parent=dialog)
+            return
+        try:
+            tracker.add_recurring(description, float(fields["Amount"].get().strip()), choices["Use"].get(),
+                                  category, fields["Start (YYYY-MM-DD)"].get().strip(),
+                                  choices["Frequency"].get(), int(fields["Every"].get().strip() or 1),
+                                  fields["End (blank: never)"].get().strip() or None)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e), parent=dialog)
+            return
+        refresh()
+        update_status()
+        save_all()
+
+    def remove():
+        selected = rules_table.selection()
+        if not selected:
+            messagebox.showwarning("No selection", "Select a recurring expense to remove.", parent=dialog)
+            return
+        tracker.remove_recurring(int(selected[0]))
+        refresh()
+        update_status()
+        save_all()
+
+    buttons = tk.Frame(dialog, bg=BG)
+    buttons.grid(row=row + 2, column=0, columnspan=2, pady=(16, 24))
+    RoundedButton(buttons, "Add Recurring", add).pack(side="left", padx=(0, 8))
+    RoundedButton(buttons, "Remove", remove, color=BTN_DEL, hover=BTN_DEL_HOV, fg=BTN_FG).pack(side="left")
+    refresh()
+
+# --- Metrics ---
+
+def open_metrics_dialog():
+    dialog = make_dialog("Metrics")
+    text = tk.Text(dialog, width=92, height=22, font="TkFixedFont", bg=SURFACE, fg=TEXT,
+                   relief="flat", bd=8)
+    text.grid(row=1, column=0, columnspan=2, padx=28)
+
+    def refresh():
+        stats = save_worker.stats()
+        text.config(state="normal")
+        text.delete("1.0", "end")
+        text.insert("end", format_snapshot())
+        text.insert("end", f"\n\nSave queue: {stats['queue_depth']} unsaved changes, "
+                           f"{stats['saves']} saves, {stats['failures']} failed")
+        text.config(state="disabled")
+
+    refresh()
+    RoundedButton(dialog, "Refresh", refresh).grid(
         row=2, column=0, columnspan=2, pady=(16, 24))
 
 # --- Window ---
@@ -252,6 +480,7 @@ window = tk.Tk()
 window.title("Budget Tracker")
 window.configure(bg=BG)
 window.resizable(False, False)
+window.protocol("WM_DELETE_WINDOW", save_and_exit)
 
 # --- Header: title left, stat cards right ---
 header = tk.Frame(window, bg=BG)
@@ -261,7 +490,8 @@ tk.Label(header, text="Budget Tracker", font=FONT_TITLE, bg=BG, fg=TEXT).pack(si
 
 def stat_card(parent, label_text):
     card = tk.Frame(parent, bg=SURFACE, padx=14, pady=6)
-    tk.Label(card, text=label_text, font=FONT_SMALL, bg=SURFACE, fg=SUBTEXT).pack()
+    card.label = tk.Label(card, text=label_text, font=FONT_SMALL, bg=SURFACE, fg=SUBTEXT)
+    card.label.pack()
     val = tk.Label(card, text="—", font=FONT_BOLD, bg=SURFACE, fg=TEXT)
     val.pack()
     return card, val
@@ -269,6 +499,10 @@ def stat_card(parent, label_text):
 stats = tk.Frame(header, bg=BG)
 stats.pack(side="right")
 
+month_card, month_val = stat_card(stats, "This month")
+month_card.pack(side="right", padx=(8, 0))
+month_card_label = month_card.label
+
 remaining_card, remaining_val = stat_card(stats, "Remaining")
 remaining_card.pack(side="right", padx=(8, 0))
 
@@ -286,8 +520,25 @@ RoundedButton(toolbar, "Add",    open_add_dialog,    color=BTN_ADD,  hover=BTN_A
 RoundedButton(toolbar, "Edit",   open_edit_dialog,   color=BTN_EDIT, hover=BTN_EDIT_HOV, fg=BTN_FG).pack(side="left", padx=(0, 8))
 RoundedButton(toolbar, "Remove", remove_expense,     color=BTN_DEL,  hover=BTN_DEL_HOV,  fg=BTN_FG).pack(side="left", padx=(0, 8))
 RoundedButton(toolbar, "Budget", open_budget_dialog, color=BTN_BUD,  hover=BTN_BUD_HOV,  fg=BTN_FG).pack(side="left", padx=(0, 8))
+RoundedButton(toolbar, "Recurring", open_recurring_dialog, color=NEUTRAL, hover=NEUTRAL_HOV).pack(side="left", padx=(0, 8))
+RoundedButton(toolbar, "Import", import_expenses,    color=NEUTRAL,  hover=NEUTRAL_HOV).pack(side="left", padx=(0, 8))
+RoundedButton(toolbar, "Metrics", open_metrics_dialog, color=NEUTRAL, hover=NEUTRAL_HOV).pack(side="left", padx=(0, 8))
 RoundedButton(toolbar, "Save & Exit", save_and_exit,     color=NEUTRAL,  hover=NEUTRAL_HOV).pack(side="right")
 
+# --- Filter: narrows the table as you type ---
+filter_bar = tk.Frame(window, bg=BG)
+filter_bar.pack(fill="x", padx=24, pady=(0, 8))
+
+tk.Label(filter_bar, text="Filter", font=FONT, bg=BG, fg=SUBTEXT).pack(side="left", padx=(0, 10))
+filter_var = tk.StringVar()
+tk.Entry(filter_bar, textvariable=filter_var, width=32, font=FONT, bg=SURFACE, fg=TEXT,
+         insertbackground=TEXT, relief="flat", bd=6).pack(side="left")
+filter_info = tk.Label(filter_bar, text="", font=FONT_SMALL, bg=BG, fg=SUBTEXT)
+filter_info.pack(side="left", padx=(10, 0))
+save_info = tk.Label(filter_bar, text="", font=FONT_SMALL, bg=BG, fg=SUBTEXT)
+save_info.pack(side="right")
+filter_var.trace_add("write", lambda *_: refresh_table())
+
 # Divider
 tk.Frame(window, bg=ACCENT, height=2).pack(fill="x", padx=24)
 
@@ -313,10 +564,23 @@ for col in columns:
     table.heading(col, text=col)
     table.column(col, width=col_widths[col], anchor="center")
 
-scrollbar = ttk.Scrollbar(window, orient="vertical", command=table.yview)
-table.configure(yscrollcommand=scrollbar.set)
+scrollbar = ttk.Scrollbar(window, orient="vertical")
 table.pack(side="left", padx=(24, 0), pady=12)
 scrollbar.pack(side="left", fill="y", pady=12)
 
-refresh_table()
+# --- Charts: cumulative spend against the budget, and spend by category; see charts.py ---
+chart_canvas = tk.Canvas(window, width=440, height=600, bg=SURFACE, highlightthickness=0)
+chart_canvas.pack(side="left", padx=(16, 24), pady=12)
+chart_view = ChartPanel(chart_canvas, tracker, font=FONT_SMALL, colors={
+    "text": TEXT, "subtext": SUBTEXT, "grid": NEUTRAL, "line": BTN_EDIT, "budget": BTN_DEL, "bar": BTN_ADD})
+
+# Only the 18 visible rows are ever materialised; see expense_table.py
+table_view = ExpenseTable(table, scrollbar, tracker, height=18)
+table_view.attach(tracker.expenses)
+chart_view.attach(tracker.expenses)
+table_view.on_scroll_top = load_older
+tracker.reload_listeners.append(on_reload)
+update_status()
+update_save_info()
+window.after(0, load_expenses, tracker.iter_load_expenses())
 window.mainloop()
@@ -0,0 +1,271 @@
+#Pluggable number crunching for reports and forecasts.
+#
+#The default backend is pure Python over the store's arrays, so importing the
+#tracker stays cheap. NumPy (and pandas, for DataFrame exports) are only imported
+#the first time a backend that needs them is asked for. Pick one with
+#get_backend(name) or the BUDGET_ANALYTICS environment variable:
+#"python" (default), "numpy", "pandas" or "auto" (NumPy when installed).
+
+import importlib.util
+import math
+import os
+from datetime import date as Date
+
+from store import month_of
+
+_backends = {}
+# Months in each report period; see period_of
+PERIOD_MONTHS = {"month": 1, "quarter": 3, "year": 12}
+
+
+def _interpolate(ordered, q):
+    """Linear-interpolated percentile (q in 0..100) of a sorted, non-empty list."""
+    position = (len(ordered) - 1) * q / 100
+    low = math.floor(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+class PythonBackend:
+    name = "python"
+
+    def group_sum(self, keys, values, size):
+        """Sum values per integer key in range(size)."""
+        sums = [0.0] * size
+        for key, value in zip(keys, values):
+            sums[key] += value
+        return sums
+
+    def linear_fit(self, ys):
+        """Least-squares (slope, intercept) of ys against 0..n-1."""
+        n = len(ys)
+        if n == 0:
+            return 0.0, 0.0
+        if n == 1:
+            return 0.0, float(ys[0])
+        mean_x = (n - 1) / 2
+        mean_y = math.fsum(ys) / n
+        sxx = n * (n * n - 1) / 12
+        sxy = math.fsum((i - mean_x) * (y - mean_y) for i, y in enumerate(ys))
+        slope = sxy / sxx
+        return slope, mean_y - slope * mean_x
+
+    def split_date_keys(self, keys):
+        """(ordinals, rows) of store.date_index keys (ordinal << 32 | row)."""
+        return [key >> 32 for key in keys], [key & 0xFFFFFFFF for key in keys]
+
+    def take(self, values, indexes):
+        """values[i] for each i in indexes."""
+        return list(map(values.__getitem__, indexes))
+
+    def period_of(self, ordinals, period):
+        """Month, quarter or year number of each date ordinal (month numbers as in store.month_of)."""
+        months = PERIOD_MONTHS[period]
+        cache = {}
+        out = []
+        for ordinal in ordinals:
+            number = cache.get(ordinal)
+            if number is None:
+                number = cache[ordinal] = month_of(ordinal) // months
+            out.append(number)
+        return out
+
+    def group_stats(self, columns, values, percentiles=()):
+        """Count, sum and percentiles of values grouped by the key columns.
+
+        Returns {key tuple: (count, sum, [percentile, ...])}; the columns are
+        non-negative integers, one key part each.
+        """
+        groups = {}
+        for key, value in zip(zip(*columns), values):
+            group = groups.get(key)
+            if group is None:
+                groups[key] = [value]
+            else:
+                group.append(value)
+        stats = {}
+        for key, group in groups.items():
+            group.sort()
+            stats[key] = (len(group), math.fsum(group), [_interpolate(group, q) for q in percentiles])
+        return stats
+
+    def bucket_matrix(self, buckets, groups, values, width, height):
+        """Sum values into a height x width matrix indexed [group][bucket]."""
+        flat = self.group_sum([group * width + bucket for bucket, group in zip(buckets, groups)],
+                              values, width * height)
+        return [flat[row * width:(row + 1) * width] for row in range(height)]
+
+    def project(self, matrix, method, horizon, window, season):
+        """Project each row of matrix horizon steps ahead; returns a list of lists.
+
+        moving_average repeats the mean of the last window values, linear_trend
+        extends a least-squares line through the whole row, and seasonal_naive
+        repeats the value from one season earlier. Projections never go below zero.
+        """
+        out = []
+        for series in matrix:
+            n = len(series)
+            if method == "moving_average":
+                recent = series[-window:]
+                level = math.fsum(recent) / len(recent) if recent else 0.0
+                values = [level] * horizon
+            elif method == "linear_trend":
+                slope, intercept = self.linear_fit(series)
+                values = [intercept + slope * (n + step) for step in range(horizon)]
+            elif method == "seasonal_naive":
+                if n >= season:
+                    values = [series[n - season + step % season] for step in range(horizon)]
+                else:
+                    values = [series[-1] if n else 0.0] * horizon
+            else:
+                raise ValueError(f"Unknown forecast method: {method}")
+            out.append([max(value, 0.0) for value in values])
+        return out
+
+
+class NumpyBackend(PythonBackend):
+    name = "numpy"
+
+    def __init__(self):
+        import numpy
+        self.np = numpy
+
+    def _array(self, values, dtype=float):
+        # Store columns are array.array objects, or memoryviews of a mapped snapshot,
+        # which NumPy can wrap without copying
+        if hasattr(values, "typecode"):
+            return self.np.frombuffer(values, dtype=values.typecode)
+        if isinstance(values, memoryview):
+            return self.np.frombuffer(values, dtype=values.format)
+        return self.np.asarray(values, dtype=dtype)
+
+    def group_sum(self, keys, values, size):
+        return self.np.bincount(self._array(keys, int), weights=self._array(values),
+                                minlength=size).tolist()
+
+    def linear_fit(self, ys):
+        if len(ys) < 2:
+            return super().linear_fit(ys)
+        slope, intercept = self.np.polyfit(self.np.arange(len(ys)), self.np.asarray(ys, dtype=float), 1)
+        return float(slope), float(intercept)
+
+    def split_date_keys(self, keys):
+        keys = self._array(keys, self.np.int64)
+        return keys >> 32, keys & 0xFFFFFFFF
+
+    def take(self, values, indexes):
+        return self._array(values)[self._array(indexes, self.np.int64)]
+
+    def period_of(self, ordinals, period):
+        np = self.np
+        # Ordinal 719163 is 1970-01-01, day 0 of datetime64
+        days = (self._array(ordinals, np.int64) - Date(1970, 1, 1).toordinal()).astype("datetime64[D]")
+        months = days.astype("datetime64[M]").astype(np.int64) + 1970 * 12
+        return months // PERIOD_MONTHS[period]
+
+    def group_stats(self, columns, values, percentiles=()):
+        # One int64 key per row, sorted with the values so each group is a
+        # contiguous, ordered run; percentiles then index straight into it
+        np = self.np
+        columns = [self._array(column, np.int64) for column in columns]
+        values = self._array(values)
+        if not len(values):
+            return {}
+        sizes = [int(column.max()) + 1 for column in columns]
+        keys = np.zeros(len(values), dtype=np.int64)
+        for column, size in zip(columns, sizes):
+            keys = keys * size + column
+        order = np.lexsort((values, keys))
+        keys, values = keys[order], values[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        counts = np.diff(np.r_[starts, len(keys)])
+        sums = np.add.reduceat(values, starts)
+        quantiles = []
+        for q in percentiles:
+            position = (counts - 1) * (q / 100)
+            low = np.floor(position).astype(np.int64)
+            high = np.minimum(low + 1, counts - 1)
+            quantiles.append(values[starts + low] + (values[starts + high] - values[starts + low]) * (position - low))
+        parts = []
+        remaining = keys[starts]
+        for size in reversed(sizes):
+            remaining, part = np.divmod(remaining, size)
+            parts.append(part.tolist())
+        parts.reverse()
+        quantiles = [column.tolist() for column in quantiles]
+        return {key: (count, total, [column[i] for column in quantiles])
+                for i, (key, count, total) in enumerate(zip(zip(*parts), counts.tolist(), sums.tolist()))}
+
+    def bucket_matrix(self, buckets, groups, values, width, height):
+        np = self.np
+        keys = np.asarray(groups, dtype=np.int64) * width + np.asarray(buckets, dtype=np.int64)
+        flat = np.bincount(keys, weights=np.asarray(values, dtype=float), minlength=width * height)
+        return flat.reshape(height, width)
+
+    def project(self, matrix, method, horizon, window, season):
+        # Every row is projected at once with whole-matrix operations
+        np = self.np
+        matrix = np.asarray(matrix, dtype=float)
+        rows, n = matrix.shape
+        steps = np.arange(horizon)
+        if n == 0:
+            values = np.zeros((rows, horizon))
+        elif method == "moving_average":
+            values = np.repeat(matrix[:, -window:].mean(axis=1)[:, None], horizon, axis=1)
+        elif method == "linear_trend":
+            if n < 2:
+                values = np.repeat(matrix[:, -1:], horizon, axis=1)
+            else:
+                x = np.arange(n) - (n - 1) / 2
+                slope = (matrix - matrix.mean(axis=1, keepdims=True)) @ x / (x @ x)
+                intercept = matrix.mean(axis=1) - slope * (n - 1) / 2
+                values = intercept[:, None] + slope[:, None] * (n + steps)[None, :]
+        elif method == "seasonal_naive":
+            if n >= season:
+                values = matrix[:, n - season + steps % season]
+            else:
+                values = np.repeat(matrix[:, -1:], horizon, axis=1)
+        else:
+            raise ValueError(f"Unknown forecast method: {method}")
+        return np.maximum(values, 0.0).tolist()
+
+
+class PandasBackend(NumpyBackend):
+    name = "pandas"
+
+    def __init__(self):
+        super().__init__()
+        import pandas
+        self.pd = pandas
+
+    def frame(self, store):
+        """All expenses as a DataFrame with categorical use/category columns."""
+        pd = self.pd
+        np = self.np
+        rows = np.frombuffer(store.order, dtype=np.int32)
+        return pd.DataFrame({
+            "date": [store.decode_date(store.dates[row]) for row in store.order],
+            "description": [store.descriptions[row] for row in store.order],
+            "amount": np.frombuffer(store.amounts, dtype=np.float64)[rows],
+            "use": pd.Categorical.from_codes(np.frombuffer(store.uses, dtype=np.uint16)[rows],
+                                             store.use_table.values),
+            "category": pd.Categorical.from_codes(np.frombuffer(store.categories, dtype=np.uint32)[rows],
+                                                  store.category_table.values),
+        })
+
+
+_BACKENDS = {"python": PythonBackend, "numpy": NumpyBackend, "pandas": PandasBackend}
+
+
+def get_backend(name=None):
+    """Return the shared backend called name, importing its libraries on first use."""
+    name = name or os.environ.get("BUDGET_ANALYTICS", "python")
+    if name == "auto":
+        name = "numpy" if importlib.util.find_spec("numpy") else "python"
+    backend = _backends.get(name)
+    if backend is None:
+        try:
+            backend = _backends[name] = _BACKENDS[name]()
+        except KeyError:
+            raise ValueError(f"Unknown analytics backend: {name}") from None
+    return backend
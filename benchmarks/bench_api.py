@@ -0,0 +1,223 @@
+#Load test for the API server (server.py): many concurrent keep-alive clients
+#sending a mix of reads and writes for a fixed time, reporting requests per
+#second and latency percentiles per kind of request.
+#
+#By default a server is started in a subprocess on a free port, on a fresh file
+#of synthetic expenses; --url points the clients at a running server instead.
+#Usage: python benchmarks/bench_api.py [--rows 100000] [--clients 50] [--seconds 10]
+#                                      [--writes 0.2] [--url http://127.0.0.1:8765]
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+from synthetic import CATEGORIES, USES, generate_rows
+from budget import BudgetTracker
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Client:
+    """One keep-alive HTTP/1.1 connection."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method, path, payload=None):
+        body = b"" if payload is None else json.dumps(payload).encode()
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                          f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        data = await self.reader.readexactly(length) if length else b""
+        return status, json.loads(data) if data else None
+
+    def close(self):
+        self.writer.close()
+
+
+class IdPool:
+    """Ids of the expenses that exist, with O(1) random choice and removal."""
+
+    def __init__(self, ids):
+        self.ids = list(ids)
+        self.positions = {expense_id: n for n, expense_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, expense_id):
+        self.positions[expense_id] = len(self.ids)
+        self.ids.append(expense_id)
+
+    def remove(self, expense_id):
+        position = self.positions.pop(expense_id, None)
+        if position is None:
+            return
+        last = self.ids.pop()
+        if last != expense_id:
+            self.ids[position] = last
+            self.positions[last] = position
+
+    def choice(self, rng):
+        return rng.choice(self.ids) if self.ids else 1
+
+
+def new_expense(rng):
+    return {"date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "description": f"load test {rng.randint(0, 10 ** 6)}",
+            "amount": round(rng.uniform(1, 200), 2),
+            "use": rng.choice(USES), "category": rng.choice(CATEGORIES)}
+
+
+async def worker(client, rng, ids, writes, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        if rng.random() < writes:
+            kind = rng.choice(("add", "edit", "remove")) if ids else "add"
+        else:
+            kind = rng.choice(("totals", "list", "get", "month"))
+        expense_id = ids.choice(rng)
+        if kind == "add":
+            request = ("POST", "/expenses", new_expense(rng))
+        elif kind == "edit":
+            request = ("PATCH", f"/expenses/{expense_id}", {"amount": round(rng.uniform(1, 200), 2)})
+        elif kind == "remove":
+            request = ("DELETE", f"/expenses/{expense_id}", None)
+        elif kind == "totals":
+            request = ("GET", "/totals", None)
+        elif kind == "list":
+            request = ("GET", f"/expenses?offset={rng.randint(0, max(len(ids) - 20, 0))}&limit=20", None)
+        elif kind == "get":
+            request = ("GET", f"/expenses/{expense_id}", None)
+        else:
+            request = ("GET", f"/totals?start=2024-{rng.randint(1, 12):02d}-01&end=2024-12-31", None)
+        start = time.perf_counter()
+        status, payload = await client.request(*request)
+        latencies.setdefault(kind, []).append(time.perf_counter() - start)
+        if kind == "add" and status == 201:
+            for new_id in payload["ids"]:
+                ids.add(new_id)
+        elif kind == "remove" and status == 204:
+            ids.remove(expense_id)
+        elif status >= 400 and not (status == 404 and kind in ("edit", "remove", "get")):
+            # 404s are races between clients removing the same expense
+            errors.append((kind, status, payload))
+
+
+async def run(host, port, clients, seconds, writes, ids, seed=1234):
+    connections = [Client(host, port) for _ in range(clients)]
+    await asyncio.gather(*(client.connect() for client in connections))
+    latencies, errors = {}, []
+    start = time.perf_counter()
+    deadline = start + seconds
+    await asyncio.gather(*(worker(client, random.Random(seed + n), ids, writes, deadline, latencies, errors)
+                           for n, client in enumerate(connections)))
+    elapsed = time.perf_counter() - start
+    status, saved = await connections[0].request("POST", "/save")
+    for client in connections:
+        client.close()
+    return latencies, errors, elapsed, saved
+
+
+def percentile(values, q):
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def report(latencies, elapsed):
+    everything = sorted(value for values in latencies.values() for value in values)
+    print(f"{len(everything)} requests in {elapsed:.1f} s: {len(everything) / elapsed:,.0f} requests/s")
+    print(f"{'request':<10}{'count':>9}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for kind, values in sorted(latencies.items()) + [("all", everything)]:
+        values = sorted(values)
+        print(f"{kind:<10}{len(values):>9}{percentile(values, 0.5) * 1e3:>10.2f}"
+              f"{percentile(values, 0.9) * 1e3:>10.2f}{percentile(values, 0.99) * 1e3:>10.2f}"
+              f"{values[-1] * 1e3:>10.2f}")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(rows, directory):
+    """Save rows synthetic expenses in directory and serve them; returns (process, port, ids)."""
+    expenses_file = os.path.join(directory, "expenses.json")
+    budget_file = os.path.join(directory, "budget.json")
+    tracker = BudgetTracker()
+    tracker.add_expenses(generate_rows(rows))
+    tracker.set_budget(tracker.total_expenses())
+    tracker.save_expenses(expenses_file)
+    tracker.save_budget(budget_file)
+    ids = IdPool(tracker.expenses.ids)
+    tracker.close()
+    port = free_port()
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "server.py"), "--port", str(port),
+                                "--expenses", expenses_file, "--budget", budget_file,
+                                "--log-level", "WARNING"])
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process, port, ids
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise SystemExit("The server did not start")
+            time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the budget API server")
+    parser.add_argument("--rows", type=int, default=100_000, help="expenses the server starts with")
+    parser.add_argument("--clients", type=int, default=50, help="concurrent connections")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--writes", type=float, default=0.2, help="fraction of requests that write")
+    parser.add_argument("--url", help="test a running server instead of starting one")
+    args = parser.parse_args()
+
+    process = None
+    if args.url:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port
+        ids = IdPool([])
+    else:
+        directory = tempfile.mkdtemp()
+        process, port, ids = start_server(args.rows, directory)
+        host = "127.0.0.1"
+    try:
+        latencies, errors, elapsed, saved = asyncio.run(
+            run(host, port, args.clients, args.seconds, args.writes, ids))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    print(f"{args.clients} clients, {args.writes:.0%} writes, {len(ids)} expenses at the end")
+    report(latencies, elapsed)
+    print(f"final save: {saved}")
+    if errors:
+        print(f"{len(errors)} failed requests, e.g. {errors[0]}")
+
+
+if __name__ == "__main__":
+    main()
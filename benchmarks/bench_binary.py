@@ -0,0 +1,117 @@
+#Binary .bin snapshots vs JSON: checks that both round-trip the same expenses,
+#then compares file size, save time, load time and the first totals and date
+#range queries after loading. A loaded binary snapshot answers those straight
+#off the mapped file; the journal and compaction are exercised as well.
+#Usage: python benchmarks/bench_binary.py [rows]
+
+import contextlib
+import io
+import math
+import os
+import sys
+import tempfile
+import time
+
+from synthetic import generate_rows
+from budget import BudgetTracker, Expense
+from journal import Journal
+
+
+def timed(action):
+    start = time.perf_counter()
+    result = action()
+    return result, time.perf_counter() - start
+
+
+def load(filename):
+    tracker = BudgetTracker()
+    tracker.load_expenses(filename)
+    return tracker
+
+
+def check_same(expected, actual, what):
+    if list(expected.expenses.records()) != list(actual.expenses.records()):
+        raise AssertionError(f"{what}: the expenses differ")
+    if expected.expenses.next_id != actual.expenses.next_id:
+        raise AssertionError(f"{what}: next_id differs")
+    # Binary snapshots keep the writer's running totals, so allow for rounding
+    pairs = [(expected.total_expenses(), actual.total_expenses())]
+    for name in ("monthly_totals", "weekly_totals", "total_expenses_by_categories"):
+        mine, theirs = getattr(expected, name)(), getattr(actual, name)()
+        if mine.keys() != theirs.keys():
+            raise AssertionError(f"{what}: {name} keys differ")
+        pairs += [(mine[key], theirs[key]) for key in mine]
+    if not all(math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6) for a, b in pairs):
+        raise AssertionError(f"{what}: totals differ")
+    actual.expenses.check_totals()
+
+
+def round_trip(directory):
+    """Odd dates, unicode, removals and journal replay must come back as from JSON."""
+    tracker = BudgetTracker()
+    tracker.add_expenses(generate_rows(5000))
+    tracker.add_expenses([("not a date", "café ☃ \U0001F600", 1.25, "Joint", "Gifts"),
+                          ("2024-02-29", "", 0.0, "Personal", ""),
+                          ("", "empty date", -3.5, "personal", "Dining")])
+    for index in range(0, 600, 3):
+        tracker.remove_expense(index)
+    json_file = os.path.join(directory, "round-trip.json")
+    bin_file = os.path.join(directory, "round-trip.bin")
+    tracker.save_expenses(json_file)
+    tracker.save_expenses(bin_file)
+    check_same(load(json_file), load(bin_file), "snapshot")
+
+    # Changes go to the journal, and compaction writes a fresh binary snapshot
+    reloaded = load(bin_file)
+    threshold, Journal.compact_threshold = Journal.compact_threshold, 50
+    try:
+        for i in range(120):
+            if i % 3 == 0:
+                reloaded.add_expense(Expense("2024-03-01", f"added {i}", 2.5, "Joint", "Rent"))
+            elif i % 3 == 1:
+                reloaded.edit_expense(i, "2023-12-31", f"edited {i}", 4.0, "Personal", "Travel")
+            else:
+                reloaded.remove_expense(i)
+            reloaded.save_expenses(bin_file)
+    finally:
+        Journal.compact_threshold = threshold
+    reloaded.close()
+    reloaded.save_expenses(json_file)
+    reloaded.close()
+    check_same(load(json_file), load(bin_file), "journal")
+    print("round trip: binary matches JSON (snapshot, journal and compaction)")
+
+
+def compare(count, directory):
+    tracker = BudgetTracker()
+    tracker.add_expenses(generate_rows(count))
+    print(f"{count} rows")
+    results = {}
+    for name in ("json", "jsonl", "bin"):
+        filename = os.path.join(directory, f"expenses-{count}.{name}")
+        _, save = timed(lambda: tracker.save_expenses(filename))
+        tracker.close()
+        loaded, load_time = timed(lambda: load(filename))
+        _, totals = timed(lambda: (loaded.total_expenses(), loaded.total_expenses_by_categories(),
+                                   loaded.monthly_totals()))
+        _, scan = timed(lambda: loaded.total_between("2018-03-14", "2021-09-02"))
+        loaded.close()
+        del loaded
+        results[name] = os.path.getsize(filename)
+        print(f"  {name:>5}: {results[name] / 2**20:7.1f} MiB  save {save:6.2f} s  load {load_time:6.2f} s  "
+              f"totals {totals * 1e3:6.2f} ms  range {scan * 1e3:6.2f} ms")
+    print(f"  bin is {results['json'] / results['bin']:.1f}x smaller than json")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with tempfile.TemporaryDirectory() as directory:
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            round_trip(directory)
+            compare(count, directory)
+        print("\n".join(line for line in out.getvalue().splitlines()
+                        if line.startswith(" ") or line.endswith("rows") or line.startswith("round")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#GUI chart series cost: the per-day totals of charts.DailySpend against
+#recounting every expense, at 1M expenses. Checks first that the incremental
+#totals match a recount after adds, edits, removes and an extend, and that the
+#downsampled series keep their ends and extremes. Then times building the
+#totals once, an add, edit and remove with the chart listening, deriving the
+#cumulative series and cutting it to one point per pixel. With a display it
+#also times a full redraw of the chart canvas.
+#Usage: python benchmarks/bench_charts.py [rows]
+
+import math
+import random
+import sys
+import time
+
+from synthetic import generate_rows
+from budget import BudgetTracker, Expense
+from charts import ChartPanel, DailySpend, lttb, minmax
+from store import date_to_ordinal
+
+WIDTH = 400
+
+
+def timed(action, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = action()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def recount(store):
+    totals = {}
+    for row in store.order:
+        day = store.dates[row]
+        if day > 0:
+            totals[day] = totals.get(day, 0.0) + store.amounts[row]
+    return totals
+
+
+def check_same(spend, store, what):
+    expected = recount(store)
+    if spend.totals.keys() != expected.keys():
+        raise AssertionError(f"{what}: days differ")
+    if not all(math.isclose(spend.totals[day], total, abs_tol=1e-6) for day, total in expected.items()):
+        raise AssertionError(f"{what}: totals differ")
+
+
+def check_incremental():
+    rng = random.Random(7)
+    tracker = BudgetTracker()
+    tracker.add_expenses(generate_rows(2000, days=200))
+    spend = DailySpend()
+    spend.attach(tracker.expenses)
+    for i in range(3000):
+        choice = rng.random()
+        day = f"2015-0{rng.randint(1, 9)}-{rng.randint(10, 28)}"
+        if choice < 0.4:
+            tracker.add_expense(Expense(rng.choice((day, "someday")), "x", rng.uniform(-5, 50), "Joint", "Rent"))
+        elif choice < 0.7:
+            tracker.edit_expense(rng.randrange(len(tracker.expenses)), rng.choice((day, "later")), "y",
+                                 rng.uniform(0, 80), "Personal", "Travel")
+        else:
+            tracker.remove_expense(rng.randrange(len(tracker.expenses)))
+    tracker.add_expenses(generate_rows(500, seed=9, days=300))
+    check_same(spend, tracker.expenses, "incremental")
+    days, cumulative = spend.series()
+    if not math.isclose(cumulative[-1], sum(recount(tracker.expenses).values()), abs_tol=1e-6):
+        raise AssertionError("cumulative series does not end at the total")
+
+    xs = list(range(10_000))
+    ys = [rng.gauss(0, 1) for _ in xs]
+    ys[1234], ys[8765] = 50.0, -50.0
+    for name, (sx, sy) in (("lttb", lttb(xs, ys, WIDTH)), ("minmax", minmax(xs, ys, WIDTH))):
+        limit = WIDTH if name == "lttb" else 4 * WIDTH
+        if len(sx) > limit or sx[0] != xs[0] or sx[-1] != xs[-1] or sx != sorted(sx):
+            raise AssertionError(f"{name}: wrong points")
+        if max(sy) != 50.0 or min(sy) != -50.0:
+            raise AssertionError(f"{name}: lost a spike")
+    print("checks: incremental day totals match a recount; downsampling keeps ends and spikes")
+
+
+def redraw(count, tracker):
+    import tkinter as tk
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        print("  redraw: skipped, no display")
+        return
+    canvas = tk.Canvas(root, width=440, height=600)
+    canvas.pack()
+    root.update()
+    panel = ChartPanel(canvas, tracker, {name: "black" for name in ("text", "subtext", "grid", "line", "budget", "bar")},
+                       ("TkDefaultFont", 9))
+    panel.attach(tracker.expenses)
+    root.update()
+
+    def change_and_draw():
+        tracker.add_expense(Expense("2020-06-01", "chart", 12.5, "Joint", "Rent"))
+        panel.request()
+        root.update()
+
+    _, draw = timed(change_and_draw, 20)
+    print(f"  add + redraw {draw * 1e3:8.2f} ms")
+    root.destroy()
+
+
+def compare(count):
+    tracker = BudgetTracker()
+    tracker.add_expenses(generate_rows(count))
+    store = tracker.expenses
+    print(f"{count} rows")
+    _, full = timed(lambda: recount(store))
+    print(f"  recount every expense  {full * 1e3:8.1f} ms")
+    spend = DailySpend()
+    _, build = timed(lambda: spend.attach(store))
+    print(f"  build day totals once  {build * 1e3:8.1f} ms")
+
+    ids = []
+
+    def add():
+        tracker.add_expense(Expense("2019-04-01", "chart", 10.0, "Joint", "Rent"))
+        ids.append(store.ids[store.order[-1]])
+
+    _, add_time = timed(add, 1000)
+    _, edit_time = timed(lambda: tracker.edit_expense_by_id(ids[0], "2019-04-02", "chart", 11.0, "Joint", "Rent"), 1000)
+    _, remove_time = timed(lambda: tracker.remove_expense_by_id(ids.pop()), 999)
+    print(f"  add / edit / remove    {add_time * 1e6:6.1f} / {edit_time * 1e6:.1f} / {remove_time * 1e6:.1f} us")
+    (days, cumulative), series = timed(spend.series)
+    _, cached = timed(spend.series, 1000)
+    _, line = timed(lambda: lttb(days, cumulative, WIDTH), 10)
+    _, envelope = timed(lambda: minmax(days, cumulative, WIDTH), 10)
+    print(f"  series {len(days)} days      {series * 1e3:8.2f} ms  (cached {cached * 1e6:.2f} us)")
+    print(f"  lttb / minmax to {WIDTH} px {line * 1e3:6.2f} / {envelope * 1e3:.2f} ms")
+    if spend.totals.get(date_to_ordinal("2019-04-02")) is None:
+        raise AssertionError("edit was not folded in")
+    redraw(count, tracker)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    check_incremental()
+    compare(count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#Date-range queries on the sorted date index vs a full scan comparing date strings.
+#Usage: python benchmarks/bench_dates.py [rows]
+
+import contextlib
+import io
+import sys
+import time
+
+from synthetic import generate_rows
+from budget import BudgetTracker
+from store import ExpenseStore
+
+QUERIES = (("1 month", "2020-03-01", "2020-03-31"),
+           ("1 year", "2019-07-15", "2020-07-14"),
+           ("5 years", "2016-02-10", "2021-02-09"))
+
+
+def best(fn, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rows = list(generate_rows(count))
+    store = ExpenseStore()
+    start = time.perf_counter()
+    for row in rows:
+        store.append(*row)
+    print(f"{count} rows, built store with date index in {time.perf_counter() - start:.2f} s")
+    tracker = BudgetTracker()
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracker.expenses = store
+
+    for name, first, last in QUERIES:
+        scan_total = best(lambda: sum(r[2] for r in rows if first <= r[0] <= last), 1)
+        index_total = best(lambda: tracker.total_between(first, last))
+        scan_rows = best(lambda: [r for r in rows if first <= r[0] <= last], 1)
+        index_rows = best(lambda: tracker.expenses_between(first, last))
+        print(f"{name:>8}: total_between {index_total * 1e3:8.3f} ms (scan {scan_total * 1e3:7.1f} ms)  "
+              f"expenses_between {index_rows * 1e3:8.3f} ms (scan {scan_rows * 1e3:7.1f} ms)")
+    print(f" monthly_totals {best(tracker.monthly_totals) * 1e3:.3f} ms, "
+          f"weekly_totals {best(tracker.weekly_totals) * 1e3:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
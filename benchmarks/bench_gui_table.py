@@ -0,0 +1,76 @@
+#Expense table redraw cost: the old full refresh (delete every item, insert
+#every row) against ExpenseTable, which only draws the viewport and applies
+#adds, edits and removes as diffs. Needs a display.
+#Usage: python benchmarks/bench_gui_table.py [rows ...]
+
+import sys
+import time
+import tkinter as tk
+from tkinter import ttk
+
+from synthetic import generate_rows
+from budget import BudgetTracker, Expense
+from expense_table import ExpenseTable
+
+COLUMNS = ("Date", "Description", "Amount", "Use", "Category")
+HEIGHT = 18
+
+
+def full_refresh(tree, tracker):
+    tree.delete(*tree.get_children())
+    for n, e in enumerate(tracker.expenses):
+        tree.insert("", "end", iid=n, tags=("odd" if n % 2 == 0 else "even",),
+                    values=(e.date, e.description, f"${e.amount:.2f}", e.use, e.category))
+
+
+def timed(root, action):
+    start = time.perf_counter()
+    action()
+    root.update_idletasks()
+    return (time.perf_counter() - start) * 1e3
+
+
+def run(root, count):
+    tracker = BudgetTracker()
+    store = tracker.expenses
+    for row in generate_rows(count):
+        store.append(*row)
+
+    tree = ttk.Treeview(root, columns=COLUMNS, show="headings", height=HEIGHT)
+    full = timed(root, lambda: full_refresh(tree, tracker))
+    mutate = timed(root, lambda: (tracker.edit_expense(count // 2, "2020-01-01", "coffee", 3.5,
+                                                       "Personal", "Dining"),
+                                  full_refresh(tree, tracker)))
+    tree.destroy()
+
+    tree = ttk.Treeview(root, columns=COLUMNS, show="headings", height=HEIGHT)
+    scrollbar = ttk.Scrollbar(root)
+    view = ExpenseTable(tree, scrollbar, tracker, HEIGHT)
+    initial = timed(root, lambda: view.attach(store))
+    edit = timed(root, lambda: tracker.edit_expense(0, "2020-01-01", "tea", 2.5, "Personal", "Dining"))
+    add = timed(root, lambda: tracker.add_expense(Expense("2030-01-01", "tea", 2.5, "Personal", "Dining")))
+    remove = timed(root, lambda: tracker.remove_expense(0))
+    page = timed(root, lambda: view.scroll(1, "pages"))
+    jump = timed(root, lambda: view.yview("moveto", "0.5"))
+    tree.destroy()
+    scrollbar.destroy()
+
+    print(f"{count:>8} rows  full refresh {full:8.1f} ms, after an edit {mutate:8.1f} ms")
+    print(f"{'':>8}       windowed     {initial:8.2f} ms, edit {edit:.2f} ms, add {add:.2f} ms, "
+          f"remove {remove:.2f} ms, page {page:.2f} ms, jump {jump:.2f} ms")
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        sys.exit(f"No display available: {e}")
+    root.withdraw()
+    for count in counts:
+        run(root, count)
+    root.destroy()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#Bulk import throughput: a bank-style CSV statement through import_statement
+#(serial and multi-process parsing), against parsing the same rows and calling
+#add_expense one at a time, plus the single save afterwards.
+#Usage: python benchmarks/bench_import.py [rows]
+
+import contextlib
+import csv
+import io
+import os
+import sys
+import tempfile
+import time
+
+from synthetic import generate_rows
+from budget import BudgetTracker, Expense
+from importer import import_statement
+
+BASELINE_ROWS = 100_000
+
+
+def write_statement(path, count):
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(("Date", "Description", "Amount"))
+        for date, description, amount, _, _ in generate_rows(count):
+            writer.writerow((date, description, f"{-amount:.2f}"))
+
+
+def timed(action):
+    start = time.perf_counter()
+    result = action()
+    return time.perf_counter() - start, result
+
+
+def one_by_one(path, limit):
+    tracker = BudgetTracker()
+    with open(path, newline="") as file:
+        reader = csv.reader(file)
+        next(reader)
+        for _, (date, description, amount) in zip(range(limit), reader):
+            tracker.add_expense(Expense(date, description, -float(amount), "Personal", "Imported"))
+    return tracker
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "statement.csv")
+        write_statement(path, count)
+        print(f"{count} rows, {os.path.getsize(path) / 2**20:.0f} MiB CSV, {os.cpu_count()} CPUs")
+
+        baseline = min(count, BASELINE_ROWS)
+        elapsed, _ = timed(lambda: one_by_one(path, baseline))
+        print(f"  add_expense per row:  {elapsed / baseline * 1e6:6.2f} us/row "
+              f"(~{elapsed / baseline * count:.1f} s for all rows)")
+
+        for processes in sorted({1, os.cpu_count() or 1}):
+            tracker = BudgetTracker()
+            elapsed, report = timed(lambda: import_statement(tracker, path, processes=processes))
+            print(f"  import, {processes} process(es): {elapsed:6.2f} s "
+                  f"({report.added / elapsed:,.0f} rows/s, {report.added} added)")
+        again, report = timed(lambda: import_statement(tracker, path))
+        print(f"  re-import (all duplicates): {again:6.2f} s, {report.duplicates} skipped")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            saved, _ = timed(lambda: tracker.save_expenses(os.path.join(directory, "expenses.json")))
+        tracker.close()
+        print(f"  single save afterwards: {saved:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
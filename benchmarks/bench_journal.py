@@ -0,0 +1,70 @@
+#Per-mutation save latency with the journal vs rewriting the whole expenses.json.
+#Usage: python benchmarks/bench_journal.py [sizes...]
+
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from synthetic import generate_rows
+from budget import BudgetTracker, Expense
+from store import ExpenseStore
+
+MUTATIONS = 200
+
+
+def build_store(count):
+    store = ExpenseStore()
+    for row in generate_rows(count):
+        store.append(*row)
+    return store
+
+
+def bench(count, directory):
+    path = os.path.join(directory, f"expenses-{count}.json")
+    tracker = BudgetTracker()
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracker.expenses = build_store(count)
+        start = time.perf_counter()
+        tracker.save_expenses(path)
+        full = time.perf_counter() - start
+
+        latencies = []
+        for i in range(MUTATIONS):
+            start = time.perf_counter()
+            if i % 3 == 0:
+                tracker.add_expense(Expense("2024-06-01", "bench", 9.99, "Personal", "Dining"))
+            elif i % 3 == 1:
+                tracker.edit_expense(i, "2024-06-02", "bench edit", 5.0, "Joint", "Rent")
+            else:
+                tracker.remove_expense(i)
+            tracker.save_expenses(path)
+            latencies.append(time.perf_counter() - start)
+        tracker.close()
+
+        # What every save used to cost: re-serialising the whole list
+        start = time.perf_counter()
+        with open(path + ".legacy", "w") as file:
+            json.dump(list(tracker.expenses.records()), file)
+        legacy = time.perf_counter() - start
+
+    latencies.sort()
+    p50 = statistics.median(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{count:>9} rows: journal save p50 {p50 * 1e3:7.3f} ms  p99 {p99 * 1e3:7.3f} ms  | "
+          f"full snapshot {full * 1e3:9.1f} ms  legacy rewrite {legacy * 1e3:9.1f} ms")
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000, 1_000_000]
+    with tempfile.TemporaryDirectory() as directory:
+        for count in sizes:
+            bench(count, directory)
+
+
+if __name__ == "__main__":
+    main()
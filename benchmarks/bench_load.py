@@ -0,0 +1,77 @@
+#Time-to-first-row, total load time and peak memory: the original json.load
+#loader vs the chunked streaming loader (legacy array and JSON Lines files).
+#Usage: python benchmarks/bench_load.py [rows]
+
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from synthetic import generate_rows
+from bench_memory import LegacyExpense
+from budget import BudgetTracker
+from store import ExpenseStore
+
+
+def legacy_load(filename):
+    # The loader this replaced: parse everything, then build every Expense
+    with open(filename, "r") as file:
+        data = json.load(file)
+    expenses = [LegacyExpense(e["date"], e["description"], e["amount"], e["use"], e["category"])
+                for e in data]
+    yield len(expenses)
+
+
+def streaming_load(filename):
+    tracker = BudgetTracker()
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield from tracker.iter_load_expenses(filename)
+
+
+def timed(loader, filename):
+    start = time.perf_counter()
+    first = None
+    for _ in loader(filename):
+        if first is None:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+def peak(loader, filename):
+    tracemalloc.start()
+    for _ in loader(filename):
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    store = ExpenseStore()
+    for row in generate_rows(count):
+        store.append(*row)
+    with tempfile.TemporaryDirectory() as directory:
+        array_file = os.path.join(directory, "expenses.json")
+        lines_file = os.path.join(directory, "expenses.jsonl")
+        tracker = BudgetTracker()
+        with contextlib.redirect_stdout(io.StringIO()):
+            tracker.expenses = store
+            tracker.save_expenses(array_file)
+            tracker.save_expenses(lines_file)
+        del tracker, store
+        print(f"{count} rows")
+        for name, loader, filename in (("json.load (old)", legacy_load, array_file),
+                                       ("streaming .json", streaming_load, array_file),
+                                       ("streaming .jsonl", streaming_load, lines_file)):
+            first, total = timed(loader, filename)
+            print(f"{name:>17}: first rows {first * 1e3:8.1f} ms  total {total:6.2f} s  "
+                  f"peak {peak(loader, filename) / 2**20:7.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#Memory per expense row: baseline list of Expense objects vs the columnar ExpenseStore.
+#Usage: python benchmarks/bench_memory.py [rows]
+
+import sys
+import tracemalloc
+
+from synthetic import generate_rows
+from store import ExpenseStore
+
+
+class LegacyExpense:
+    # The pre-columnar Expense: a plain object with a per-instance __dict__
+    def __init__(self, date, description, amount, use, category):
+        self.date = date
+        self.description = description
+        self.amount = amount
+        self.use = use
+        self.category = category
+
+
+def measure(build, rows):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    container = build(rows)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return container, after - before
+
+
+def build_legacy(rows):
+    return [LegacyExpense(*row) for row in rows]
+
+
+def build_store(rows):
+    store = ExpenseStore()
+    for row in rows:
+        store.append(*row)
+    return store
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    # Materialise the input first so both measurements share the same row strings
+    rows = list(generate_rows(count))
+    for name, build in (("list[Expense]", build_legacy), ("ExpenseStore", build_store)):
+        container, used = measure(build, rows)
+        print(f"{name:>14}: {used / 2**20:8.1f} MiB total, {used / count:6.1f} bytes/row")
+        del container
+
+
+if __name__ == "__main__":
+    main()
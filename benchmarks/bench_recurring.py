@@ -0,0 +1,76 @@
+#Recurring expenses kept as rules against the same occurrences stored as
+#expenses: checks that both give the same totals, then compares what they cost
+#to add, to save (file size) and to query. The rules answer totals, monthly and
+#weekly totals, a month's spending and date ranges by counting occurrences in
+#closed form, whatever the number of occurrences; the monthly and weekly totals
+#are then cached until the rules or the day change.
+#Usage: python benchmarks/bench_recurring.py [rules]
+
+import contextlib
+import io
+import math
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+from budget import BudgetTracker
+
+FREQUENCIES = (("daily", 1), ("weekly", 1), ("monthly", 1), ("daily", 3), ("yearly", 1))
+START = date(2015, 1, 1)
+
+
+def timed(action, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = action()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def queries(tracker):
+    return {"total": lambda: tracker.total_expenses(),
+            "by category": lambda: tracker.total_expenses_by_categories(),
+            "monthly totals": lambda: tracker.monthly_totals(),
+            "weekly totals": lambda: tracker.weekly_totals(),
+            "month spent": lambda: tracker.month_spent("2019-06", category="Bills"),
+            "range": lambda: tracker.total_between("2016-03-14", "2021-09-02")}
+
+
+def same(a, b):
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(same(a[key], b[key]) for key in a)
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    ruled, stored = BudgetTracker(), BudgetTracker()
+    with contextlib.redirect_stdout(io.StringIO()), tempfile.TemporaryDirectory() as directory:
+        _, add_rules = timed(lambda: [ruled.add_recurring(f"Bill {n}", 1 + n % 40, "Joint", "Bills", START,
+                                                          *FREQUENCIES[n % len(FREQUENCIES)])
+                                      for n in range(count)])
+        occurrences = list(ruled.recurring_expenses(START, date.today()))
+        added, add_rows = timed(lambda: stored.add_expenses(occurrences))
+        budget_file = os.path.join(directory, "budget.json")
+        expenses_file = os.path.join(directory, "expenses.json")
+        ruled.save_budget(budget_file)
+        stored.save_expenses(expenses_file)
+        sizes = os.path.getsize(budget_file), os.path.getsize(expenses_file)
+        stored.close()
+        ruled.close()
+
+    print(f"{count} rules, {added} occurrences up to today")
+    print(f"  add:  rules {add_rules * 1e3:8.2f} ms   stored {add_rows * 1e3:8.2f} ms")
+    print(f"  file: rules {sizes[0] / 1024:8.1f} KiB  stored {sizes[1] / 1024:8.1f} KiB")
+    for name, (ruled_query, stored_query) in zip(queries(ruled), zip(queries(ruled).values(),
+                                                                      queries(stored).values())):
+        ruled_result, ruled_time = timed(ruled_query, 5)
+        stored_result, stored_time = timed(stored_query, 5)
+        if not same(ruled_result, stored_result):
+            raise AssertionError(f"{name}: rules and stored expenses disagree")
+        print(f"  {name:>14}: rules {ruled_time * 1e3:8.2f} ms   stored {stored_time * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#Pivot report scaling: time reports.pivot on synthetic multi-million-row data
+#for each analytics backend, in one process and in process pools of growing
+#size, and check that every run gives the same report.
+#Usage: python benchmarks/bench_reports.py [rows] [--workers 1,2,4,8] [--period month]
+
+import argparse
+import importlib.util
+import os
+import time
+
+from synthetic import generate_rows
+from analytics import get_backend
+from reports import PERIODS, pivot
+from store import ExpenseStore
+
+
+def best(action, runs=3):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = action()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def same(a, b):
+    # The NumPy backend sums in a different order, so totals may differ in the last bits
+    return len(a.rows) == len(b.rows) and all(
+        x[:len(a.by) + 2] == y[:len(a.by) + 2] and
+        all(abs(p - q) <= 1e-6 * max(1.0, abs(p)) for p, q in zip(x[len(a.by) + 2:], y[len(a.by) + 2:]))
+        for x, y in zip(a.rows, b.rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pivot report engine")
+    parser.add_argument("rows", nargs="?", type=int, default=2_000_000)
+    parser.add_argument("--workers", default=None, help="comma-separated pool sizes (default: 1, 2, 4... up to the CPUs)")
+    parser.add_argument("--period", default="month", choices=PERIODS)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    if args.workers:
+        pools = [int(n) for n in args.workers.split(",")]
+    else:
+        pools = [1]
+        while pools[-1] * 2 <= max(cpus, 2):
+            pools.append(pools[-1] * 2)
+    backends = ["python"] + (["numpy"] if importlib.util.find_spec("numpy") else [])
+
+    store = ExpenseStore()
+    store.extend(generate_rows(args.rows, days=365 * 30))
+    print(f"{args.rows} rows, {args.period} x category x use, {cpus} CPUs")
+    reference = None
+    for name in backends:
+        backend = get_backend(name)
+        serial = None
+        for workers in pools:
+            elapsed, report = best(lambda: pivot(store, args.period, workers=workers, backend=backend), args.runs)
+            reference = reference or report
+            serial = serial or elapsed
+            check = "" if same(reference, report) else "  MISMATCH"
+            print(f"  {name:>6}, {workers:>2} worker{'s' if workers > 1 else ' '}: {elapsed:7.3f} s  "
+                  f"{args.rows / elapsed / 1e6:6.2f} M rows/s  speedup {serial / elapsed:5.2f}x  "
+                  f"{len(report.rows)} groups{check}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#Time the UI thread spends saving after each mutation: synchronous saves (what
+#save_all() used to do) vs queueing them on the SaveWorker, plus how many
+#writes a burst of edits is coalesced into.
+#Usage: python benchmarks/bench_save_worker.py [rows] [edits]
+
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from synthetic import generate_rows
+from budget import BudgetTracker, Expense
+from saver import SaveWorker
+
+
+def make_tracker(count):
+    tracker = BudgetTracker()
+    for row in generate_rows(count):
+        tracker.expenses.append(*row)
+    tracker.save_expenses()
+    tracker.save_budget()
+    return tracker
+
+
+def edit(tracker, i):
+    tracker.add_expense(Expense("2030-01-01", f"burst {i}", 1.0, "Personal", "Dining"))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    edits = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    os.chdir(tempfile.mkdtemp())
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracker = make_tracker(count)
+        sync = []
+        for i in range(edits):
+            edit(tracker, i)
+            start = time.perf_counter()
+            tracker.save_expenses()
+            tracker.save_budget()
+            sync.append(time.perf_counter() - start)
+        tracker.close()
+
+        tracker = make_tracker(count)
+        worker = SaveWorker(tracker)
+        queued = []
+        for i in range(edits):
+            edit(tracker, i)
+            start = time.perf_counter()
+            worker.request()
+            queued.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        worker.flush()
+        flush = time.perf_counter() - start
+        worker.close()
+        stats = worker.stats()
+
+    print(f"{count} rows, {edits} edits in a burst")
+    print(f"  synchronous save: p50 {statistics.median(sync) * 1e3:.3f} ms, "
+          f"max {max(sync) * 1e3:.3f} ms on the UI thread, {edits} writes")
+    print(f"  save worker:      p50 {statistics.median(queued) * 1e3:.4f} ms, "
+          f"max {max(queued) * 1e3:.4f} ms on the UI thread, {stats['saves']} writes "
+          f"(save p50 {stats['p50_ms']:.2f} ms), final flush {flush * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#Filter-as-you-type latency (match count plus the first 500 rows, as the GUI
+#asks for) on the search index vs a substring scan of every row.
+#Usage: python benchmarks/bench_search.py [rows]
+
+import sys
+import time
+
+from synthetic import generate_rows
+from search import SearchIndex
+from store import ExpenseStore
+
+KEYSTROKES = ("c", "co", "cof", "coff", "coffee", "coffee s", "coffee sh", "coffee shop")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    store = ExpenseStore()
+    for row in generate_rows(count):
+        store.append(*row)
+    start = time.perf_counter()
+    index = SearchIndex(store)
+    print(f"{count} rows, index built in {time.perf_counter() - start:.2f} s, "
+          f"{len(index.tokens)} distinct tokens")
+
+    for query in KEYSTROKES:
+        start = time.perf_counter()
+        matches = index.match(query)
+        index.rows(query, 500)
+        indexed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        terms = query.lower().split()
+        scanned = [row for row in store.order
+                   if all(term in store.descriptions[row].lower()
+                          or term in store.category_table.values[store.categories[row]].lower()
+                          for term in terms)]
+        scan = time.perf_counter() - start
+        print(f"{query!r:>14}: index {indexed * 1e3:7.2f} ms  scan {scan * 1e3:7.1f} ms  "
+              f"{len(matches)} matches (substring scan {len(scanned)})")
+
+    # Typing after an edit: the prefix cache is dropped, the postings are not
+    store.append("2024-01-01", "coffee shop", 3.5, "Personal", "Dining")
+    start = time.perf_counter()
+    index.rows("coffee shop")
+    print(f"after an add: {(time.perf_counter() - start) * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
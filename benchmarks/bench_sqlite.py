@@ -0,0 +1,67 @@
+#JSON snapshot + journal vs the SQLite backend: full load time and per-mutation
+#save latency. Once loaded, both answer queries from the same in-memory store.
+#Usage: python benchmarks/bench_sqlite.py [sizes...]
+
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from synthetic import generate_rows
+from budget import BudgetTracker, Expense
+
+MUTATIONS = 200
+
+
+def timed(action):
+    start = time.perf_counter()
+    action()
+    return (time.perf_counter() - start) * 1e3
+
+
+def load(filename):
+    tracker = BudgetTracker()
+    tracker.load_expenses(filename)
+    return tracker
+
+
+def bench(count, directory):
+    json_file = os.path.join(directory, f"expenses-{count}.json")
+    db_file = os.path.join(directory, f"expenses-{count}.db")
+    tracker = BudgetTracker()
+    for row in generate_rows(count):
+        tracker.expenses.append(*row)
+    tracker.save_expenses(json_file)
+    tracker.save_expenses(db_file)
+    tracker.close()
+
+    print(f"{count} rows")
+    for name, filename in (("json", json_file), ("sqlite", db_file)):
+        load_ms = timed(lambda: load(filename).close())
+        tracker = load(filename)
+        saves = []
+        for i in range(MUTATIONS):
+            if i % 2:
+                tracker.edit_expense(i, "2024-01-01", "edited", 2.0, "Joint", "Rent")
+            else:
+                tracker.add_expense(Expense("2024-01-01", f"bench {i}", 1.0, "Personal", "Dining"))
+            saves.append(timed(lambda: tracker.save_expenses(filename)))
+        tracker.close()
+        print(f"  {name:>6}: load {load_ms:8.1f} ms, save after a mutation "
+              f"p50 {statistics.median(saves):.2f} ms / max {max(saves):.2f} ms")
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]
+    with tempfile.TemporaryDirectory() as directory:
+        for count in sizes:
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                bench(count, directory)
+            print("\n".join(line for line in out.getvalue().splitlines() if line.startswith(" ") or line.endswith("rows")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#Startup cost: `import budget` in a fresh interpreter, and time until the Tk window
+#of GUI.py is drawn and idle. The GUI part needs a display (e.g. run under xvfb-run).
+#Usage: python benchmarks/bench_startup.py [runs]
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = """
+import time
+start = time.perf_counter()
+import budget
+print(time.perf_counter() - start)
+"""
+
+# Replace mainloop with one update so the script returns once the window is ready
+GUI_PROBE = """
+import runpy, sys, time, tkinter
+start = time.perf_counter()
+def ready(self, n=0):
+    self.update()
+    print(time.perf_counter() - start)
+    self.destroy()
+tkinter.Tk.mainloop = ready
+sys.path.insert(0, {root!r})
+runpy.run_path({gui!r}, run_name="__main__")
+"""
+
+
+def run(code, cwd):
+    result = subprocess.run([sys.executable, "-c", code], cwd=cwd, capture_output=True,
+                            text=True, env=dict(os.environ, PYTHONPATH=ROOT))
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def report(name, code, runs, cwd):
+    try:
+        times = [run(code, cwd) for _ in range(runs)]
+    except RuntimeError as e:
+        print(f"{name:>14}: skipped ({e})")
+        return
+    print(f"{name:>14}: median {statistics.median(times) * 1e3:7.1f} ms  "
+          f"min {min(times) * 1e3:7.1f} ms over {runs} runs")
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    # Run in an empty directory so no saved expenses are loaded
+    with tempfile.TemporaryDirectory() as cwd:
+        report("import budget", IMPORT_PROBE, runs, cwd)
+        report("Tk window ready", GUI_PROBE.format(root=ROOT, gui=os.path.join(ROOT, "GUI.py")), runs, cwd)
+
+
+if __name__ == "__main__":
+    main()
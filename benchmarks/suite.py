@@ -0,0 +1,435 @@
+#Benchmark suite for the tracker core, persistence and the GUI table, with
+#machine-readable results so regressions show up between commits.
+#
+#Each case is timed on synthetic expenses (see synthetic.py) at 1k, 100k and 1M
+#rows by default. Results are written as JSON: one entry per case and size with
+#the median and best time per operation. --compare runs the suite and compares it
+#with an earlier result file, or compares two result files without running;
+#the exit status is 1 when a case got slower than --threshold allows.
+#
+#The GUI case drives GUI.refresh_table in a real Tk window, so it needs a display.
+#Without one it starts Xvfb if that is installed, and is skipped otherwise.
+#
+#Usage: python benchmarks/suite.py [--sizes 1k,100k,1m] [--cases add,save] [-o results.json]
+#       python benchmarks/suite.py --compare baseline.json [-o results.json]
+#       python benchmarks/suite.py --compare baseline.json results.json
+
+import argparse
+import atexit
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from synthetic import generate_rows
+from budget import BudgetTracker, Expense
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FORMAT = 1
+DEFAULT_SIZES = "1k,100k,1m"
+
+# A case is timed for at least min_runs runs and min_time seconds, but stops
+# after max_time seconds once it has one run, so the 1M-row saves stay bearable
+MIN_RUNS = 3
+MAX_RUNS = 1000
+MIN_TIME = 0.2
+MAX_TIME = 5.0
+
+CASES = {}
+
+
+def case(name):
+    """Register setup(size, directory) -> (run, ops, reset) as a benchmark case.
+
+    run() is timed and performs ops operations; reset(), if not None, runs
+    untimed after every run to put the state back.
+    """
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+_rows = {}
+# Trackers made for the current case; closed before its directory is removed
+_trackers = []
+
+
+def rows(size):
+    if size not in _rows:
+        _rows.clear()
+        _rows[size] = list(generate_rows(size))
+    return _rows[size]
+
+
+def tracker_with(size):
+    tracker = BudgetTracker()
+    _trackers.append(tracker)
+    tracker.add_expenses(rows(size))
+    tracker.set_budget(tracker.total_expenses() / 2)
+    return tracker
+
+
+def sample(size, count, seed=99):
+    rng = random.Random(seed)
+    data = rows(size)
+    return [data[rng.randrange(len(data))] for _ in range(count)]
+
+
+# --- tracker core ---
+
+@case("add_expense")
+def _add_expense(size, directory):
+    tracker = tracker_with(size)
+    new = sample(size, 1000)
+
+    def run():
+        for row in new:
+            tracker.add_expense(Expense(*row))
+
+    def reset():
+        for index in range(len(tracker.expenses) - 1, size - 1, -1):
+            tracker.remove_expense(index)
+    return run, len(new), reset
+
+
+@case("edit_expense")
+def _edit_expense(size, directory):
+    tracker = tracker_with(size)
+    rng = random.Random(7)
+    edits = [(rng.randrange(size), row) for row in sample(size, min(1000, size))]
+
+    def run():
+        for index, row in edits:
+            tracker.edit_expense(index, *row)
+    return run, len(edits), None
+
+
+@case("remove_expense")
+def _remove_expense(size, directory):
+    tracker = tracker_with(size)
+    rng = random.Random(7)
+    count = min(1000, size // 2)
+    indexes = [rng.randrange(size - count) for _ in range(count)]
+
+    def run():
+        for index in indexes:
+            tracker.remove_expense(index)
+
+    def reset():
+        tracker.add_expenses(sample(size, count))
+    return run, count, reset
+
+
+def _query(name, call, ops=100):
+    @case(name)
+    def setup(size, directory):
+        tracker = tracker_with(size)
+
+        def run():
+            for _ in range(ops):
+                call(tracker)
+        return run, ops, None
+    return setup
+
+
+_query("total_expenses", BudgetTracker.total_expenses)
+_query("total_expenses_by_use", lambda tracker: tracker.total_expenses_by_use("Personal"))
+_query("total_expenses_by_uses", BudgetTracker.total_expenses_by_uses)
+_query("total_expenses_by_categories", BudgetTracker.total_expenses_by_categories)
+_query("check_budget", BudgetTracker.check_budget)
+
+
+@case("view_expenses")
+def _view_expenses(size, directory):
+    tracker = tracker_with(size)
+    return tracker.view_expenses, 1, None
+
+
+# --- persistence ---
+
+def _save_full(extension):
+    def setup(size, directory):
+        tracker = tracker_with(size)
+        # Alternating between two files makes every save a full snapshot
+        files = [os.path.join(directory, name + extension) for name in ("a", "b")]
+
+        def run():
+            tracker.save_expenses(files[0])
+
+        def reset():
+            files.reverse()
+        return run, 1, reset
+    return setup
+
+
+def _save_change(extension):
+    def setup(size, directory):
+        tracker = tracker_with(size)
+        filename = os.path.join(directory, "expenses" + extension)
+        tracker.save_expenses(filename)
+        rng = random.Random(3)
+
+        def run():
+            tracker.save_expenses(filename)
+
+        def reset():
+            tracker.edit_expense(rng.randrange(size), *rows(size)[rng.randrange(size)])
+        reset()
+        return run, 1, reset
+    return setup
+
+
+def _load(extension):
+    def setup(size, directory):
+        filename = os.path.join(directory, "expenses" + extension)
+        tracker_with(size).save_expenses(filename)
+
+        def run():
+            tracker = BudgetTracker()
+            tracker.load_expenses(filename)
+            tracker.close()
+        return run, 1, None
+    return setup
+
+
+for _name, _extension in (("json", ".json"), ("bin", ".bin"), ("sqlite", ".db"), ("parts", ".parts")):
+    case(f"save_expenses_full[{_name}]")(_save_full(_extension))
+    case(f"save_expenses_change[{_name}]")(_save_change(_extension))
+    case(f"load_expenses[{_name}]")(_load(_extension))
+
+
+# --- GUI ---
+
+_gui = None
+
+
+def headless_display():
+    """Make sure there is an X display, starting Xvfb if needed; returns why not, or None."""
+    if os.name == "nt" or sys.platform == "darwin" or os.environ.get("DISPLAY"):
+        return None
+    xvfb = shutil.which("Xvfb")
+    if xvfb is None:
+        return "no display and Xvfb is not installed"
+    display = f":{random.randrange(100, 1000)}"
+    server = subprocess.Popen([xvfb, display, "-screen", "0", "1280x1024x24", "-nolisten", "tcp"],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    atexit.register(server.terminate)
+    time.sleep(1.0)
+    if server.poll() is not None:
+        return "Xvfb failed to start"
+    os.environ["DISPLAY"] = display
+    return None
+
+
+def gui(directory):
+    """GUI.py's globals, with the window built but the event loop never entered."""
+    global _gui
+    if _gui is None:
+        problem = headless_display()
+        if problem:
+            raise RuntimeError(problem)
+        import runpy
+        try:
+            import tkinter
+        except ImportError:
+            raise RuntimeError("tkinter is not available")
+        tkinter.Tk.mainloop = lambda self, n=0: None
+        # In an empty directory, so no saved expenses are loaded
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            _gui = runpy.run_path(os.path.join(ROOT, "GUI.py"))
+            _gui["window"].update()
+        finally:
+            os.chdir(cwd)
+    return _gui
+
+
+@case("gui_refresh_table")
+def _gui_refresh_table(size, directory):
+    namespace = gui(directory)
+    window, tracker = namespace["window"], namespace["tracker"]
+    # A fresh store, shown the way GUI.load_expenses shows loaded expenses
+    tracker.expenses = []
+    tracker.add_expenses(rows(size))
+    namespace["table_view"].attach(tracker.expenses)
+    window.update()
+    refresh_table, filter_var = namespace["refresh_table"], namespace["filter_var"]
+    # Alternate between every row and a filter; the first filter builds the search index
+    queries = ["coffee", ""]
+    filter_var.set(queries[0])
+    window.update()
+
+    def run():
+        refresh_table()
+        window.update_idletasks()
+
+    def reset():
+        queries.reverse()
+        filter_var.set(queries[0])
+        window.update_idletasks()
+    return run, 1, reset
+
+
+# --- running ---
+
+def measure(run, ops, reset):
+    times = []
+    elapsed = 0.0
+    while len(times) < MAX_RUNS:
+        start = time.perf_counter()
+        run()
+        took = time.perf_counter() - start
+        times.append(took)
+        elapsed += took
+        if reset is not None:
+            reset()
+        if elapsed >= MAX_TIME or len(times) >= MIN_RUNS and elapsed >= MIN_TIME:
+            break
+    return {
+        "ops": ops,
+        "runs": len(times),
+        "median_ms": statistics.median(times) / ops * 1e3,
+        "min_ms": min(times) / ops * 1e3,
+    }
+
+
+def run_suite(sizes, names):
+    results = []
+    for size in sizes:
+        for name in names:
+            entry = {"case": name, "size": size}
+            with tempfile.TemporaryDirectory() as directory, \
+                    open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                try:
+                    entry.update(measure(*CASES[name](size, directory)))
+                except RuntimeError as e:
+                    entry["skipped"] = str(e)
+                finally:
+                    # Waits for background journal compaction
+                    while _trackers:
+                        _trackers.pop().close()
+            results.append(entry)
+            print(describe(entry), file=sys.stderr)
+    _rows.clear()
+    return results
+
+
+def describe(entry):
+    label = f"{entry['case']:>30} {entry['size']:>8}"
+    if "skipped" in entry:
+        return f"{label}: skipped ({entry['skipped']})"
+    return (f"{label}: median {entry['median_ms']:10.4f} ms/op  min {entry['min_ms']:10.4f} ms/op  "
+            f"({entry['runs']} runs x {entry['ops']} ops)")
+
+
+def commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def metadata():
+    return {
+        "format": FORMAT,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(baseline, current, threshold):
+    """Print a comparison of two result documents; returns the regressed entries."""
+    old = {(entry["case"], entry["size"]): entry for entry in baseline["results"]}
+    print(f"baseline {baseline.get('commit')} ({baseline.get('created')}) -> "
+          f"current {current.get('commit')} ({current.get('created')})")
+    regressions = []
+    for entry in current["results"]:
+        before = old.get((entry["case"], entry["size"]))
+        label = f"{entry['case']:>30} {entry['size']:>8}"
+        if before is None or "skipped" in before or "skipped" in entry:
+            print(f"{label}: not comparable")
+            continue
+        ratio = entry["median_ms"] / before["median_ms"] if before["median_ms"] else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(entry)
+        elif ratio < 1 / (1 + threshold):
+            flag = "  faster"
+        print(f"{label}: {before['median_ms']:10.4f} -> {entry['median_ms']:10.4f} ms/op "
+              f"({(ratio - 1) * 100:+6.1f}%){flag}")
+    print(f"{len(regressions)} regression(s) over {threshold * 100:.0f}%")
+    return regressions
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    scale = {"k": 1000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Budget tracker benchmark suite")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help=f"comma-separated row counts, e.g. 1k,100k,1m (default {DEFAULT_SIZES})")
+    parser.add_argument("--cases", default="",
+                        help="comma-separated substrings; only matching cases run")
+    parser.add_argument("-o", "--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--compare", nargs="+", metavar="RESULTS",
+                        help="baseline JSON to compare against, optionally with a current JSON to skip running")
+    parser.add_argument("--threshold", type=float, default=0.20,
+                        help="relative slowdown counted as a regression (default 0.20)")
+    parser.add_argument("--list", action="store_true", help="list the cases and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        print("\n".join(CASES))
+        return
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare takes a baseline and at most one current result file")
+
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[0]) as file:
+            baseline = json.load(file)
+        with open(args.compare[1]) as file:
+            current = json.load(file)
+        sys.exit(1 if compare(baseline, current, args.threshold) else 0)
+
+    patterns = [pattern for pattern in args.cases.split(",") if pattern]
+    names = [name for name in CASES if not patterns or any(pattern in name for pattern in patterns)]
+    if not names:
+        parser.error(f"no case matches {args.cases!r}; see --list")
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+
+    current = dict(metadata(), sizes=sizes, results=run_suite(sizes, names))
+    text = json.dumps(current, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    elif not args.compare:
+        print(text)
+
+    if args.compare:
+        with open(args.compare[0]) as file:
+            baseline = json.load(file)
+        sys.exit(1 if compare(baseline, current, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+#Synthetic expense generator shared by the benchmark scripts.
+
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+USES = ("Personal", "Joint")
+CATEGORIES = ("Groceries", "Rent", "Utilities", "Transport", "Dining", "Health",
+              "Entertainment", "Travel", "Insurance", "Gifts", "Clothing", "Education")
+WORDS = ("weekly", "shop", "monthly", "bill", "coffee", "dinner", "train", "ticket",
+         "pharmacy", "cinema", "flight", "hotel", "present", "jacket", "course", "fuel")
+
+
+def generate_rows(count, seed=1234, start=date(2015, 1, 1), days=3650):
+    """Yield (date, description, amount, use, category) tuples in date order."""
+    rng = random.Random(seed)
+    step = days / max(count, 1)
+    for i in range(count):
+        day = start + timedelta(days=int(i * step))
+        description = f"{rng.choice(WORDS)} {rng.choice(WORDS)}"
+        amount = round(rng.uniform(1, 500), 2)
+        yield (day.isoformat(), description, amount, rng.choice(USES), rng.choice(CATEGORIES))
@@ -1,39 +1,292 @@
 #Goals: Create a budget tracker that allows users to input/remove expenses and view them in a list.
 
-import json
+import argparse
+import heapq
+import logging
 import os
-try:
-    import pandas as pd
-    print("Pandas library loaded.")
-except ImportError:
-    print("Pandas library not found. Please install pandas library.")
-    exit()
-    
+import sys
+import threading
+from datetime import date
+from time import perf_counter
+
+import commands
+from analytics import get_backend
+from filelock import FileLock, LockedError, lock_path
+from forecast import forecast
+from importer import import_statement
+from limits import BudgetLimits, format_month, parse_month
+from metrics import count, format_snapshot, observe, setup_logging, start_profiling, timed
+from partitions import month_key, month_order
+from recurring import RecurringRule, RecurringRules
+from reports import DEFAULT_PERCENTILES, DIMENSIONS, PERIODS, pivot
+from search import SearchIndex
+from storage import open_storage
+from store import FIELDS, Expense, ExpenseStore, as_ordinal, month_of
 
 PERSONAL_USE = "Personal"
 JOINT_USE = "Joint"
 
-class Expense:
-    def __init__(self, date, description, amount, use, category):
-        self.date = date
-        self.description = description
-        self.amount = amount
-        self.use = use
-        self.category = category   
+# Status messages go here; the CLI shows them with metrics.setup_logging()
+log = logging.getLogger("budget")
 
 class BudgetTracker:
+    # Set BUDGET_VERIFY_TOTALS=1 to check the running totals against a full
+    # recompute after every mutation (slow, meant for debugging)
+    verify_totals = os.environ.get("BUDGET_VERIFY_TOTALS") == "1"
+    # Default files; BUDGET_DATABASE=budget.db keeps both in one SQLite database
+    expenses_file = os.environ.get("BUDGET_DATABASE") or "expenses.json"
+    budget_file = os.environ.get("BUDGET_DATABASE") or "budget.json"
+
     def __init__(self):
-        self.expenses = []
+        self.budget = None
+        # Monthly limits, overall or per category/use, saved along with the budget
+        self.limits = BudgetLimits()
+        # Recurring expenses, kept as rules and saved along with the budget (see recurring.py)
+        self.recurring = RecurringRules()
+        # Save state: operations not yet saved, and whether the next save must
+        # write everything (e.g. after the expenses were replaced wholesale)
+        self._pending = []
+        self._rewrite = True
+        self._storage = None
+        self._budget_storage = None
+        # Set while iter_load_expenses fills a store that nothing is recorded for
+        # yet: changes and saves wait until it is done
+        self._loading = False
+        self._forecasts = {}
+        self._forecasts_key = None
+        self._search_index = None
+        # FileLocks taken by lock(), released by close()
+        self._locks = []
+        # Called with the new store when partitions are loaded or dropped (see _swap_months)
+        self.reload_listeners = []
+        # Mutations hold _lock, so a save running on another thread (see saver.py)
+        # can take a consistent copy of the changes; _save_lock keeps saves in order
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self._attach(ExpenseStore())
+
+    @property
+    def expenses(self):
+        return self._store
+
+    @expenses.setter
+    def expenses(self, expenses):
+        self._check_loaded()
+        store = ExpenseStore()
+        for expense in expenses:
+            # Expenses from another tracker keep their ids
+            store.append(*expense.values(), expense_id=expense.id)
+        with self._lock:
+            self._attach(store)
+            self._rewrite = True
+            if self._partitions is not None:
+                # The new expenses replace every month, on disk or not
+                self._partitions.claim_all()
+
+    def _attach(self, store):
+        store.listeners.append(self._record)
+        self._store = store
+        self._pending = []
+
+    # --- month partitions ---
+
+    @property
+    def _partitions(self):
+        """The storage's Partitions when only some months are loaded (see partitions.py), else None."""
+        return None if self._storage is None else self._storage.partitions
+
+    def _ensure_months(self, months):
+        """Load the months among months that are still on disk into the store.
+
+        Loading drops the least recently used older months once more than
+        Partitions.max_resident would be held, unless there are unsaved changes;
+        then they go at a later load.
+        """
+        partitions = self._partitions
+        if partitions is None:
+            return
+        months = set(months)
+        partitions.touch(months)
+        missing = [month for month in months if partitions.is_offline(month)]
+        if missing:
+            self._swap_months(missing, months)
+
+    def _swap_months(self, load, keep=()):
+        storage = self._storage
+        partitions = storage.partitions
+        loaded = {month: storage.read_month(month) for month in load}
+        with self._lock:
+            evict = set() if self._pending or self._rewrite else \
+                set(partitions.evictable(keep, incoming=len(load)))
+            old = self._store
+            # Rebuilt month by month, so the store (and the table) stays in month order
+            months = {}
+            for row in old.order:
+                ordinal = old.dates[row]
+                month = old.month_of(ordinal) if ordinal > 0 else None
+                if month in evict:
+                    continue
+                rows, ids = months.get(month) or months.setdefault(month, ([], []))
+                rows.append(old.row(row))
+                ids.append(old.ids[row])
+            months.update(loaded)
+            store = ExpenseStore()
+            for month in sorted(months, key=month_order):
+                store.extend(*months[month])
+            store.next_id = max(old.next_id, storage.next_id)
+            # Unlike _attach, the unsaved records stay: ids did not change
+            store.listeners.append(self._record)
+            self._store = store
+            partitions.loaded(load)
+            partitions.unloaded(evict)
+        count("partitions_loaded", len(load))
+        count("partitions_evicted", len(evict))
+        log.debug(f"Loaded {len(load)} months of expenses, dropped {len(evict)}.")
+        for listener in self.reload_listeners:
+            listener(store)
 
+    def load_older(self):
+        """Load the latest month still on disk; returns how many expenses it added."""
+        partitions = self._partitions
+        months = [month for month in partitions.offline() if month is not None] if partitions else []
+        if not months:
+            return 0
+        before = len(self._store)
+        self._ensure_months(months[-1:])
+        return len(self._store) - before
+
+    def load_history(self):
+        """Load every month still on disk, e.g. before a search of all expenses.
+
+        Nothing is dropped to make room, whatever Partitions.max_resident says.
+        """
+        partitions = self._partitions
+        if partitions is not None and partitions.offline():
+            self._swap_months(partitions.offline(), keep=set(partitions.summaries))
+
+    def _offline_months(self, start, end):
+        """Months still on disk with expenses dated start..end (ordinals)."""
+        partitions = self._partitions
+        if partitions is None:
+            return []
+        first, last = month_of(start), month_of(end)
+        return [month for month in partitions.offline() if month is not None and first <= month <= last]
+
+    def _record(self, op, index, row, values, old):
+        if op == "compact":
+            return
+        if op == "extend":
+            store = self._store
+            added = len(store) - index
+            if added >= len(store) // 2:
+                # A batch this big is cheaper to save as a fresh snapshot than as records
+                self._rewrite = True
+                self._pending = []
+            elif not self._rewrite:
+                ids = store.ids
+                self._pending.extend({"op": "add", "expense": {"id": ids[new], **dict(zip(FIELDS, store.row(new)))}}
+                                     for new in range(row, len(store.dates)))
+            return
+        expense_id = self._store.ids[row]
+        record = {"op": op}
+        if op != "add":
+            # The index is only kept for readers of older journals; replay goes by id
+            record["index"] = index
+            record["id"] = expense_id
+        if values is not None:
+            record["expense"] = {"id": expense_id, **dict(zip(FIELDS, values))}
+        self._pending.append(record)
+
+    def _check_loaded(self):
+        if self._loading:
+            raise RuntimeError("Expenses are still loading; change them once the load has finished")
+
+    @timed("add_expense")
     def add_expense(self, expense):
-        self.expenses.append(expense)
+        self._check_loaded()
+        if self._partitions is not None:
+            self._ensure_months([month_key(expense.date)])
+        with self._lock:
+            self._store.append_expense(expense)
+        self._verify()
 
+    @timed("add_expenses")
+    def add_expenses(self, expenses):
+        """Add many expenses at once and return how many were added.
+
+        expenses is an iterable of Expense objects or of (date, description,
+        amount, use, category) tuples; it is consumed lazily, so it may be a
+        generator. Totals, the date index and the save journal are updated once
+        for the whole batch, which makes this much faster than add_expense in a
+        loop.
+        """
+        self._check_loaded()
+        rows = (expense.values() if isinstance(expense, Expense) else expense for expense in expenses)
+        if self._partitions is not None:
+            # Months still on disk must be loaded before expenses are added to them
+            rows = list(rows)
+            self._ensure_months({month_key(row[0]) for row in rows})
+        with self._lock:
+            added = self._store.extend(rows)
+        self._verify()
+        count("expenses_added", added)
+        return added
+
+    @timed("remove_expense")
     def remove_expense(self, index):
+        self._check_loaded()
         if 0 <= index < len(self.expenses):
-            del self.expenses[index]
-            print("Expense removed.")
+            with self._lock:
+                self._store.delete(index)
+            self._verify()
+            log.info("Expense removed.")
         else:
-            print("Failed to remove expense, invalid expense index.")
+            log.warning("Failed to remove expense, invalid expense index.")
+
+    def get_expense(self, expense_id):
+        """The expense with this id, or None."""
+        row = self._store.rows_by_id.get(expense_id)
+        return None if row is None else self._store.view(row)
+
+    def index_of_id(self, expense_id):
+        """Current position of the expense with this id, or None."""
+        row = self._store.rows_by_id.get(expense_id)
+        return None if row is None else self._store.index_of(row)
+
+    @timed("remove_expense")
+    def remove_expense_by_id(self, expense_id):
+        """Remove the expense with this id; returns whether there was one."""
+        self._check_loaded()
+        with self._lock:
+            row = self._store.rows_by_id.get(expense_id)
+            if row is not None:
+                self._store.delete_row(row)
+        if row is None:
+            log.warning(f"Failed to remove expense, no expense with id {expense_id}.")
+            return False
+        self._verify()
+        log.info("Expense removed.")
+        return True
+
+    @timed("edit_expense")
+    def edit_expense_by_id(self, expense_id, date, description, amount, use, category):
+        """Replace the fields of the expense with this id; returns whether there was one."""
+        return self._edit_by_id(expense_id, date, description, amount, use, category)
+
+    def _edit_by_id(self, expense_id, date, description, amount, use, category):
+        self._check_loaded()
+        if self._partitions is not None:
+            self._ensure_months([month_key(date)])
+        with self._lock:
+            row = self._store.rows_by_id.get(expense_id)
+            if row is not None:
+                self._store.update_row(row, date, description, amount, use, category)
+        if row is None:
+            log.warning(f"Failed to edit expense, no expense with id {expense_id}.")
+            return False
+        self._verify()
+        log.info("Expense edited.")
+        return True
 
     def view_expenses(self):
         if len(self.expenses) == 0:
@@ -41,27 +294,188 @@ class BudgetTracker:
         else:
             print("Expenses list:")
             for index, expense in enumerate(self.expenses, start=1):
-                print(f"{index}. Date: {expense.date}, Description: {expense.description}, Amount: {expense.amount}, Use: {expense.use}, Category: {expense.category}")
+                print(f"{index}. Date: {expense.date}, Description: {expense.description}, Amount: {expense.amount}, Use: {expense.use}, Category: {expense.category}, ID: {expense.id}")
+        partitions = self._partitions
+        if partitions is not None and partitions.offline():
+            print(f"({partitions.archive().count} older expenses in {len(partitions.offline())} months not loaded.)")
 
+    @timed("edit_expense")
     def edit_expense(self, index, date, description, amount, use, category):
         if 0 <= index < len(self.expenses):
-            self.expenses[index].date = date
-            self.expenses[index].description = description
-            self.expenses[index].amount = amount
-            self.expenses[index].use = use
-            self.expenses[index].category = category
-            print("Expense edited.")
+            # By id: loading the month of the new date can reorder the store
+            self._edit_by_id(self._store.ids[self._store.order[index]], date, description, amount, use, category)
         else:
-            print("Failed to edit expense, invalid expense index.")
+            log.warning("Failed to edit expense, invalid expense index.")
            
+    # --- recurring expenses ---
+
+    def add_recurring(self, description, amount, use, category, start, frequency="monthly", interval=1,
+                      end=None):
+        """Repeat an expense every `interval` days, weeks, months or years from start; returns the rule's id.
+
+        frequency is "daily", "weekly", "monthly" or "yearly"; end (inclusive)
+        None repeats forever. Occurrences count towards the totals once their
+        date has come.
+        """
+        rule = RecurringRule(description, amount, use, category, start, frequency, interval, end)
+        with self._lock:
+            rule_id = self.recurring.add(rule)
+        log.info(f"Recurring expense added: {rule}.")
+        return rule_id
+
+    def remove_recurring(self, rule_id):
+        """Remove the recurring expense with this id; returns whether there was one."""
+        with self._lock:
+            removed = self.recurring.remove(rule_id)
+        if removed:
+            log.info("Recurring expense removed.")
+        else:
+            log.warning(f"Failed to remove recurring expense, no rule with id {rule_id}.")
+        return removed
+
+    def recurring_expenses(self, start, end):
+        """Occurrences of the recurring expenses dated start..end (and up to today), generated lazily."""
+        return self.recurring.occurrences(as_ordinal(start), as_ordinal(end))
+
+    # Totals cover every expense: with partitions, the summaries of the months
+    # still on disk are added to the store's rollups, and the occurrences of the
+    # recurring expenses up to today are counted in closed form
+
+    @timed("total_expenses")
     def total_expenses(self) -> float:
-        total = sum(expense.amount for expense in self.expenses)
-        return total
+        partitions = self._partitions
+        total = self._store.total + self.recurring.total()
+        if partitions is None:
+            return total
+        return total + partitions.archive().total
     
+    @timed("total_expenses_by_use")
     def total_expenses_by_use(self, use) -> float:
-        total = sum(expense.amount for expense in self.expenses if expense.use.lower() == use.lower())
-        return total
+        partitions = self._partitions
+        total = self._store.total_by_use(use) + self.recurring.total_by_use(use)
+        if partitions is None:
+            return total
+        return total + partitions.archive().total_by_use(use)
+
+    @timed("total_expenses_by_categories")
+    def total_expenses_by_categories(self) -> dict:
+        totals = self._store.totals_by_category()
+        partitions = self._partitions
+        extra = [self.recurring.totals_by_category()]
+        if partitions is not None:
+            extra.append(partitions.archive().by_category)
+        for more in extra:
+            for category, total in more.items():
+                totals[category] = totals.get(category, 0.0) + total
+        return totals
+
+    @timed("expenses_between")
+    def expenses_between(self, start, end) -> list:
+        """Expenses dated start..end inclusive (date objects or YYYY-MM-DD), oldest first.
+
+        Occurrences of recurring expenses up to today are included; their id is None.
+        """
+        start, end = as_ordinal(start), as_ordinal(end)
+        self._ensure_months(self._offline_months(start, end))
+        view = self._store.view
+        stored = (view(row) for row in self._store.rows_between(start, end))
+        if not self.recurring:
+            return list(stored)
+        return list(heapq.merge(stored, self.recurring.occurrences(start, end), key=lambda expense: expense.date))
+
+    @timed("total_between")
+    def total_between(self, start, end) -> float:
+        start, end = as_ordinal(start), as_ordinal(end)
+        if start > end:
+            return 0.0
+        partitions = self._partitions
+        recurring = self.recurring.total_between(start, end)
+        if partitions is None:
+            return self._store.total_between(start, end) + recurring
+        # Only the months cut by the range need their rows; whole ones have summaries
+        self._ensure_months({month_of(start), month_of(end)})
+        return self._store.total_between(start, end) + recurring + sum(
+            partitions.summaries[month].total for month in self._offline_months(start, end))
+
+    def _month_totals(self):
+        totals = dict(self._store.month_totals)
+        partitions = self._partitions
+        if partitions is not None:
+            for month in partitions.offline():
+                if month is not None:
+                    totals[month] = partitions.summaries[month].total
+        for month, total in self.recurring.period_totals("month").items():
+            totals[month] = totals.get(month, 0.0) + total
+        return totals
+
+    @timed("monthly_totals")
+    def monthly_totals(self) -> dict:
+        """Total per month as {"YYYY-MM": amount}, in date order."""
+        totals = self._month_totals()
+        return {format_month(month): totals[month] for month in sorted(totals)}
+
+    @timed("weekly_totals")
+    def weekly_totals(self) -> dict:
+        """Total per Monday-to-Sunday week as {"YYYY-MM-DD" of the Monday: amount}, in date order."""
+        totals = dict(self._store.week_totals)
+        partitions = self._partitions
+        extra = [self.recurring.period_totals("week")]
+        if partitions is not None:
+            extra.append(partitions.archive().weeks)
+        for more in extra:
+            for week, total in more.items():
+                totals[week] = totals.get(week, 0.0) + total
+        return {date.fromordinal(week * 7 + 1).isoformat(): totals[week] for week in sorted(totals)}
+
+    @timed("month_total")
+    def month_total(self, year, month) -> float:
+        return self.month_spent(year * 12 + month - 1)
+
+    @timed("month_spent")
+    def month_spent(self, month=None, category=None, use=None) -> float:
+        """Spending in month ("YYYY-MM" or a date; this month by default), optionally for a category and/or use.
+
+        A lookup in the store's month/use/category rollups, or in the month's
+        partition summary while it is on disk, not a scan, plus the recurring
+        expenses' occurrences up to today.
+        """
+        month = parse_month(month)
+        return self._month_stored(month, category, use) + self.recurring.month_spent(month, use, category)
+
+    def _month_stored(self, month, category, use):
+        partitions = self._partitions
+        if partitions is not None and partitions.is_offline(month):
+            summary = partitions.summaries[month]
+            if category is None and use is None:
+                return summary.total
+            if use is None:
+                return summary.by_category.get(category, 0.0)
+            if category is None:
+                return summary.total_by_use(use)
+            # The summary has no per use and category totals
+            self._ensure_months([month])
+        return self._store.month_spent(month, use=use, category=category)
+
+    @property
+    def search_index(self):
+        """Token/prefix index over descriptions and categories, built on first use."""
+        index = self._search_index
+        if index is None or index.store is not self._store:
+            if index is not None:
+                index.detach()
+            index = self._search_index = SearchIndex(self._store)
+        return index
+
+    @timed("search_expenses")
+    def search_expenses(self, query) -> list:
+        """Expenses whose description or category has words starting with every word of query.
 
+        Only the loaded months are searched; call load_history() first to search them all.
+        """
+        view = self._store.view
+        return [view(row) for row in self.search_index.rows(query)]
+
+    @timed("total_expenses_by_uses")
     def total_expenses_by_uses(self) -> dict:
         totals = {
             PERSONAL_USE: self.total_expenses_by_use(PERSONAL_USE),
@@ -69,9 +483,104 @@ class BudgetTracker:
         }
         return totals
     
+    @timed("forecast_expenses")
+    def forecast_expenses(self, period="monthly", method="moving_average", horizon=3, window=3):
+        """Project spending per category and per use and when the budget runs out.
+
+        period is "daily", "weekly" or "monthly"; method is "moving_average",
+        "linear_trend" or "seasonal_naive". Recurring expenses are not projected
+        but added as scheduled. Results are cached until the expenses, the
+        budget or the day change, so repeated calls are cheap. With month
+        partitions only the loaded months are projected from.
+        """
+        key = (self._store, self._store.version, self.budget, self.recurring, self.recurring.version,
+               date.today())
+        if key != self._forecasts_key:
+            self._forecasts = {}
+            self._forecasts_key = key
+        args = (period, method, horizon, window)
+        result = self._forecasts.get(args)
+        if result is None:
+            budget = self.budget
+            partitions = self._partitions
+            if budget is not None:
+                # forecast() only sees the loaded months; what the others and the
+                # recurring expenses spent comes off the budget
+                budget -= self.recurring.total()
+                if partitions is not None:
+                    budget -= partitions.archive().total
+            result = self._forecasts[args] = forecast(self._store, budget, *args, recurring=self.recurring)
+        return result
+
+    @timed("pivot_report")
+    def pivot_report(self, period="month", by=DIMENSIONS, percentiles=DEFAULT_PERCENTILES, workers=None):
+        """Count, total, mean and percentiles per period and category and/or use (see reports.py).
+
+        period is "month", "quarter" or "year"; by holds "category", "use" or
+        both. workers > 1 groups the rows in a process pool; None picks one per
+        CPU for large histories. With month partitions every month is loaded first.
+        """
+        self.load_history()
+        return pivot(self._store, period, by, percentiles, workers)
+
+    def print_forecast(self, period="monthly", method="moving_average", horizon=3):
+        result = self.forecast_expenses(period, method, horizon)
+        if not result.periods:
+            print("No dated expenses to forecast from.")
+            return
+        print(f"Expenses forecast ({period}, {method.replace('_', ' ')}):")
+        for i, label in enumerate(result.periods):
+            print(f"{label}: {result.total[i]:.2f}")
+            for name, values in sorted(result.by_category.items()):
+                print(f"    {name}: {values[i]:.2f}")
+        if result.run_out == "exceeded":
+            print("Budget already exceeded.")
+        elif result.run_out is not None:
+            print(f"Budget projected to run out in {result.run_out}.")
+        elif self.budget is not None:
+            print("Budget not projected to run out.")
+
+    # The CLI's original spelling
+    forcast_expenses = print_forecast
+
+    def to_dataframe(self):
+        """All expenses as a pandas DataFrame; pandas is imported on first call."""
+        return get_backend("pandas").frame(self._store)
+
+    def _verify(self):
+        if self.verify_totals:
+            self._store.check_totals()
+
+    def verify(self):
+        """Check the running totals against a full recompute; raises AssertionError on drift."""
+        self._store.check_totals()
+
     def set_budget(self, amount):
         self.budget = amount
-        print(f"Budget set to {amount}.")
+        log.info(f"Budget set to {amount}.")
+
+    def set_monthly_budget(self, amount, category=None, use=None, month=None):
+        """Limit spending per month, for all expenses or for one category or use.
+
+        month ("YYYY-MM") limits only that month, overriding the every-month
+        limit; an amount of None removes the limit.
+        """
+        if category and use:
+            raise ValueError("A monthly budget is for a category or a use, not both")
+        scope, name = ("category", category) if category else ("use", use) if use else ("total", None)
+        with self._lock:
+            self.limits.set(amount, scope, name, month)
+        label = "all expenses" if scope == "total" else f"{scope} {name}"
+        period = f"in {format_month(parse_month(month))}" if month else "per month"
+        if amount is None:
+            log.info(f"Budget for {label} {period} removed.")
+        else:
+            log.info(f"Budget for {label} set to {amount} {period}.")
+
+    @timed("check_limits")
+    def check_limits(self, month=None) -> list:
+        """BudgetStatus of each monthly budget for month (this month by default)."""
+        return self.limits.check(self, month)
 
     def check_budget(self):
         if self.budget is not None:
@@ -84,50 +593,226 @@ class BudgetTracker:
                 print(f"Budget not exceeded. Total expenses: {total}, Budget: {self.budget}")
         else:
             print("Budget not set")
+        for status in self.check_limits():
+            print(f"{'Exceeded' if status.exceeded else 'Within'}: {status}")
 
-    def save_budget(self, filename="budget.json"):
-        try:
-            with open(filename, "w") as file:
-                json.dump(self.budget, file)
-            print("Budget saved to file.")
-        except Exception as e:
-            print(f"Failed to save budget to file: {e}")
+    @timed("save_budget")
+    def save_budget(self, filename=None):
+        """Save the budget; returns True once it is durably on disk."""
+        filename = filename or self.budget_file
+        with self._save_lock:
+            with self._lock:
+                # Files without monthly budgets or recurring expenses keep the plain number older versions read
+                budget = self.budget if not self.limits and not self.recurring else \
+                    {"budget": self.budget, "limits": self.limits.to_json(), "recurring": self.recurring.to_json()}
+            try:
+                storage = self._budget_storage
+                if storage is None or not storage.matches(filename):
+                    storage = open_storage(filename)
+                storage.save_budget(budget)
+                if storage is not self._budget_storage:
+                    if self._budget_storage is not None:
+                        self._budget_storage.close()
+                    self._budget_storage = storage
+                log.info("Budget saved to file.")
+                return True
+            except Exception as e:
+                count("save_failures")
+                log.error(f"Failed to save budget to file: {e}")
+                return False
     
-    def load_budget(self, filename="budget.json"):
+    @timed("load_budget")
+    def load_budget(self, filename=None):
+        """Load the budget; returns False if the file exists but could not be read."""
+        filename = filename or self.budget_file
+        storage = open_storage(filename)
         try:
-            with open(filename, "r") as file:
-                self.budget = json.load(file)
-            print("Budget loaded from file.")
+            budget = storage.load_budget()
+            if isinstance(budget, dict):
+                limits = BudgetLimits.from_json(budget.get("limits", []))
+                recurring = RecurringRules.from_json(budget.get("recurring", []))
+                budget = budget.get("budget")
+            else:
+                limits, recurring = BudgetLimits(), RecurringRules()
+            with self._lock:
+                self.budget, self.limits, self.recurring = budget, limits, recurring
+            if self._budget_storage is not None:
+                self._budget_storage.close()
+            self._budget_storage = storage
+            log.info("Budget loaded from file.")
         except FileNotFoundError:
-            print("No saved budget found.")
+            log.info("No saved budget found.")
         except Exception as e:
-            print(f"Failed to load budget from file: {e}")
+            count("load_failures")
+            log.error(f"Failed to load budget from file: {e}")
+            return False
+        return True
     
-    def save_expenses(self, filename="expenses.json"):
-        try:
-            with open(filename, "w") as file:
-                json.dump([expense.__dict__ for expense in self.expenses], file)
-            print("Expenses saved to file.")
-        except Exception as e:
-            print(f"Failed to save expenses to file: {e}")
+    @property
+    def storage(self):
+        """The storage backend expenses were last loaded from or saved to, or None."""
+        return self._storage
+
+    @timed("save_expenses")
+    def save_expenses(self, filename=None):
+        """Save the changes since the last save.
+
+        With JSON files the changes are appended to the journal, and a full
+        snapshot is only written when saving to a new file; the journal is folded
+        back into the snapshot in the background once it grows large. With an
+        SQLite database (.db) they are applied in one transaction.
+        Safe to call from another thread: the changes, or a copy of the store,
+        are taken under the tracker lock and only the writing happens outside
+        it. Returns True once the expenses are durably on disk.
+        """
+        filename = filename or self.expenses_file
+        if self._loading:
+            # The partial store would overwrite the file that is still being read
+            log.warning("Expenses not saved: they are still loading.")
+            return False
+        if self._partitions is not None and not self._storage.matches(filename):
+            # Another file gets every expense, so the months still on disk are needed
+            self.load_history()
+        with self._save_lock:
+            with self._lock:
+                storage = self._storage
+                if storage is None or not storage.matches(filename):
+                    storage = open_storage(filename)
+                rewrite = storage is not self._storage or self._rewrite
+                pending, self._pending = self._pending, []
+                snapshot = None
+                if rewrite or storage.needs_snapshot(len(self._store), len(pending)):
+                    snapshot = self._store.copy()
+                self._rewrite = False
+            try:
+                storage.save(None if rewrite else pending, snapshot)
+                if storage is not self._storage:
+                    if self._storage is not None:
+                        self._storage.close()
+                    self._storage = storage
+                log.info("Expenses saved to file.")
+                return True
+            except Exception as e:
+                # Keep the changes so the next save retries them
+                with self._lock:
+                    if rewrite:
+                        self._rewrite = True
+                    else:
+                        self._pending[:0] = pending
+                count("save_failures")
+                log.error(f"Failed to save expenses to file: {e}")
+                return False
             
-    def load_expenses(self, filename="expenses.json"):
+    def load_expenses(self, filename=None):
+        """Load the expenses; returns False if the file exists but could not be read."""
         try:
-            with open(filename, "r") as file:
-                expenses_data = json.load(file)
-                self.expenses = [Expense(expense["date"], 
-                                         expense["description"], 
-                                         expense["amount"], 
-                                         expense["use"], 
-                                         expense["category"]) for expense in expenses_data]
-            print("Expenses loaded from file.")
+            for _ in self.iter_load_expenses(filename):
+                pass
+            log.info("Expenses loaded from file.")
         except FileNotFoundError:
-            print("No saved expenses found.")
+            log.info("No saved expenses found.")
         except Exception as e:
-            print(f"Failed to load expenses from file: {e}")
+            count("load_failures")
+            log.error(f"Failed to load expenses from file: {e}")
+            return False
+        return True
+
+    def iter_load_expenses(self, filename=None, chunk_rows=5000):
+        """Load expenses incrementally, yielding the number of rows loaded so far.
+
+        The new rows and totals are visible on the tracker between chunks, so a
+        caller can show the first rows before the file is fully parsed. The
+        legacy JSON array, JSON Lines, binary .bin snapshots (memory-mapped in
+        one step) and SQLite databases are accepted. A journal is replayed
+        after the last chunk. Until the generator is exhausted, changing the
+        expenses raises RuntimeError and save_expenses() refuses to run, as
+        nothing records the changes yet. If loading fails, the previous
+        expenses are restored.
+        """
+        start = perf_counter()
+        storage = open_storage(filename or self.expenses_file)
+        previous = self._store
+        store = ExpenseStore()
+        with self._lock:
+            self._store = store
+            self._loading = True
+        try:
+            yield from storage.load(store, chunk_rows)
+        except BaseException:
+            with self._lock:
+                self._store = previous
+                self._loading = False
+            storage.close()
+            raise
+        if self._storage is not None:
+            self._storage.close()
+        with self._lock:
+            self._attach(store)
+            self._storage = storage
+            self._rewrite = False
+            self._loading = False
+        # Includes the time the caller spent between chunks, e.g. the GUI drawing them
+        observe("load_expenses", perf_counter() - start)
+        count("expenses_loaded", len(store))
+        yield len(store)
+
+    def lock(self, expenses_file=None, budget_file=None):
+        """Keep other processes from saving to the expense and budget files until close().
+
+        Raises filelock.LockedError if another process already has them.
+        """
+        paths = {os.path.abspath(lock_path(filename))
+                 for filename in (expenses_file or self.expenses_file, budget_file or self.budget_file)}
+        locks = []
+        try:
+            for path in sorted(paths):
+                if any(held.path == path for held in self._locks):
+                    continue
+                lock = FileLock(path)
+                lock.acquire()
+                locks.append(lock)
+        except LockedError:
+            for lock in locks:
+                lock.release()
+            raise
+        self._locks.extend(locks)
+
+    def close(self):
+        """Wait for background journal compaction and release the storage files and locks."""
+        for storage in (self._storage, self._budget_storage):
+            if storage is not None:
+                storage.close()
+        for lock in self._locks:
+            lock.release()
+        self._locks = []
+
+def clear_screen():
+    # An ANSI escape rather than running cls/clear in a new shell on every loop
+    if sys.stdout.isatty():
+        print("\033[2J\033[H", end="", flush=True)
 
 def main():
+    parser = argparse.ArgumentParser(description="Budget Tracker")
+    parser.add_argument("--log-level", help="DEBUG, INFO (default), WARNING or ERROR; "
+                                            "also set by BUDGET_LOG_LEVEL")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only show warnings and errors")
+    parser.add_argument("--profile", help="cpu, memory or cpu,memory: profile the session and "
+                                          "print a report on exit; also set by BUDGET_PROFILE")
+    commands.add_arguments(parser)
+    args = parser.parse_args()
+    start_profiling(args.profile)
+    if args.command:
+        # stdout is for the JSON output; warnings and errors go to stderr
+        setup_logging(args.log_level or "WARNING", sys.stderr)
+        raise SystemExit(commands.main(BudgetTracker(), args))
+    setup_logging("WARNING" if args.quiet else args.log_level)
+
     tracker = BudgetTracker()
+    try:
+        tracker.lock()
+    except LockedError as e:
+        log.error(f"{e}. Close the other Budget Tracker (or API server) using these files first.")
+        return
     
     print("Loading saved expenses...")
     tracker.load_expenses()
@@ -135,13 +820,14 @@ def main():
     tracker.load_budget()
 
     while True:
-        os.system("cls" if os.name == "nt" else "clear")
+        clear_screen()
         print("\nBudget Tracker")
         print("Select a menu")
         print("1. Budget")
         print("2. Expenses")
         print("3. Totals")      
-        print("4. Exit")
+        print("4. Metrics")
+        print("5. Exit")
 
         choice = input("Enter choice: ")
 
@@ -150,7 +836,8 @@ def main():
             print("Select an option:")
             print("1. Set budget")
             print("2. Check budget")
-            print("3. Exit")
+            print("3. Set monthly budget")
+            print("4. Exit")
 
             choice = input("Enter choice: ")
 
@@ -163,6 +850,19 @@ def main():
                 input("Press Enter to continue...")
 
             elif choice == "3":
+                amount = float(input("Enter monthly budget amount: "))
+                category = input("Enter category (blank for all expenses): ").strip() or None
+                use = None
+                if category is None:
+                    use = input(f"Enter use ({PERSONAL_USE}/{JOINT_USE}, blank for all): ").strip() or None
+                month = input("Enter month YYYY-MM (blank for every month): ").strip() or None
+                try:
+                    tracker.set_monthly_budget(amount, category=category, use=use, month=month)
+                except ValueError as e:
+                    print(e)
+                input("Press Enter to continue...")
+
+            elif choice == "4":
                 print("Exiting Budget Menu.")
                 continue
         
@@ -174,7 +874,10 @@ def main():
             print("3. Edit expense")
             print("4. View expenses")
             print("5. Expenses forecast")
-            print("6. Exit")
+            print("6. Search expenses")
+            print("7. Import bank statement")
+            print("8. Recurring expenses")
+            print("9. Exit")
 
             choice = input("Enter choice: ")
    
@@ -213,9 +916,53 @@ def main():
                 tracker.view_expenses()
 
             elif choice == "5":
-                tracker.forcast_expenses()
+                tracker.print_forecast()
+                input("Press Enter to continue...")
 
             elif choice == "6":
+                query = input("Search for: ")
+                store = tracker.expenses
+                rows = tracker.search_index.rows(query)
+                if not rows:
+                    print("No matching expenses found.")
+                for row in rows:
+                    expense = store.view(row)
+                    print(f"{store.index_of(row) + 1}. Date: {expense.date}, Description: {expense.description}, Amount: {expense.amount}, Use: {expense.use}, Category: {expense.category}, ID: {expense.id}")
+                input("Press Enter to continue...")
+
+            elif choice == "7":
+                filename = input("Enter statement file (CSV or OFX): ")
+                try:
+                    print(import_statement(tracker, filename))
+                except (OSError, ValueError) as e:
+                    print(f"Failed to import statement: {e}")
+                input("Press Enter to continue...")
+
+            elif choice == "8":
+                if not tracker.recurring:
+                    print("No recurring expenses.")
+                for rule in tracker.recurring:
+                    print(f"{rule.id}. {rule}")
+                action = input("Add (a), remove (r) or back (blank): ").strip().lower()
+                try:
+                    if action == "a":
+                        description = input("Enter description: ")
+                        amount = float(input("Enter amount: "))
+                        use = input(f"Enter use ({PERSONAL_USE}/{JOINT_USE}): ").lower()
+                        category = input("Enter category: ")
+                        start = input("Enter first date (YYYY-MM-DD): ").strip()
+                        frequency = input("Repeat daily/weekly/monthly/yearly (blank for monthly): ").strip().lower() or "monthly"
+                        interval = int(input("Every how many of those (blank for 1): ").strip() or 1)
+                        end = input("Enter last date (YYYY-MM-DD, blank for none): ").strip() or None
+                        tracker.add_recurring(description, amount, use, category, start, frequency, interval, end)
+                        print("Recurring expense added.")
+                    elif action == "r":
+                        tracker.remove_recurring(int(input("Enter recurring expense number to remove: ")))
+                except ValueError as e:
+                    print(e)
+                input("Press Enter to continue...")
+
+            elif choice == "9":
                 print("Exiting Expenses Menu.")
                 continue
         
@@ -224,7 +971,9 @@ def main():
             print("Select an option:")
             print("1. Total expenses")
             print("2. Total expenses by use")
-            print("3. Exit")
+            print("3. Pivot report")
+            print("4. Export pivot report to CSV")
+            print("5. Exit")
 
             choice = input("Enter choice: ")
 
@@ -240,15 +989,36 @@ def main():
                 print(f"{JOINT_USE}: {totals[JOINT_USE]}")
                 input("Press Enter to continue...")
 
-            elif choice == "3":
+            elif choice in ("3", "4"):
+                period = input(f"Enter period ({'/'.join(PERIODS)}, blank for month): ").strip().lower() or "month"
+                by = input("Group by (category/use/both, blank for both): ").strip().lower() or "both"
+                try:
+                    report = tracker.pivot_report(period, DIMENSIONS if by == "both" else (by,))
+                    if choice == "3":
+                        print(report.format() if report.rows else "No dated expenses to report.")
+                    else:
+                        filename = input("Enter CSV file name: ").strip()
+                        report.write_csv(filename)
+                        print(f"Pivot report saved to {filename}.")
+                except (OSError, ValueError) as e:
+                    print(e)
+                input("Press Enter to continue...")
+
+            elif choice == "5":
                 print("Exiting Totals Menu.")
                 continue
 
         elif choice == "4":
+            print("\nMetrics")
+            print(format_snapshot())
+            input("Press Enter to continue...")
+
+        elif choice == "5":
             print("Saving expenses...")
             tracker.save_expenses()
             print("Saving budget...")
             tracker.save_budget()
+            tracker.close()
             print("Exiting Budget Tracker.")
             break
 
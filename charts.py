@@ -0,0 +1,262 @@
+#Spending charts for the GUI on a Tk Canvas: cumulative spend against the budget
+#over time, and spend by category.
+#
+#DailySpend keeps the total of each day's expenses. It is built once when a
+#store is attached and then follows the store's listener, so adding, editing or
+#removing an expense costs a dictionary update or two. The cumulative series is
+#derived from it, in one pass over the days rather than the expenses, only when
+#something changed since it was last asked for. Spend the store does not hold
+#(months of a partitioned file still on disk, recurring expenses) is added by
+#week from their summaries and closed-form totals. Before drawing, the series is
+#cut down to at most one point per pixel column with LTTB (largest triangle
+#three buckets), which keeps the jumps a plain stride would step over; minmax()
+#is the per-pixel alternative that keeps the exact envelope. Spend by category
+#comes from the tracker's running totals. As in expense_table.py, redraws are
+#deferred to the next idle moment and skipped when nothing they show changed.
+
+from datetime import date as Date
+
+from store import _ROW_BITS, _ROW_MASK, date_to_ordinal
+
+
+def lttb(xs, ys, threshold):
+    """Largest-triangle-three-buckets: at most threshold of the points (xs sorted), ends included."""
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(xs), list(ys)
+    out_x, out_y = [xs[0]], [ys[0]]
+    every = (n - 2) / (threshold - 2)
+    chosen = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        # The next bucket's average is the third corner; the last point after the final bucket
+        after_start, after_end = end, min(int((bucket + 2) * every) + 1, n)
+        span = after_end - after_start
+        avg_x = sum(xs[after_start:after_end]) / span
+        avg_y = sum(ys[after_start:after_end]) / span
+        ax, ay = xs[chosen], ys[chosen]
+        best, best_area = start, -1.0
+        for i in range(start, end):
+            area = abs((ax - avg_x) * (ys[i] - ay) - (ax - xs[i]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = i, area
+        out_x.append(xs[best])
+        out_y.append(ys[best])
+        chosen = best
+    out_x.append(xs[-1])
+    out_y.append(ys[-1])
+    return out_x, out_y
+
+
+def minmax(xs, ys, buckets):
+    """Per-bucket first, lowest, highest and last points over equal x ranges (xs sorted)."""
+    n = len(xs)
+    if n <= 4 * buckets or buckets < 1:
+        return list(xs), list(ys)
+    x0, width = xs[0], (xs[-1] - xs[0]) or 1
+    out_x, out_y = [], []
+    start = 0
+    while start < n:
+        bucket = min(int((xs[start] - x0) / width * buckets), buckets - 1)
+        end = start
+        while end < n and min(int((xs[end] - x0) / width * buckets), buckets - 1) == bucket:
+            end += 1
+        low = min(range(start, end), key=ys.__getitem__)
+        high = max(range(start, end), key=ys.__getitem__)
+        for i in sorted({start, low, high, end - 1}):
+            out_x.append(xs[i])
+            out_y.append(ys[i])
+        start = end
+    return out_x, out_y
+
+
+class DailySpend:
+    """Total spend per day (date ordinal) of a store's dated expenses, kept up to date."""
+
+    def __init__(self):
+        self.store = None
+        self.totals = {}
+        self.counts = {}
+        # Bumped by every change; series() is cached against it
+        self.version = 0
+        self._series = None
+        self._series_version = None
+
+    def attach(self, store):
+        if self.store is not None and self.on_change in self.store.listeners:
+            self.store.listeners.remove(self.on_change)
+        self.store = store
+        self.totals, self.counts = {}, {}
+        self._fold(store.date_index)
+        store.listeners.append(self.on_change)
+        self.version += 1
+
+    def _fold(self, keys):
+        totals, counts, amounts = self.totals, self.counts, self.store.amounts
+        for key in keys:
+            day = key >> _ROW_BITS
+            totals[day] = totals.get(day, 0.0) + amounts[key & _ROW_MASK]
+            counts[day] = counts.get(day, 0) + 1
+
+    def _add(self, day, amount, sign):
+        if day is None or day <= 0:
+            return
+        count = self.counts.get(day, 0) + sign
+        if count:
+            self.counts[day] = count
+            self.totals[day] = self.totals.get(day, 0.0) + sign * amount
+        else:
+            self.counts.pop(day, None)
+            self.totals.pop(day, None)
+
+    def on_change(self, op, index, row, values, old):
+        store = self.store
+        if op == "extend":
+            dates = store.dates
+            self._fold(dates[new] << _ROW_BITS | new for new in range(row, len(store.amounts)) if dates[new] > 0)
+        elif op == "compact":
+            return
+        if old is not None:
+            self._add(date_to_ordinal(old[0]), old[2], -1)
+        if values is not None:
+            self._add(store.dates[row], store.amounts[row], 1)
+        self.version += 1
+
+    def series(self, weeks=None):
+        """(days, cumulative spend at the end of each day), in date order.
+
+        weeks ({week number: total}, see store.week_of) adds spend not in the
+        store, e.g. of months still on disk, counted on the Monday of its week.
+        """
+        if self._series_version != (self.version, weeks):
+            totals = self.totals
+            if weeks:
+                totals = dict(totals)
+                for week, total in weeks.items():
+                    totals[week * 7 + 1] = totals.get(week * 7 + 1, 0.0) + total
+            days = sorted(totals)
+            cumulative = []
+            running = 0.0
+            for day in days:
+                running += totals[day]
+                cumulative.append(running)
+            self._series = (days, cumulative)
+            self._series_version = (self.version, weeks)
+        return self._series
+
+
+class ChartPanel:
+    """Both charts on one Canvas: cumulative spend over time on top, by category below."""
+
+    # Categories with their own bar; the rest are summed into "Other"
+    max_categories = 8
+
+    def __init__(self, canvas, tracker, colors, font):
+        self.canvas = canvas
+        self.tracker = tracker
+        self.colors = colors
+        self.font = font
+        self.spend = DailySpend()
+        self.pending = False
+        self._drawn = None
+        canvas.bind("<Configure>", lambda _: self.request())
+
+    def attach(self, store):
+        """Follow store; call again whenever the tracker switches to another store."""
+        if store is not self.spend.store:
+            self.spend.attach(store)
+        self.request()
+
+    def request(self):
+        if not self.pending:
+            self.pending = True
+            self.canvas.after_idle(self.redraw)
+
+    def _extra_weeks(self):
+        # Months of a partitioned file still on disk and recurring expenses count from their weekly totals
+        storage = self.tracker.storage
+        partitions = None if storage is None else storage.partitions
+        weeks = {} if partitions is None or not partitions.offline() else partitions.archive().weeks
+        recurring = self.tracker.recurring
+        if recurring:
+            weeks = dict(weeks)
+            for week, total in recurring.period_totals("week").items():
+                weeks[week] = weeks.get(week, 0.0) + total
+        return weeks or None
+
+    def redraw(self):
+        self.pending = False
+        canvas = self.canvas
+        width, height = canvas.winfo_width(), canvas.winfo_height()
+        extra = self._extra_weeks()
+        # The store's version covers the category totals too
+        key = (self.spend.version, self.tracker.expenses.version, self.tracker.budget, extra, width, height)
+        if key == self._drawn or width < 50 or height < 50:
+            return
+        self._drawn = key
+        canvas.delete("all")
+        split = int(height * 0.55)
+        self._draw_cumulative(0, 0, width, split, extra)
+        self._draw_categories(0, split, width, height)
+
+    def _draw_cumulative(self, left, top, right, bottom, extra):
+        canvas, colors, font = self.canvas, self.colors, self.font
+        canvas.create_text(left + 12, top + 10, text="Cumulative spend", anchor="nw", fill=colors["subtext"], font=font)
+        days, cumulative = self.spend.series(extra)
+        if not days:
+            canvas.create_text((left + right) / 2, (top + bottom) / 2, text="No dated expenses yet",
+                               fill=colors["subtext"], font=font)
+            return
+        x0, x1 = left + 64, right - 16
+        y0, y1 = top + 34, bottom - 26
+        budget = self.tracker.budget
+        high = max(max(cumulative), budget or 0.0, 1.0)
+        low = min(min(cumulative), 0.0)
+        first, last = days[0], max(days[-1], days[0] + 1)
+        xs, ys = lttb(days, cumulative, max(int(x1 - x0), 3))
+
+        def x_of(day):
+            return x0 + (day - first) / (last - first) * (x1 - x0)
+
+        def y_of(value):
+            return y1 - (value - low) / (high - low) * (y1 - y0)
+
+        canvas.create_line(x0, y1, x1, y1, fill=colors["grid"])
+        canvas.create_line(x0, y0, x0, y1, fill=colors["grid"])
+        if budget is not None:
+            y = y_of(budget)
+            canvas.create_line(x0, y, x1, y, fill=colors["budget"], dash=(4, 3))
+            canvas.create_text(x1, y - 2, text=f"Budget ${budget:,.0f}", anchor="se", fill=colors["budget"], font=font)
+        points = []
+        for day, value in zip(xs, ys):
+            points += (x_of(day), y_of(value))
+        if len(points) == 2:
+            points += points
+        canvas.create_line(*points, fill=colors["line"], width=2)
+        canvas.create_text(x0 - 6, y0, text=f"${high:,.0f}", anchor="ne", fill=colors["subtext"], font=font)
+        canvas.create_text(x0 - 6, y1, text=f"${low:,.0f}", anchor="se", fill=colors["subtext"], font=font)
+        for day, anchor in ((days[0], "nw"), (days[-1], "ne")):
+            canvas.create_text(x_of(day), y1 + 4, text=Date.fromordinal(day).isoformat(), anchor=anchor,
+                               fill=colors["subtext"], font=font)
+
+    def _draw_categories(self, left, top, right, bottom):
+        canvas, colors, font = self.canvas, self.colors, self.font
+        canvas.create_text(left + 12, top + 10, text="By category", anchor="nw", fill=colors["subtext"], font=font)
+        totals = sorted(((total, name) for name, total in self.tracker.total_expenses_by_categories().items()
+                         if total), reverse=True)
+        if not totals:
+            return
+        rows = max(1, min(self.max_categories, (bottom - top - 40) // 24))
+        if len(totals) > rows:
+            totals = totals[:rows - 1] + [(sum(total for total, _ in totals[rows - 1:]), "Other")]
+        largest = max(abs(total) for total, _ in totals) or 1.0
+        x0, x1 = left + 110, right - 86
+        y = top + 36
+        for total, name in totals:
+            label = name if len(name) <= 14 else name[:13] + "…"
+            canvas.create_text(x0 - 8, y + 9, text=label, anchor="e", fill=colors["text"], font=font)
+            canvas.create_rectangle(x0, y, x0 + max(1.0, abs(total) / largest * (x1 - x0)), y + 18,
+                                    fill=colors["bar"], outline="")
+            canvas.create_text(x1 + 80, y + 9, text=f"${total:,.2f}", anchor="e", fill=colors["text"], font=font)
+            y += 24
@@ -0,0 +1,341 @@
+#Non-interactive commands, for scripts, cron jobs and bank-sync tools.
+#
+#    python budget.py add 2024-05-01 "Coffee" 3.50 Personal Dining
+#    python budget.py remove 17 18
+#    python budget.py edit 17 --amount 4.20
+#    python budget.py totals [--start YYYY-MM-DD] [--end YYYY-MM-DD] [--monthly | --weekly]
+#    python budget.py check [--month YYYY-MM]
+#    python budget.py export [--format csv|jsonl|json] [--pivot month|quarter|year] [-o FILE]
+#    python budget.py batch [--input FILE]
+#
+#Each prints one JSON object on stdout (export writes its file, or stdout) and
+#sets the exit status: 0 on success, 1 on an error, with {"error": ...} printed.
+#
+#batch reads newline-delimited JSON commands from stdin, applies them all to one
+#loaded tracker and saves once at the end, printing one JSON result per line:
+#
+#    {"op": "add", "expense": {"date": ..., "description": ..., "amount": ..., "use": ..., "category": ...}}
+#    {"op": "add", "expenses": [{...}, ...]}
+#    {"op": "edit", "id": 17, "expense": {"amount": 4.2}}      only the fields given change
+#    {"op": "remove", "id": 17}
+#    {"op": "budget", "amount": 500}                           or with "category"/"use", "month"
+#    {"op": "totals"}, {"op": "totals", "start": ..., "end": ...}, {"op": "check", "month": ...}
+#
+#Results are {"ok": true, ...} or {"ok": false, "error": ...}; a command that
+#fails, for whatever reason, is skipped and the rest still run. A "ref" in a command is echoed in its
+#result. Nothing here prompts, clears the screen or starts a subprocess.
+
+import csv
+import json
+import math
+import sys
+
+from filelock import LockedError
+from store import FIELDS, Expense, date_to_ordinal
+
+EXPORT_FORMATS = ("csv", "jsonl", "json")
+
+
+def expense_json(expense):
+    return {"id": expense.id, **expense.to_dict()}
+
+
+def expense_values(data, current=None):
+    """Validated (date, description, amount, use, category) from a JSON object; raises ValueError.
+
+    With current (the values being patched), missing fields keep their value.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("An expense must be a JSON object")
+    unknown = set(data) - set(FIELDS) - {"id"}
+    if unknown:
+        raise ValueError(f"Unknown expense field(s): {', '.join(sorted(unknown))}")
+    values = []
+    for position, field in enumerate(FIELDS):
+        if field in data:
+            value = data[field]
+        elif current is not None:
+            value = current[position]
+        else:
+            raise ValueError(f"Missing expense field {field!r}")
+        if field == "amount":
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                raise ValueError(f"Invalid amount {value!r}")
+            value = float(value)
+        elif not isinstance(value, str) or not value.strip():
+            raise ValueError(f"Invalid {field} {value!r}")
+        elif field == "date" and date_to_ordinal(value) is None:
+            raise ValueError(f"Invalid date {value!r}, expected YYYY-MM-DD")
+        values.append(value)
+    return tuple(values)
+
+
+def optional_text(command, key):
+    """command[key] if it is a string, None if it is missing or null; raises ValueError otherwise."""
+    value = command.get(key)
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"Invalid {key} {value!r}, expected a string")
+    return value
+
+
+class Commands:
+    """The commands, as methods from a JSON object to a JSON-able result.
+
+    They raise ValueError (or KeyError for an unknown id) on bad input. `changed`
+    records whether any of them modified the tracker since it was loaded.
+    """
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.changed = False
+
+    def run(self, command):
+        """Apply one {"op": ...} command and return its result."""
+        if not isinstance(command, dict) or not isinstance(command.get("op"), str):
+            raise ValueError('A command must be a JSON object with an "op"')
+        method = getattr(self, "op_" + command["op"], None)
+        if method is None:
+            raise ValueError(f"Unknown op {command['op']!r}")
+        return method(command)
+
+    def op_add(self, command):
+        tracker = self.tracker
+        if "expenses" in command:
+            if not isinstance(command["expenses"], list):
+                raise ValueError('"expenses" must be a list')
+            rows = [expense_values(item) for item in command["expenses"]]
+            first = tracker.expenses.next_id
+            ids = list(range(first, first + tracker.add_expenses(rows)))
+        else:
+            expense = Expense(*expense_values(command.get("expense")))
+            tracker.add_expense(expense)
+            ids = [expense.id]
+        self.changed = True
+        return {"ids": ids}
+
+    def _expense(self, command):
+        expense_id = command.get("id")
+        if isinstance(expense_id, bool) or not isinstance(expense_id, int):
+            raise ValueError('"id" must be an expense id')
+        expense = self.tracker.get_expense(expense_id)
+        if expense is None:
+            raise KeyError(f"No expense with id {expense_id}")
+        return expense
+
+    def op_edit(self, command):
+        expense = self._expense(command)
+        values = expense_values(command.get("expense"), expense.values())
+        self.tracker.edit_expense_by_id(expense.id, *values)
+        self.changed = True
+        return {"expense": expense_json(expense)}
+
+    def op_remove(self, command):
+        expense = self._expense(command)
+        self.tracker.remove_expense_by_id(expense.id)
+        self.changed = True
+        return {"id": command["id"]}
+
+    def op_budget(self, command):
+        amount = command.get("amount")
+        if amount is not None and (isinstance(amount, bool) or not isinstance(amount, (int, float))):
+            raise ValueError(f"Invalid amount {amount!r}")
+        category, use, month = (optional_text(command, key) for key in ("category", "use", "month"))
+        tracker = self.tracker
+        if any(key in command for key in ("category", "use", "month")):
+            tracker.set_monthly_budget(amount, category=category, use=use, month=month)
+        else:
+            tracker.set_budget(amount)
+        self.changed = True
+        return self.op_check({})
+
+    def op_totals(self, command):
+        tracker = self.tracker
+        if "start" in command or "end" in command:
+            start = optional_text(command, "start") or "0001-01-01"
+            end = optional_text(command, "end") or "9999-12-31"
+            return {"start": start, "end": end, "total": tracker.total_between(start, end)}
+        if command.get("period") == "monthly":
+            return {"monthly": tracker.monthly_totals()}
+        if command.get("period") == "weekly":
+            return {"weekly": tracker.weekly_totals()}
+        return {"total": tracker.total_expenses(),
+                "by_use": tracker.total_expenses_by_uses(),
+                "by_category": tracker.total_expenses_by_categories()}
+
+    def op_check(self, command):
+        """Like the CLI's Check budget: the budget, what is left, and the monthly budgets."""
+        tracker = self.tracker
+        total = tracker.total_expenses()
+        budget = tracker.budget
+        return {"budget": budget, "total": total,
+                "remaining": None if budget is None else budget - total,
+                "exceeded": budget is not None and total > budget,
+                "monthly": [{"scope": s.scope, "name": s.name, "limit": s.limit, "spent": s.spent,
+                             "remaining": s.remaining, "exceeded": s.exceeded}
+                            for s in tracker.check_limits(optional_text(command, "month"))]}
+
+
+def run_batch(tracker, lines, out):
+    """Apply the NDJSON commands in lines, writing one JSON result line each.
+
+    Returns (how many failed, whether any changed the tracker).
+    """
+    commands = Commands(tracker)
+    failed = 0
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        command = None
+        try:
+            command = json.loads(line)
+            result = {"ok": True, **commands.run(command)}
+        except ValueError as e:
+            result = {"ok": False, "error": f"line {number}: {e}"}
+        except KeyError as e:
+            result = {"ok": False, "error": f"line {number}: {e.args[0]}"}
+        except Exception as e:
+            # Whatever a command trips over, it fails alone; the rest of the batch still runs
+            result = {"ok": False, "error": f"line {number}: {type(e).__name__}: {e}"}
+        if isinstance(command, dict) and "ref" in command:
+            result["ref"] = command["ref"]
+        failed += not result["ok"]
+        out.write(json.dumps(result) + "\n")
+    return failed, commands.changed
+
+
+def export(tracker, out, format="csv", pivot=None):
+    """Write every expense (or a pivot report by period, for csv) to the open text file out."""
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {format!r}")
+    tracker.load_history()
+    if pivot is not None:
+        if format != "csv":
+            raise ValueError("Pivot reports are exported as csv")
+        tracker.pivot_report(pivot).write_csv(out)
+        return
+    records = tracker.expenses.records()
+    if format == "csv":
+        writer = csv.writer(out)
+        writer.writerow(("id",) + FIELDS)
+        writer.writerows([record["id"], *(record[field] for field in FIELDS)] for record in records)
+    elif format == "jsonl":
+        encode = json.JSONEncoder().encode
+        out.writelines(encode(record) + "\n" for record in records)
+    else:
+        json.dump(list(records), out)
+        out.write("\n")
+
+
+def add_arguments(parser):
+    """Add the subcommands to budget.py's argument parser."""
+    subcommands = parser.add_subparsers(dest="command", metavar="COMMAND",
+                                        description="run one command and exit instead of showing the menu")
+    add = subcommands.add_parser("add", help="add an expense")
+    add.add_argument("date", help="YYYY-MM-DD")
+    add.add_argument("description")
+    add.add_argument("amount", type=float)
+    add.add_argument("use")
+    add.add_argument("category")
+    remove = subcommands.add_parser("remove", help="remove expenses by id")
+    remove.add_argument("ids", nargs="+", type=int, metavar="ID")
+    edit = subcommands.add_parser("edit", help="change fields of an expense")
+    edit.add_argument("id", type=int)
+    for field in FIELDS:
+        edit.add_argument(f"--{field}", type=float if field == "amount" else str)
+    totals = subcommands.add_parser("totals", help="totals overall, between dates, or per month or week")
+    totals.add_argument("--start", help="YYYY-MM-DD")
+    totals.add_argument("--end", help="YYYY-MM-DD")
+    period = totals.add_mutually_exclusive_group()
+    period.add_argument("--monthly", dest="period", action="store_const", const="monthly")
+    period.add_argument("--weekly", dest="period", action="store_const", const="weekly")
+    check = subcommands.add_parser("check", help="the budget and the monthly budgets")
+    check.add_argument("--month", help="YYYY-MM (this month by default)")
+    export_parser = subcommands.add_parser("export", help="write every expense, or a pivot report")
+    export_parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    export_parser.add_argument("--pivot", choices=("month", "quarter", "year"),
+                               help="a pivot report by period x category x use instead (csv)")
+    export_parser.add_argument("-o", "--output", help="file to write (stdout by default)")
+    batch = subcommands.add_parser("batch", help="apply newline-delimited JSON commands, saving once")
+    batch.add_argument("--input", help="file to read the commands from (stdin by default)")
+    for subparser in subcommands.choices.values():
+        subparser.add_argument("--expenses", help="expense file (default from BUDGET_DATABASE or expenses.json)")
+        subparser.add_argument("--budget", help="budget file (default from BUDGET_DATABASE or budget.json)")
+
+
+def _command(args):
+    """The batch command equivalent to a subcommand's arguments."""
+    if args.command == "add":
+        return {"op": "add", "expense": {"date": args.date, "description": args.description,
+                                         "amount": args.amount, "use": args.use, "category": args.category}}
+    if args.command == "edit":
+        return {"op": "edit", "id": args.id,
+                "expense": {field: getattr(args, field) for field in FIELDS if getattr(args, field) is not None}}
+    if args.command == "totals":
+        return {"op": "totals", **{key: value for key, value in
+                                   (("start", args.start), ("end", args.end), ("period", args.period))
+                                   if value is not None}}
+    return {"op": "check", **({"month": args.month} if args.month else {})}
+
+
+def main(tracker, args, out=sys.stdout):
+    """Lock and load tracker, run the subcommand in args, save and close; returns the exit status.
+
+    If the expense or budget file exists but cannot be loaded, nothing runs and
+    nothing is saved.
+    """
+    if args.expenses:
+        tracker.expenses_file = args.expenses
+    if args.budget:
+        tracker.budget_file = args.budget
+    try:
+        tracker.lock()
+    except LockedError as e:
+        out.write(json.dumps({"error": str(e)}) + "\n")
+        return 1
+    try:
+        # Nothing runs against a file that could not be read, so nothing can overwrite it
+        if not (tracker.load_expenses() and tracker.load_budget()):
+            out.write(json.dumps({"error": "Could not load the expenses or the budget"}) + "\n")
+            return 1
+        return _run(tracker, args, out)
+    finally:
+        tracker.close()
+
+
+def _run(tracker, args, out):
+    status = 0
+    try:
+        if args.command == "batch":
+            if args.input:
+                with open(args.input, encoding="utf-8") as lines:
+                    failed, changed = run_batch(tracker, lines, out)
+            else:
+                failed, changed = run_batch(tracker, sys.stdin, out)
+            status = 1 if failed else 0
+        elif args.command == "export":
+            if args.output:
+                with open(args.output, "w", newline="", encoding="utf-8") as file:
+                    export(tracker, file, args.format, args.pivot)
+            else:
+                export(tracker, out, args.format, args.pivot)
+            changed = False
+        else:
+            commands = Commands(tracker)
+            if args.command == "remove":
+                result = {"removed": [], "missing": []}
+                for expense_id in args.ids:
+                    found = tracker.remove_expense_by_id(expense_id)
+                    result["removed" if found else "missing"].append(expense_id)
+                commands.changed = bool(result["removed"])
+                status = 1 if result["missing"] else 0
+            else:
+                result = commands.run(_command(args))
+            changed = commands.changed
+            out.write(json.dumps(result) + "\n")
+    except (OSError, ValueError, KeyError) as e:
+        out.write(json.dumps({"error": str(e.args[0]) if isinstance(e, KeyError) else str(e)}) + "\n")
+        return 1
+    if changed and not (tracker.save_expenses() and tracker.save_budget()):
+        out.write(json.dumps({"error": "Could not save the changes"}) + "\n")
+        return 1
+    return status
@@ -0,0 +1,190 @@
+#Windowed Treeview for the expense list.
+#
+#Only the rows inside the viewport are materialised as Treeview items, so a
+#redraw costs a handful of Tk calls however long the history is. Items use the
+#expense id as iid, which does not change when other rows are added or removed,
+#nor when the store compacts its rows. Store changes arrive through a listener
+#and are applied as diffs: an edit updates one item, while an add or a remove
+#moves at most the rows of the viewport. Redraws are deferred to the next idle
+#moment, so a burst of changes costs one redraw and the search index has caught
+#up with the store before the filter is matched again. The scrollbar and mouse
+#wheel are driven by hand because the Treeview itself never holds more than one
+#screen of rows. Scrolling up past the first row calls on_scroll_top, which the
+#GUI uses to load older months of a partitioned store.
+
+from bisect import bisect_left
+
+
+class ExpenseTable:
+    def __init__(self, tree, scrollbar, tracker, height):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.tracker = tracker
+        self.height = height
+        self.store = None
+        self.query = ""
+        self.matches = []
+        self.top = 0
+        # Expense ids of the items in the Treeview, and of the selected expense
+        self.shown = []
+        self.selected = None
+        self.stale = False
+        self.pending = False
+        # Called when the user scrolls up from the top of the unfiltered list
+        self.on_scroll_top = None
+
+        scrollbar.configure(command=self.yview)
+        tree.configure(yscrollcommand=lambda *_: None)
+        tree.bind("<<TreeviewSelect>>", self._on_select)
+        tree.bind("<MouseWheel>", lambda e: self.scroll(-3 if e.delta > 0 else 3, "units"))
+        tree.bind("<Button-4>", lambda e: self.scroll(-3, "units"))
+        tree.bind("<Button-5>", lambda e: self.scroll(3, "units"))
+        tree.bind("<Prior>", lambda e: self.scroll(-1, "pages"))
+        tree.bind("<Next>", lambda e: self.scroll(1, "pages"))
+        tree.bind("<Up>", lambda e: self._step(-1))
+        tree.bind("<Down>", lambda e: self._step(1))
+
+    # --- data ---
+
+    def attach(self, store, listen=True):
+        """Show store and, if listen, follow its changes as diffs.
+
+        Call again whenever the tracker switches to another store, e.g. after loading.
+        """
+        if self.store is not None and self.on_change in self.store.listeners:
+            self.store.listeners.remove(self.on_change)
+        if self.selected not in store.rows_by_id:
+            self.selected = None
+        self.store = store
+        if listen:
+            store.listeners.append(self.on_change)
+        self.reset()
+
+    def rows(self):
+        # Both lists are in ascending row order, which is display order
+        return self.matches if self.query else self.store.order
+
+    def set_query(self, query):
+        self.query = query.strip()
+        self.top = 0
+        self._match()
+        self.render()
+
+    def _match(self):
+        self.matches = self.tracker.search_index.rows(self.query) if self.query else []
+
+    def on_change(self, op, index, row, values, old):
+        # Row numbers change on "compact", but the ids the items are keyed by do not
+        if op == "edit" and self.store.ids[row] in self.shown:
+            self.tree.item(self.store.ids[row], values=self.format(row))
+        self.stale = True
+        if not self.pending:
+            self.pending = True
+            self.tree.after_idle(self.render)
+
+    # --- rendering ---
+
+    def format(self, row):
+        e = self.store.view(row)
+        return (e.date, e.description, f"${e.amount:.2f}", e.use, e.category)
+
+    def reset(self):
+        """Drop every item and draw the viewport again from scratch."""
+        self.tree.delete(*self.tree.get_children())
+        self.shown = []
+        self.stale = True
+        self.render()
+
+    def render(self):
+        self.pending = False
+        if self.stale:
+            self.stale = False
+            if self.query:
+                self._match()
+        rows = self.rows()
+        total = len(rows)
+        self.top = max(0, min(self.top, total - self.height))
+        ids = self.store.ids
+        window = rows[self.top:self.top + self.height]
+        want = [ids[row] for row in window]
+        tree = self.tree
+        if want != self.shown:
+            keep = set(want)
+            gone = [expense_id for expense_id in self.shown if expense_id not in keep]
+            if gone:
+                tree.delete(*gone)
+            present = set(self.shown) - set(gone)
+            for position, (row, expense_id) in enumerate(zip(window, want)):
+                if expense_id in present:
+                    tree.move(expense_id, "", position)
+                else:
+                    tree.insert("", position, iid=expense_id, values=self.format(row))
+            self.shown = want
+        for position, expense_id in enumerate(want):
+            tree.item(expense_id, tags=("odd" if (self.top + position) % 2 == 0 else "even",))
+        if self.selected in self.shown:
+            if tree.selection() != (str(self.selected),):
+                tree.selection_set(self.selected)
+        elif tree.selection():
+            tree.selection_remove(*tree.selection())
+        if total:
+            self.scrollbar.set(self.top / total, min(1.0, (self.top + self.height) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    # --- scrolling and selection ---
+
+    def yview(self, action, amount, unit=None):
+        if action == "moveto":
+            if float(amount) <= 0:
+                self._reached_top()
+            self.top = int(float(amount) * len(self.rows()))
+            self.render()
+        else:
+            self.scroll(int(amount), unit)
+
+    def scroll(self, amount, unit):
+        if amount < 0 and self.top == 0:
+            self._reached_top()
+        self.top += amount * (self.height if unit == "pages" else 1)
+        self.render()
+        return "break"
+
+    def _reached_top(self):
+        if self.on_scroll_top is not None and not self.query:
+            self.on_scroll_top()
+
+    def see(self, row):
+        """Scroll so that row is visible."""
+        position = bisect_left(self.rows(), row)
+        if position < self.top:
+            self.top = position
+        elif position >= self.top + self.height:
+            self.top = position - self.height + 1
+        self.render()
+
+    def select(self, row):
+        self.selected = self.store.ids[row]
+        self.see(row)
+
+    def _on_select(self, _event):
+        selection = self.tree.selection()
+        if selection:
+            self.selected = int(selection[0])
+
+    def _step(self, delta):
+        rows = self.rows()
+        if not rows:
+            return "break"
+        row = self.store.rows_by_id.get(self.selected)
+        if row is None:
+            position = self.top
+        else:
+            position = bisect_left(rows, row) + delta
+        position = max(0, min(position, len(rows) - 1))
+        self.select(rows[position])
+        return "break"
+
+    def selected_id(self):
+        """Id of the selected expense, or None if nothing (still existing) is selected."""
+        return self.selected if self.selected in self.store.rows_by_id else None
@@ -0,0 +1,80 @@
+#Advisory file locks, so only one process at a time writes a tracker's files.
+#
+#Two trackers saving to the same expenses.json would each append their own
+#changes to the journal and overwrite each other's snapshots. BudgetTracker.lock()
+#takes a FileLock on "<file>.lock" for each file it saves to and holds it until
+#close(). The operating system drops the lock when the process exits, cleanly or
+#not, so a lock file left behind never needs cleaning up; it only holds the
+#owner's pid for the error message.
+
+import os
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+
+class LockedError(OSError):
+    """The file is locked by another process."""
+
+
+class FileLock:
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    @property
+    def locked(self):
+        return self._fd is not None
+
+    def acquire(self):
+        """Take the lock, or raise LockedError at once if another process holds it."""
+        if self._fd is not None:
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            owner = _read_owner(fd)
+            os.close(fd)
+            raise LockedError(f"{self.path} is locked by another process"
+                              + (f" (pid {owner})" if owner else "")) from None
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+
+    def release(self):
+        fd, self._fd = self._fd, None
+        if fd is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        os.close(fd)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def lock_path(filename):
+    return filename + ".lock"
+
+
+def _read_owner(fd):
+    try:
+        return os.pread(fd, 32, 0).decode().strip() or None
+    except (AttributeError, OSError, UnicodeDecodeError):
+        # No pread on Windows, where the locked byte cannot be read anyway
+        return None
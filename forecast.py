@@ -0,0 +1,154 @@
+#Expense forecasting: bucket spending into daily/weekly/monthly series per
+#category and per use, project each series ahead and estimate when the budget
+#runs out. The number crunching goes through the analytics backend, so with
+#BUDGET_ANALYTICS=numpy every series is projected in one matrix operation.
+#Recurring expenses (see recurring.py) are known ahead, so they are not
+#projected: what each rule is scheduled to cost in a period is added on top.
+
+from datetime import date as Date
+
+from analytics import get_backend
+from store import month_of, month_start, week_of
+
+PERIODS = ("daily", "weekly", "monthly")
+METHODS = ("moving_average", "linear_trend", "seasonal_naive")
+SEASONS = {"daily": 7, "weekly": 52, "monthly": 12}
+
+
+def bucket_of(ordinal, period):
+    if period == "daily":
+        return ordinal
+    if period == "weekly":
+        return week_of(ordinal)
+    return month_of(ordinal)
+
+
+def bucket_days(bucket, period):
+    """First and last ordinal of a bucket."""
+    if period == "daily":
+        return bucket, bucket
+    if period == "weekly":
+        return bucket * 7 + 1, bucket * 7 + 7
+    return month_start(bucket), month_start(bucket + 1) - 1
+
+
+def bucket_label(bucket, period):
+    if period == "daily":
+        return Date.fromordinal(bucket).isoformat()
+    if period == "weekly":
+        return Date.fromordinal(bucket * 7 + 1).isoformat()
+    return f"{bucket // 12:04d}-{bucket % 12 + 1:02d}"
+
+
+class Forecast:
+    """Projected spend for the `horizon` periods after the last one with expenses.
+
+    total, by_category and by_use hold one projected amount per entry of
+    periods. run_out is the label of the period in which projected spending
+    uses up the remaining budget: None when no budget is set or spending is
+    projected to stop, "exceeded" when the budget is already used up.
+    """
+
+    def __init__(self, period, method, periods, total, by_category, by_use, run_out):
+        self.period = period
+        self.method = method
+        self.periods = periods
+        self.total = total
+        self.by_category = by_category
+        self.by_use = by_use
+        self.run_out = run_out
+
+
+def _run_out(remaining, projected, last_bucket, period):
+    if remaining is None:
+        return None
+    if remaining <= 0:
+        return "exceeded"
+    spent = 0.0
+    for step, amount in enumerate(projected, 1):
+        spent += amount
+        if spent >= remaining:
+            return bucket_label(last_bucket + step, period)
+    # Beyond the horizon: carry on at the average projected rate
+    rate = sum(projected) / len(projected) if projected else 0.0
+    if rate <= 0:
+        return None
+    steps = len(projected) + int((remaining - spent) // rate) + 1
+    return bucket_label(last_bucket + steps, period)
+
+
+def _add_scheduled(recurring, last, period, total, by_category, by_use):
+    for rule in recurring:
+        amounts = [rule.total_between(*bucket_days(last + step, period)) for step in range(1, len(total) + 1)]
+        if not any(amounts):
+            continue
+        key = next((known for known in by_use if known.lower() == rule.use.lower()), rule.use)
+        for values, name in ((by_category, rule.category), (by_use, key)):
+            values[name] = [a + b for a, b in zip(values.get(name, [0.0] * len(total)), amounts)]
+        total[:] = [a + b for a, b in zip(total, amounts)]
+
+
+def forecast(store, budget=None, period="monthly", method="moving_average", horizon=3, window=3,
+             backend=None, recurring=None):
+    if period not in PERIODS:
+        raise ValueError(f"Unknown forecast period: {period}")
+    if method not in METHODS:
+        raise ValueError(f"Unknown forecast method: {method}")
+    backend = backend or get_backend()
+
+    # Bucket every dated row; rows whose date is not YYYY-MM-DD are not in the date index
+    cache = {}
+    buckets, uses, categories, amounts = [], [], [], []
+    for key in store.date_index:
+        ordinal = key >> 32
+        row = key & 0xFFFFFFFF
+        bucket = cache.get(ordinal)
+        if bucket is None:
+            bucket = cache[ordinal] = bucket_of(ordinal, period)
+        buckets.append(bucket)
+        uses.append(store.uses[row])
+        categories.append(store.categories[row])
+        amounts.append(store.amounts[row])
+
+    remaining = None if budget is None else budget - store.total
+    if not buckets and not recurring:
+        return Forecast(period, method, [], [], {}, {}, _run_out(remaining, [], 0, period))
+    if not buckets:
+        # Only recurring expenses: their schedule from today is the whole forecast
+        last = bucket_of(Date.today().toordinal(), period)
+        by_category, by_use, total = {}, {}, [0.0] * horizon
+        _add_scheduled(recurring, last, period, total, by_category, by_use)
+        periods = [bucket_label(last + step, period) for step in range(1, horizon + 1)]
+        return Forecast(period, method, periods, total, by_category, by_use, _run_out(remaining, total, last, period))
+
+    # The date index is sorted, so the buckets are too
+    first = buckets[0]
+    last = buckets[-1]
+    latest = recurring.last_date() if recurring else None
+    if latest is not None:
+        # Recurring expenses are spending too: project from after the latest one so far
+        last = max(last, bucket_of(latest, period))
+    width = last - first + 1
+    offsets = [bucket - first for bucket in buckets]
+    category_names = store.category_table.values
+    use_names = store.use_table.values
+
+    category_matrix = backend.bucket_matrix(offsets, categories, amounts, width, len(category_names))
+    use_matrix = backend.bucket_matrix(offsets, uses, amounts, width, len(use_names))
+    total_matrix = backend.bucket_matrix(offsets, [0] * len(offsets), amounts, width, 1)
+
+    args = (method, horizon, window, SEASONS[period])
+    by_category = dict(zip(category_names, backend.project(category_matrix, *args)))
+    # Uses are merged case-insensitively, like total_expenses_by_use
+    by_use = {}
+    for name, values in zip(use_names, backend.project(use_matrix, *args)):
+        key = next((known for known in by_use if known.lower() == name.lower()), name)
+        by_use[key] = [a + b for a, b in zip(by_use.get(key, [0.0] * horizon), values)]
+    total = list(backend.project(total_matrix, *args)[0])
+    if recurring:
+        _add_scheduled(recurring, last, period, total, by_category, by_use)
+
+    periods = [bucket_label(last + step, period) for step in range(1, horizon + 1)]
+    return Forecast(period, method, periods, total,
+                    {name: values for name, values in by_category.items() if any(values)},
+                    by_use, _run_out(remaining, total, last, period))
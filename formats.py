@@ -0,0 +1,210 @@
+#Readers and writers for the expense snapshot formats.
+#
+#  .json   the legacy format: one JSON array of expense objects
+#  .jsonl  JSON Lines: one expense object per line, cheap to append and stream
+#  .bin    binary: the store's fixed-width columns as they are in memory, a
+#          string table for descriptions, and a JSON header with the string
+#          tables, totals and rollups (see BinarySnapshot)
+#
+#The JSON formats are read incrementally, so a caller can start using rows before
+#the whole file has been parsed; the reader works out which one it is from the
+#first byte. A binary snapshot is memory-mapped instead and used in place.
+#
+#Binary layout: an 8-byte magic, the header length as a little-endian uint64,
+#the UTF-8 JSON header, then the sections, each starting on an 8-byte boundary.
+#The header's "sections" maps each name to [typecode, itemsize, offset, bytes],
+#offsets counted from the end of the padded header. Numbers are in the byte
+#order of the machine that wrote the file, which the header records.
+
+import codecs
+import json
+import mmap
+import re
+import struct
+import sys
+import zlib
+from array import array
+from itertools import accumulate
+
+from store import COLUMNS, StringTable
+
+_SKIP = re.compile(r"[\s,]*")
+_MAGIC = b"BUDGETX1"
+_PREAMBLE = struct.Struct("<8sQ")
+_ALIGN = 8
+
+
+def is_jsonl(filename):
+    return filename.endswith(".jsonl")
+
+
+def is_binary(filename):
+    return filename.lower().endswith(".bin")
+
+
+def snapshot_chunks(store, filename):
+    """Yield the snapshot for store in the format chosen by filename: str chunks, or bytes for .bin."""
+    if is_binary(filename):
+        yield from binary_chunks(store)
+        return
+    encode = json.JSONEncoder().encode
+    if is_jsonl(filename):
+        for record in store.records():
+            yield encode(record) + "\n"
+        return
+    # Same text json.dump(list_of_dicts, file) produces, without building the list
+    yield "["
+    for row, record in enumerate(store.records()):
+        yield (", " if row else "") + encode(record)
+    yield "]"
+
+
+class RecordReader:
+    """Iterate the expense records of a JSON array or JSON Lines file opened in binary mode.
+
+    The file is read and decoded in chunks, so records come out before the whole
+    file is in memory. The CRC32 of every byte read is available as `crc` once iteration finishes,
+    which is what the journal needs to check it belongs to this snapshot.
+    """
+
+    def __init__(self, file, chunk_size=1 << 20):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.crc = 0
+        self.eof = False
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+
+    def read(self):
+        data = self.file.read(self.chunk_size)
+        self.crc = zlib.crc32(data, self.crc)
+        self.eof = not data
+        return self._decoder.decode(data, final=self.eof)
+
+    def __iter__(self):
+        buf = self.read()
+        pos = _SKIP.match(buf).end()
+        while pos == len(buf) and not self.eof:
+            buf = self.read()
+            pos = _SKIP.match(buf).end()
+        if buf[pos:pos + 1] == "[":
+            return self._iter_array(buf, pos + 1)
+        return self._iter_lines(buf[pos:])
+
+    def _iter_array(self, buf, pos):
+        decode = json.JSONDecoder().raw_decode
+        while True:
+            pos = _SKIP.match(buf, pos).end()
+            if pos == len(buf):
+                if self.eof:
+                    raise ValueError("Unexpected end of expense array")
+                buf, pos = self.read(), 0
+                continue
+            if buf[pos] == "]":
+                # Read to the end so the crc covers the whole file
+                while not self.eof:
+                    self.read()
+                return
+            try:
+                value, end = decode(buf, pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                # The object straddles the chunk boundary
+                buf, pos = buf[pos:] + self.read(), 0
+                continue
+            yield value
+            pos = end
+
+    def _iter_lines(self, buf):
+        while True:
+            lines = buf.split("\n")
+            buf = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+            if self.eof:
+                break
+            buf += self.read()
+        if buf.strip():
+            yield json.loads(buf)
+
+
+def _padding(size):
+    return b"\0" * (-size % _ALIGN)
+
+
+def binary_chunks(store):
+    """Yield the bytes of a binary snapshot of store."""
+    if store.dead:
+        store = store.copy()
+    descriptions = StringTable()
+    description_codes = array("I", map(descriptions.encode, store.descriptions))
+    # Offsets are in characters, so the table is decoded once and sliced
+    string_offsets = array("I", accumulate(map(len, descriptions.values), initial=0))
+    sections = [(name, getattr(store, name)) for name, _ in COLUMNS]
+    sections += [("descriptions", description_codes), ("string_offsets", string_offsets),
+                 ("strings", "".join(descriptions.values).encode())]
+    layout = {}
+    offset = 0
+    for name, data in sections:
+        typecode, itemsize = (data.typecode, data.itemsize) if isinstance(data, array) else ("B", 1)
+        size = len(data) * itemsize
+        layout[name] = [typecode, itemsize, offset, size]
+        offset += size + len(_padding(size))
+    header = {"version": 1, "byteorder": sys.byteorder, "rows": len(store), "next_id": store.next_id,
+              "uses": store.use_table.values, "categories": store.category_table.values,
+              "raw_dates": store.raw_dates.values,
+              "total": store.total, "use_sums": store.use_sums, "category_sums": store.category_sums,
+              "months": [[month, total, store.month_counts[month]] for month, total in store.month_totals.items()],
+              "weeks": [[week, total, store.week_counts[week]] for week, total in store.week_totals.items()],
+              "cells": [[*cell, total, store.cell_counts[cell]] for cell, total in store.cell_totals.items()],
+              "sections": layout}
+    header = json.dumps(header, separators=(",", ":")).encode()
+    yield _PREAMBLE.pack(_MAGIC, len(header)) + header + _padding(_PREAMBLE.size + len(header))
+    for name, data in sections:
+        data = data.tobytes() if isinstance(data, array) else data
+        yield data + _padding(len(data))
+
+
+class BinarySnapshot:
+    """A binary snapshot file, memory-mapped read-only.
+
+    column() returns zero-copy memoryviews of the mapped sections, which
+    ExpenseStore.map_snapshot adopts as its columns. The mapping lasts as long
+    as any view of it, so there is nothing to close.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as file:
+            try:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # An empty file cannot be mapped
+                raise ValueError(f"{filename} is not a binary expense snapshot") from None
+        if len(self._map) < _PREAMBLE.size:
+            raise ValueError(f"{filename} is not a binary expense snapshot")
+        magic, length = _PREAMBLE.unpack_from(self._map)
+        if magic != _MAGIC:
+            raise ValueError(f"{filename} is not a binary expense snapshot")
+        self.header = json.loads(self._map[_PREAMBLE.size:_PREAMBLE.size + length])
+        if self.header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{filename} was written on a {self.header['byteorder']}-endian machine")
+        self._start = _PREAMBLE.size + length + len(_padding(_PREAMBLE.size + length))
+        for name, (typecode, itemsize, offset, size) in self.header["sections"].items():
+            if array(typecode).itemsize != itemsize or self._start + offset + size > len(self._map):
+                raise ValueError(f"{filename}: section {name} does not fit this machine or the file")
+        # What the journal needs to check it belongs to this snapshot
+        self.crc = zlib.crc32(self._map)
+
+    def column(self, name):
+        typecode, _, offset, size = self.header["sections"][name]
+        start = self._start + offset
+        view = memoryview(self._map)[start:start + size]
+        return view if typecode == "B" else view.cast(typecode)
+
+    def strings(self):
+        """The description string table."""
+        offsets = self.column("string_offsets")
+        text = str(self.column("strings"), "utf-8")
+        return [text[start:end] for start, end in zip(offsets, offsets[1:])]
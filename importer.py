@@ -0,0 +1,374 @@
+#Bulk import of bank statements (CSV and OFX).
+#
+#read_csv() and read_ofx() stream a statement and yield chunks of validated
+#(date, description, amount, use, category) rows, with the problems found in
+#each chunk. Large CSV files are split at line boundaries and parsed by a pool
+#of processes. import_statement() drops rows the tracker already has, matched by
+#a hash of date, description and amount, and passes the rest to
+#BudgetTracker.add_expenses as a single batch.
+#
+#Statements list money going out as negative amounts; those become expenses and
+#money coming in is skipped. Pass debits_negative=False for files that list
+#expenses as positive amounts, such as the tracker's own exports.
+
+import csv
+import math
+import os
+import re
+from collections import Counter
+from datetime import datetime
+
+from partitions import month_key
+from store import as_ordinal
+
+DEFAULT_USE = "Personal"
+DEFAULT_CATEGORY = "Imported"
+
+# Files at least this big are parsed by several processes
+PARALLEL_BYTES = 16 << 20
+
+# Header names recognised for each field, compared case-insensitively
+COLUMNS = {
+    "date": ("date", "transaction date", "posted date", "posting date", "booking date", "value date"),
+    "description": ("description", "payee", "name", "details", "merchant", "narrative", "memo"),
+    "amount": ("amount", "transaction amount", "value"),
+    "debit": ("debit", "withdrawal", "withdrawals", "paid out", "money out"),
+    "credit": ("credit", "deposit", "deposits", "paid in", "money in"),
+    "use": ("use",),
+    "category": ("category",),
+}
+
+_AMOUNT_JUNK = re.compile(r"[^0-9.]")
+_OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+
+class ImportReport:
+    """Outcome of an import: rows added, duplicates and credits skipped, and errors."""
+
+    # Only the first this many errors are kept; `invalid` counts all of them
+    max_errors = 100
+
+    def __init__(self):
+        self.added = 0
+        self.duplicates = 0
+        self.credits = 0
+        self.invalid = 0
+        self.errors = []
+
+    def add_errors(self, errors):
+        self.invalid += len(errors)
+        room = self.max_errors - len(self.errors)
+        if room > 0:
+            self.errors.extend(errors[:room])
+
+    def __str__(self):
+        text = (f"Imported {self.added} expenses, skipped {self.duplicates} duplicates, "
+                f"{self.credits} credits and {self.invalid} invalid rows.")
+        for line, message in self.errors:
+            text += f"\n  line {line}: {message}"
+        if self.invalid > len(self.errors):
+            text += f"\n  ... and {self.invalid - len(self.errors)} more"
+        return text
+
+
+class RowParser:
+    """Validate raw statement fields into expense rows.
+
+    Dates repeat a lot in statements, so each distinct one is parsed only once.
+    """
+
+    def __init__(self, use=DEFAULT_USE, category=DEFAULT_CATEGORY, debits_negative=True,
+                 date_format=None):
+        self.use = use
+        self.category = category
+        self.debits_negative = debits_negative
+        self.date_format = date_format
+        self._dates = {}
+
+    def date(self, text):
+        """The YYYY-MM-DD form of text, or None if it is not a date."""
+        try:
+            return self._dates[text]
+        except KeyError:
+            pass
+        value = text.strip()
+        try:
+            if self.date_format:
+                iso = datetime.strptime(value, self.date_format).date().isoformat()
+            else:
+                # Accepts YYYY-MM-DD, and the YYYYMMDD[HHMMSS...] dates OFX uses
+                digits = value[:8] if value[:8].isdigit() else value
+                parsed = datetime.strptime(digits, "%Y%m%d" if digits.isdigit() else "%Y-%m-%d")
+                iso = parsed.date().isoformat()
+        except ValueError:
+            iso = None
+        self._dates[text] = iso
+        return iso
+
+    @staticmethod
+    def amount(text):
+        """Parse amounts like -12.50, "1,234.00", "$12.50" or "(12.50)"; None if invalid."""
+        try:
+            value = float(text)
+        except ValueError:
+            text = text.strip()
+            negative = text.startswith(("-", "(")) or text.endswith("-")
+            try:
+                value = float(_AMOUNT_JUNK.sub("", text))
+            except ValueError:
+                return None
+            if negative:
+                value = -value
+        return value if math.isfinite(value) else None
+
+    def expense(self, date, description, amount):
+        """Return (row or None, error or None, is_credit) for one statement line."""
+        # The cache lookup and plain float() cover nearly every row without a call
+        iso = self._dates.get(date) or self.date(date)
+        if iso is None:
+            return None, f"invalid date {date!r}", False
+        try:
+            value = float(amount)
+        except ValueError:
+            value = self.amount(amount)
+        if value is None or not math.isfinite(value):
+            return None, f"invalid amount {amount!r}", False
+        if self.debits_negative:
+            value = -value
+        if value <= 0:
+            return None, None, True
+        description = " ".join(description.split())
+        if not description:
+            return None, "missing description", False
+        return (iso, description, value, self.use, self.category), None, False
+
+
+def find_columns(header):
+    """Map field name -> column index from a CSV header; raises ValueError if unusable."""
+    names = [name.strip().lower() for name in header]
+    columns = {}
+    for field, aliases in COLUMNS.items():
+        for alias in aliases:
+            if alias in names:
+                columns[field] = names.index(alias)
+                break
+    if "date" not in columns or "description" not in columns or \
+            "amount" not in columns and "debit" not in columns:
+        raise ValueError(f"Unrecognised statement header: {', '.join(header)}")
+    return columns
+
+
+def _parse_csv_rows(records, columns, parser, first_line):
+    """Parse csv records; returns (rows, errors, credits)."""
+    date_col = columns["date"]
+    description_col = columns["description"]
+    amount_col = columns.get("amount")
+    debit_col = columns.get("debit")
+    credit_col = columns.get("credit")
+    use_col = columns.get("use")
+    category_col = columns.get("category")
+    expense = parser.expense
+    rows, errors = [], []
+    credits = 0
+    for line, record in enumerate(records, first_line):
+        if not record:
+            continue
+        try:
+            if amount_col is not None:
+                amount = record[amount_col]
+            else:
+                # A debit is money out, so it becomes a negative amount
+                debit = record[debit_col].strip()
+                amount = "-" + debit if debit else record[credit_col] if credit_col is not None else ""
+                if not amount:
+                    continue
+            row, error, credit = expense(record[date_col], record[description_col], amount)
+        except IndexError:
+            row, error, credit = None, "too few columns", False
+        if row is not None:
+            if use_col is not None or category_col is not None:
+                use = record[use_col].strip() if use_col is not None and len(record) > use_col else ""
+                category = record[category_col].strip() \
+                    if category_col is not None and len(record) > category_col else ""
+                row = row[:3] + (use or parser.use, category or parser.category)
+            rows.append(row)
+        elif error is not None:
+            errors.append((line, error))
+        elif credit:
+            credits += 1
+    return rows, errors, credits
+
+
+def _read_header(filename):
+    """The header fields and the byte offset where the data starts."""
+    with open(filename, "rb") as file:
+        line = file.readline()
+    return next(csv.reader([line.decode("utf-8-sig", errors="replace")]), []), len(line)
+
+
+def _split(filename, start, pieces):
+    """Byte ranges covering filename from start, each ending just after a newline."""
+    size = os.path.getsize(filename)
+    step = max((size - start) // pieces, 1)
+    bounds = [start]
+    with open(filename, "rb") as file:
+        while bounds[-1] + step < size:
+            file.seek(bounds[-1] + step)
+            file.readline()
+            if file.tell() >= size:
+                break
+            bounds.append(file.tell())
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def _parse_csv_range(filename, start, end, columns, options):
+    # Runs in a worker process
+    with open(filename, "rb") as file:
+        file.seek(start)
+        lines = file.read(end - start).decode("utf-8", errors="replace").splitlines()
+    rows, errors, credits = _parse_csv_rows(csv.reader(lines), columns, RowParser(**options), 1)
+    return rows, errors, credits, len(lines)
+
+
+def read_csv(filename, chunk_rows=50000, processes=None, **options):
+    """Yield (rows, errors, credits) chunks from a CSV statement.
+
+    options go to RowParser. processes sets how many worker processes parse
+    the file; by default files of PARALLEL_BYTES or more use every CPU. The
+    parallel path assumes no quoted field spans several lines, which holds for
+    bank exports; pass processes=1 otherwise. Error line numbers count the
+    header as line 1.
+    """
+    header, offset = _read_header(filename)
+    columns = find_columns(header)
+    if "amount" not in columns:
+        # Debit/credit columns: the debits are turned into negative amounts
+        options = dict(options, debits_negative=True)
+    if processes is None:
+        processes = (os.cpu_count() or 1) if os.path.getsize(filename) >= PARALLEL_BYTES else 1
+
+    if processes > 1:
+        # Imported here: multiprocessing is only needed for big files
+        from concurrent.futures import ProcessPoolExecutor
+        ranges = _split(filename, offset, processes * 4)
+        line = 2
+        with ProcessPoolExecutor(processes) as pool:
+            results = pool.map(_parse_csv_range, *zip(*[(filename, start, end, columns, options)
+                                                       for start, end in ranges]))
+            for rows, errors, credits, lines in results:
+                yield rows, [(line + n - 1, message) for n, message in errors], credits
+                line += lines
+        return
+
+    parser = RowParser(**options)
+    with open(filename, newline="", encoding="utf-8-sig", errors="replace") as file:
+        reader = csv.reader(file)
+        next(reader, None)
+        line = 2
+        while True:
+            records = [record for _, record in zip(range(chunk_rows), reader)]
+            if not records:
+                return
+            yield _parse_csv_rows(records, columns, parser, line)
+            line += len(records)
+
+
+def read_ofx(filename, chunk_rows=50000, **options):
+    """Yield (rows, errors, credits) chunks from an OFX/QFX statement (SGML or XML flavour)."""
+    parser = RowParser(**options)
+    rows, errors = [], []
+    credits = 0
+    transaction = None
+    with open(filename, encoding="utf-8", errors="replace") as file:
+        for line, text in enumerate(file, 1):
+            for closing, tag, value in _OFX_TAG.findall(text):
+                tag = tag.upper()
+                if tag == "STMTTRN":
+                    if not closing:
+                        transaction = {"line": line}
+                        continue
+                    if transaction is None:
+                        continue
+                    row, error, credit = parser.expense(
+                        transaction.get("DTPOSTED", ""),
+                        transaction.get("NAME") or transaction.get("MEMO", ""),
+                        transaction.get("TRNAMT", ""))
+                    if row is not None:
+                        rows.append(row)
+                    elif error is not None:
+                        errors.append((transaction["line"], error))
+                    elif credit:
+                        credits += 1
+                    transaction = None
+                    if len(rows) >= chunk_rows:
+                        yield rows, errors, credits
+                        rows, errors, credits = [], [], 0
+                elif transaction is not None and not closing:
+                    transaction[tag] = value.strip()
+    if rows or errors or credits:
+        yield rows, errors, credits
+
+
+def read_statement(filename, **options):
+    """read_ofx for .ofx/.qfx files, read_csv otherwise."""
+    if filename.lower().endswith((".ofx", ".qfx")):
+        options.pop("processes", None)
+        return read_ofx(filename, **options)
+    return read_csv(filename, **options)
+
+
+def row_key(date, description, amount):
+    """Hash identifying an expense for duplicate detection; case-insensitive, to the cent."""
+    return hash((date, description.casefold(), round(amount * 100)))
+
+
+def import_statement(tracker, filename, dedupe=True, **options):
+    """Import a CSV or OFX statement into tracker; returns an ImportReport.
+
+    With dedupe, a row is skipped when the tracker already holds an expense
+    with the same date, description and amount; the same row appearing twice in
+    the statement is imported twice, only re-imports are dropped. Months of a
+    partitioned file still on disk are loaded before their rows are compared,
+    so re-imports into archived months are dropped too. options go to
+    read_statement (processes, chunk_rows) and RowParser (use, category,
+    debits_negative, date_format). Saving is left to the caller.
+    """
+    report = ImportReport()
+    # Keys of the existing expenses, loaded one date at a time as the statement needs them
+    existing = Counter()
+    seen_dates, seen_months = set(), set()
+
+    def fresh(rows):
+        for row in rows:
+            date, description, amount = row[:3]
+            if date not in seen_dates:
+                seen_dates.add(date)
+                month = month_key(date)
+                if month not in seen_months:
+                    seen_months.add(month)
+                    tracker._ensure_months([month])
+                # Loading a month replaces the tracker's store, so it is looked up again
+                store = tracker.expenses
+                ordinal = as_ordinal(date)
+                for old in store.rows_between(ordinal, ordinal):
+                    existing[row_key(date, store.descriptions[old], store.amounts[old])] += 1
+            if not existing:
+                # Nothing to compare against yet, the common case for a first import
+                yield row
+                continue
+            key = row_key(date, description, amount)
+            if existing[key]:
+                existing[key] -= 1
+                report.duplicates += 1
+                continue
+            yield row
+
+    def rows():
+        for chunk, errors, credits in read_statement(filename, **options):
+            report.add_errors(errors)
+            report.credits += credits
+            yield from fresh(chunk) if dedupe else chunk
+
+    report.added = tracker.add_expenses(rows())
+    return report
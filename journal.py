@@ -0,0 +1,235 @@
+#Append-only journal for snapshot files such as expenses.json and budget.json.
+#
+#Saving appends the operations made since the last save as JSON lines to
+#"<snapshot>.journal" instead of rewriting the snapshot. Loading reads the
+#snapshot and replays the journal on top. Once the journal grows large, it is
+#folded back into the snapshot on a background thread.
+#
+#The first line of a journal is a header holding the CRC32 of the snapshot bytes it
+#applies to. A journal whose header does not match the snapshot on disk is stale
+#and is never replayed. Compaction writes the new snapshot and the new journal
+#(header plus any records appended meanwhile) to temporary files, then renames
+#the snapshot and after it the journal. If a crash happens between the two
+#renames, recover() finds the matching temporary journal and finishes the job.
+
+import json
+import logging
+import os
+import threading
+import zlib
+
+log = logging.getLogger("budget.journal")
+
+
+def _fsync_dir(path):
+    if os.name == "nt":
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def read_snapshot(path):
+    """Return (bytes, crc32) of a snapshot file, or (None, None) if it is missing."""
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+    except FileNotFoundError:
+        return None, None
+    return data, zlib.crc32(data)
+
+
+def _encode_chunk(chunk):
+    return chunk if isinstance(chunk, bytes) else chunk.encode()
+
+
+def write_atomic(path, chunks):
+    """Write an iterable of str or bytes chunks to path via a renamed temp file; return the crc32."""
+    tmp = path + ".tmp"
+    crc = 0
+    with open(tmp, "wb") as file:
+        for chunk in chunks:
+            data = _encode_chunk(chunk)
+            crc = zlib.crc32(data, crc)
+            file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path)
+    return crc
+
+
+def _read_records(path):
+    """Parse a journal file into (base_crc, records). Returns None if it is missing."""
+    try:
+        with open(path, "rb") as file:
+            lines = file.read().split(b"\n")
+    except FileNotFoundError:
+        return None
+    records = []
+    for line in lines:
+        if not line:
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            # A torn final line from a crash mid-append; everything before it is good
+            break
+    if not records or records[0].get("op") != "base":
+        return None
+    return records[0]["crc"], records[1:]
+
+
+class Journal:
+    # Compact once the journal holds this many records and at least half as many as the snapshot rows
+    compact_threshold = 1000
+
+    def __init__(self, snapshot_path):
+        self.snapshot_path = snapshot_path
+        self.path = snapshot_path + ".journal"
+        self.base = None
+        self.records = 0
+        self._file = None
+        self._lock = threading.Lock()
+        self._compactor = None
+        self._carry = None
+
+    def matches(self, filename):
+        return os.path.abspath(filename) == os.path.abspath(self.snapshot_path)
+
+    # --- loading ---
+
+    def recover(self, snapshot_crc):
+        """Return the journal records that apply to a snapshot with the given crc32."""
+        self.base = snapshot_crc
+        self.records = 0
+        parsed = _read_records(self.path)
+        if parsed is None or parsed[0] != snapshot_crc:
+            pending = _read_records(self.path + ".tmp")
+            if pending is not None and pending[0] == snapshot_crc:
+                # Compaction renamed the snapshot but crashed before renaming the journal
+                os.replace(self.path + ".tmp", self.path)
+                parsed = pending
+            elif parsed is not None:
+                log.warning(f"Ignoring stale journal {self.path}.")
+                os.replace(self.path, self.path + ".stale")
+                parsed = None
+        for leftover in (self.path + ".tmp", self.snapshot_path + ".tmp"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        if parsed is None:
+            return []
+        self.records = len(parsed[1])
+        return parsed[1]
+
+    # --- saving ---
+
+    def _open(self):
+        if self._file is None:
+            exists = os.path.exists(self.path)
+            self._file = open(self.path, "ab")
+            if not exists or self._file.tell() == 0:
+                self._file.write(self._encode({"op": "base", "crc": self.base}))
+
+    @staticmethod
+    def _encode(record):
+        return json.dumps(record, separators=(",", ":")).encode() + b"\n"
+
+    def append(self, records):
+        """Durably append records; the cost depends only on how many there are."""
+        if not records:
+            return
+        data = b"".join(self._encode(record) for record in records)
+        with self._lock:
+            self._open()
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.records += len(records)
+            if self._carry is not None:
+                self._carry.append(data)
+
+    def reset(self, snapshot_crc):
+        """Start an empty journal on top of a freshly written snapshot."""
+        with self._lock:
+            self._close()
+            self.base = snapshot_crc
+            self.records = 0
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        self.wait()
+        with self._lock:
+            self._close()
+
+    # --- compaction ---
+
+    def should_compact(self, rows, pending=0):
+        """Whether to compact once pending more records have been appended."""
+        return self._compactor is None and \
+            self.records + pending >= max(self.compact_threshold, rows // 2)
+
+    def compact(self, chunks, background=True):
+        """Fold the journal into a new snapshot built from the str or bytes chunks of its encoding.
+
+        chunks must come from a copy of the state taken when all journal records
+        so far were applied; records appended while the compaction is running are
+        carried over into the new journal.
+        """
+        with self._lock:
+            if self._compactor is not None:
+                return
+            self._carry = []
+            if background:
+                # Not a daemon: interpreter shutdown waits for the snapshot to land
+                self._compactor = threading.Thread(target=self._compact, args=(chunks,),
+                                                   name="journal-compaction")
+                self._compactor.start()
+                return
+            self._compactor = threading.current_thread()
+        self._compact(chunks)
+
+    def _compact(self, chunks):
+        snapshot_tmp = self.snapshot_path + ".tmp"
+        journal_tmp = self.path + ".tmp"
+        try:
+            crc = 0
+            with open(snapshot_tmp, "wb") as file:
+                for chunk in chunks:
+                    data = _encode_chunk(chunk)
+                    crc = zlib.crc32(data, crc)
+                    file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            with self._lock:
+                carry = self._carry
+                with open(journal_tmp, "wb") as file:
+                    file.write(self._encode({"op": "base", "crc": crc}))
+                    file.writelines(carry)
+                    file.flush()
+                    os.fsync(file.fileno())
+                self._close()
+                os.replace(snapshot_tmp, self.snapshot_path)
+                os.replace(journal_tmp, self.path)
+                _fsync_dir(self.path)
+                self.base = crc
+                self.records = len(carry)
+        except Exception as e:
+            log.error(f"Journal compaction failed: {e}")
+        finally:
+            with self._lock:
+                self._carry = None
+                self._compactor = None
+
+    def wait(self):
+        compactor = self._compactor
+        if compactor is not None and compactor is not threading.current_thread():
+            compactor.join()
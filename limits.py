@@ -0,0 +1,128 @@
+#Monthly spending limits: for all expenses, for a category or for a use.
+#
+#A limit applies to every month unless it names one ("YYYY-MM"), in which case it
+#replaces the every-month limit for that month. Checking a limit reads the
+#month's spending from the store's month/use/category rollups
+#(ExpenseStore.month_spent, or BudgetTracker.month_spent, which also answers
+#for months left on disk), so it costs the same with a decade of history as
+#with a week of it.
+
+from datetime import date as Date
+
+SCOPES = ("total", "category", "use")
+
+
+def parse_month(value=None):
+    """Month number (year * 12 + month - 1) of a "YYYY-MM" string, a date, or today if None."""
+    if value is None:
+        value = Date.today()
+    if isinstance(value, Date):
+        return value.year * 12 + value.month - 1
+    if isinstance(value, int):
+        return value
+    if not isinstance(value, str):
+        raise ValueError(f"Invalid month {value!r}, expected YYYY-MM")
+    try:
+        year, month = value.strip().split("-")[:2]
+        year, month = int(year), int(month)
+    except ValueError:
+        raise ValueError(f"Invalid month {value!r}, expected YYYY-MM") from None
+    if not 1 <= month <= 12:
+        raise ValueError(f"Invalid month {value!r}, expected YYYY-MM")
+    return year * 12 + month - 1
+
+
+def format_month(month):
+    return f"{month // 12:04d}-{month % 12 + 1:02d}"
+
+
+class BudgetStatus:
+    """Where one limit stands in one month."""
+
+    def __init__(self, scope, name, month, limit, spent):
+        self.scope = scope
+        self.name = name
+        self.month = month
+        self.limit = limit
+        self.spent = spent
+        self.remaining = limit - spent
+        self.exceeded = spent > limit
+
+    @property
+    def label(self):
+        return "All expenses" if self.scope == "total" else f"{self.scope.capitalize()} {self.name}"
+
+    def __str__(self):
+        state = "exceeded" if self.exceeded else "remaining"
+        return (f"{self.label} ({format_month(self.month)}): spent {self.spent:.2f} of {self.limit:.2f}, "
+                f"{abs(self.remaining):.2f} {state}")
+
+
+class BudgetLimits:
+    """Limits keyed by (scope, name, month); month None means every month."""
+
+    def __init__(self):
+        self.limits = {}
+
+    def __len__(self):
+        return len(self.limits)
+
+    @staticmethod
+    def _key(scope, name, month):
+        if scope not in SCOPES:
+            raise ValueError(f"Unknown budget scope {scope!r}; expected one of {', '.join(SCOPES)}")
+        if scope == "total":
+            name = None
+        elif not name:
+            raise ValueError(f"A {scope} budget needs a {scope} name")
+        return scope, name, None if month is None else parse_month(month)
+
+    def set(self, amount, scope="total", name=None, month=None):
+        """Set a limit; an amount of None removes it."""
+        key = self._key(scope, name, month)
+        if amount is None:
+            self.limits.pop(key, None)
+        else:
+            self.limits[key] = float(amount)
+
+    def get(self, scope="total", name=None, month=None):
+        """The limit set for exactly this scope, name and month (None: every month), or None."""
+        return self.limits.get(self._key(scope, name, month))
+
+    def limit_for(self, scope="total", name=None, month=None):
+        """The limit in force for month (today's by default), or None."""
+        month = parse_month(month)
+        scope, name, _ = self._key(scope, name, None)
+        limit = self.limits.get((scope, name, month))
+        return self.limits.get((scope, name, None)) if limit is None else limit
+
+    def check(self, store, month=None):
+        """BudgetStatus of every limit in force for month, spending read from store.month_spent.
+
+        store is an ExpenseStore or a BudgetTracker.
+        """
+        month = parse_month(month)
+        statuses = []
+        seen = set()
+        # Month-specific limits first, so they shadow the every-month ones
+        for (scope, name, limit_month), limit in sorted(self.limits.items(), key=lambda item: item[0][2] is None):
+            if limit_month not in (None, month) or (scope, name) in seen:
+                continue
+            seen.add((scope, name))
+            spent = store.month_spent(month, use=name if scope == "use" else None,
+                                      category=name if scope == "category" else None)
+            statuses.append(BudgetStatus(scope, name, month, limit, spent))
+        statuses.sort(key=lambda status: (SCOPES.index(status.scope), status.name or ""))
+        return statuses
+
+    def to_json(self):
+        return [{"scope": scope, "name": name, "month": None if month is None else format_month(month),
+                 "amount": amount}
+                for (scope, name, month), amount in sorted(self.limits.items(), key=repr)]
+
+    @classmethod
+    def from_json(cls, items):
+        limits = cls()
+        for item in items:
+            limits.set(item["amount"], item["scope"], item.get("name"), item.get("month"))
+        return limits
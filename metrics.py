@@ -0,0 +1,320 @@
+#Logging setup, counters and latency histograms, and an optional profiler.
+#
+#The tracker reports what it did through the "budget" logger instead of printing,
+#so library use (the GUI, imports, benchmarks) stays quiet and only the CLI turns
+#the messages on with setup_logging(). Mutations, saves, loads and aggregate
+#queries record their latency with @timed or timer(); snapshot() returns the
+#figures and format_snapshot() renders them for the CLI and GUI.
+#
+#Environment variables:
+#  BUDGET_LOG_LEVEL    level for setup_logging() (default INFO)
+#  BUDGET_METRICS=0    skip the timing altogether
+#  BUDGET_PROFILE      cpu, memory or cpu,memory: run cProfile and/or tracemalloc
+#                      from start_profiling() until exit
+#  BUDGET_PROFILE_OUT  write the profile report here instead of to stderr
+
+import atexit
+import functools
+import io
+import logging
+import os
+import sys
+import threading
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from math import frexp
+from time import perf_counter
+
+enabled = os.environ.get("BUDGET_METRICS") != "0"
+PROFILE_MODES = ("cpu", "memory")
+
+# Latencies are kept raw and folded into the histogram buckets this many at a time
+_FOLD = 1024
+
+
+class Histogram:
+    """Latency histogram with power-of-two buckets.
+
+    Recording appends the latency to a list (atomic under the GIL, so no lock
+    is taken on the hot path); the samples are folded into the buckets in
+    sorted batches. Quantiles are accurate to within a factor of two.
+    """
+
+    __slots__ = ("count", "total", "max", "buckets", "samples", "_lock")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        # Exponent e -> number of latencies in [2**(e-1), 2**e) seconds
+        self.buckets = Counter()
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        samples = self.samples
+        samples.append(seconds)
+        if len(samples) >= _FOLD:
+            self.fold()
+
+    def fold(self):
+        with self._lock:
+            samples = self.samples
+            n = len(samples)
+            if not n:
+                return
+            batch = samples[:n]
+            # Samples appended meanwhile stay behind for the next fold
+            del samples[:n]
+            self.count += n
+            self.total += sum(batch)
+            # Sorted, each bucket is one bisect instead of a step per sample
+            batch.sort()
+            self.max = max(self.max, batch[-1])
+            lo = 0
+            exponent = frexp(batch[0])[1]
+            while lo < n:
+                hi = bisect_left(batch, 2.0 ** exponent, lo)
+                if hi > lo:
+                    self.buckets[exponent] += hi - lo
+                lo = hi
+                exponent += 1
+
+    def quantile(self, q):
+        """Upper bound of the q-quantile in seconds, or None when empty."""
+        self.fold()
+        with self._lock:
+            if not self.count:
+                return None
+            rank = q * self.count
+            seen = 0
+            for exponent in sorted(self.buckets):
+                seen += self.buckets[exponent]
+                if seen >= rank:
+                    return min(2.0 ** exponent, self.max)
+            return self.max
+
+    def summary(self):
+        self.fold()
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1e3,
+            "mean_ms": self.total / self.count * 1e3,
+            "p50_ms": self.quantile(0.5) * 1e3,
+            "p90_ms": self.quantile(0.9) * 1e3,
+            "p99_ms": self.quantile(0.99) * 1e3,
+            "max_ms": self.max * 1e3,
+        }
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+            self.buckets.clear()
+            # Cleared in place: timed() wrappers hold on to the list
+            del self.samples[:]
+
+
+class Metrics:
+    """Named counters and latency histograms, safe to update from any thread."""
+
+    def __init__(self):
+        self.counters = Counter()
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def observe(self, name, seconds):
+        self.histogram(name).observe(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        if not enabled:
+            yield
+            return
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram(name).observe(perf_counter() - start)
+
+    def timed(self, name):
+        """Decorator recording each call's latency under name."""
+        def decorate(function):
+            if not enabled:
+                return function
+            histogram = self.histogram(name)
+            samples = histogram.samples
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    # Histogram.observe inlined; this runs on every mutation and query
+                    samples.append(perf_counter() - start)
+                    if len(samples) >= _FOLD:
+                        histogram.fold()
+            return wrapper
+        return decorate
+
+    def snapshot(self):
+        """{"counters": {name: n}, "latency": {name: summary}} of what has been recorded."""
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = list(self.histograms.items())
+        latency = {name: histogram.summary() for name, histogram in histograms}
+        return {"counters": counters,
+                "latency": {name: summary for name, summary in latency.items() if summary["count"]}}
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            for histogram in self.histograms.values():
+                histogram.reset()
+
+
+registry = Metrics()
+count = registry.count
+observe = registry.observe
+timer = registry.timer
+timed = registry.timed
+snapshot = registry.snapshot
+
+
+def format_snapshot(data=None):
+    """Render snapshot() as a text table."""
+    data = snapshot() if data is None else data
+    lines = []
+    if data["latency"]:
+        lines.append(f"{'operation':<28}{'calls':>9}{'mean ms':>10}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+        for name in sorted(data["latency"]):
+            s = data["latency"][name]
+            lines.append(f"{name:<28}{s['count']:>9}{s['mean_ms']:>10.3f}{s['p50_ms']:>9.3f}"
+                         f"{s['p90_ms']:>9.3f}{s['p99_ms']:>9.3f}{s['max_ms']:>9.3f}")
+    for name in sorted(data["counters"]):
+        lines.append(f"{name:<28}{data['counters'][name]:>9}")
+    if not lines:
+        return "No metrics recorded yet." if enabled else "Metrics are off (BUDGET_METRICS=0)."
+    return "\n".join(lines)
+
+
+def setup_logging(level=None, stream=None):
+    """Show the tracker's messages (plain text) on stream, stdout by default.
+
+    level is a logging level or its name; BUDGET_LOG_LEVEL, then INFO, by default.
+    """
+    level = level or os.environ.get("BUDGET_LOG_LEVEL") or "INFO"
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+        if not isinstance(level, int):
+            raise ValueError(f"Unknown log level {level!r}")
+    logger = logging.getLogger("budget")
+    for handler in list(logger.handlers):
+        if getattr(handler, "_budget", False):
+            logger.removeHandler(handler)
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    handler._budget = True
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    return logger
+
+
+# --- profiling ---
+
+class Profiler:
+    """cProfile and/or tracemalloc over a stretch of the program.
+
+    cProfile only sees the thread that started it, so saves made by the
+    background save worker show up in the metrics but not in the CPU profile.
+    """
+
+    def __init__(self, modes):
+        unknown = set(modes) - set(PROFILE_MODES)
+        if unknown:
+            raise ValueError(f"Unknown profile mode(s): {', '.join(sorted(unknown))}")
+        self.modes = set(modes)
+        self._profile = None
+
+    def start(self):
+        if "cpu" in self.modes:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        if "memory" in self.modes:
+            import tracemalloc
+            tracemalloc.start(10)
+
+    def stop(self, limit=25):
+        """Stop profiling and return the report text."""
+        out = io.StringIO()
+        if self._profile is not None:
+            import pstats
+            self._profile.disable()
+            out.write("CPU profile (by cumulative time):\n")
+            pstats.Stats(self._profile, stream=out).sort_stats("cumulative").print_stats(limit)
+            self._profile = None
+        if "memory" in self.modes:
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                top = tracemalloc.take_snapshot().statistics("lineno")[:limit]
+                tracemalloc.stop()
+                out.write(f"Memory: {current / 2**20:.1f} MiB allocated, peak {peak / 2**20:.1f} MiB\n")
+                for stat in top:
+                    out.write(f"  {stat}\n")
+        return out.getvalue()
+
+
+_profiler = None
+
+
+def start_profiling(modes=None):
+    """Start the profiler for modes (e.g. "cpu,memory"), BUDGET_PROFILE by default.
+
+    Does nothing when no mode is given. The report is written when
+    stop_profiling() is called, or at exit.
+    """
+    global _profiler
+    modes = modes if modes is not None else os.environ.get("BUDGET_PROFILE", "")
+    if isinstance(modes, str):
+        modes = [mode.strip() for mode in modes.split(",") if mode.strip()]
+    if not modes or _profiler is not None:
+        return _profiler
+    _profiler = Profiler(modes)
+    _profiler.start()
+    atexit.register(stop_profiling)
+    return _profiler
+
+
+def stop_profiling(output=None):
+    """Stop the profiler and write its report with the metrics; returns the report."""
+    global _profiler
+    if _profiler is None:
+        return None
+    report = _profiler.stop() + "\nMetrics:\n" + format_snapshot() + "\n"
+    _profiler = None
+    output = output or os.environ.get("BUDGET_PROFILE_OUT")
+    if output:
+        with open(output, "w") as file:
+            file.write(report)
+    else:
+        sys.stderr.write(report)
+    return report
@@ -0,0 +1,74 @@
+#One-shot migration of expenses.json and budget.json (with their journals) into
+#an SQLite database. The JSON files are left untouched. Afterwards run the
+#tracker with BUDGET_DATABASE=<database> to use it.
+#Usage: python migrate.py [database] [expenses.json] [budget.json] [--force]
+
+import math
+import sys
+
+from budget import BudgetTracker
+from storage import SQLiteStorage
+
+
+def migrate(database="budget.db", expenses_file="expenses.json", budget_file="budget.json", force=False):
+    """Copy the JSON expenses and budget into database; returns the number of expenses."""
+    tracker = BudgetTracker()
+    # Loaded before the database is even opened: an unreadable file would otherwise
+    # "migrate" as an empty one
+    for load, filename in ((tracker.load_expenses, expenses_file), (tracker.load_budget, budget_file)):
+        if not load(filename):
+            tracker.close()
+            raise RuntimeError(f"Could not load {filename}")
+
+    target = SQLiteStorage(database)
+    try:
+        if not force and (target.count() or _has_budget(target)):
+            tracker.close()
+            raise ValueError(f"{database} already holds data; use --force to overwrite it")
+    finally:
+        target.close()
+
+    if not (tracker.save_expenses(database) and tracker.save_budget(database)):
+        raise RuntimeError(f"Could not write {database}")
+
+    # Check the copy with the database's own aggregates. They only see stored
+    # expenses, so the total leaves out recurring ones (total_expenses counts them)
+    storage = tracker.storage
+    if storage.count() != len(tracker.expenses) or \
+            not math.isclose(storage.total(), tracker.expenses.total, rel_tol=1e-9, abs_tol=1e-6):
+        raise RuntimeError(f"{database} does not match {expenses_file} after migrating")
+    copy = BudgetTracker()
+    copy.load_budget(database)
+    if _budget_json(copy) != _budget_json(tracker):
+        raise RuntimeError(f"{database} does not match {budget_file} after migrating")
+    copy.close()
+    tracker.close()
+    return len(tracker.expenses)
+
+
+def _budget_json(tracker):
+    return tracker.budget, tracker.limits.to_json(), tracker.recurring.to_json()
+
+
+def _has_budget(storage):
+    try:
+        storage.load_budget()
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def main():
+    force = "--force" in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg != "--force"]
+    try:
+        count = migrate(*args, force=force)
+    except (ValueError, RuntimeError) as e:
+        print(f"Migration failed: {e}")
+        sys.exit(1)
+    database = args[0] if args else "budget.db"
+    print(f"Migrated {count} expenses. Run with BUDGET_DATABASE={database} to use the database.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+#Month partitions: which months of a partitioned expense directory are in
+#memory, and a summary of every month so the rest need not be.
+#
+#A partitioned store (PartitionedStorage in storage.py) is a directory holding
+#one JSON Lines file per month, 2024-05.jsonl, plus undated.jsonl for dates that
+#are not YYYY-MM-DD, and manifest.json with a Summary of each file: count, total,
+#and totals per use, category and week. Only the recent months are loaded at
+#startup. Older ones are loaded when a query or the table reaches them, and the
+#least recently used of those are dropped again once more than max_resident
+#are held (see BudgetTracker._ensure_months). Totals over the whole history add
+#the summaries of the months left on disk to the store's own rollups, so they
+#never read those rows.
+#
+#A month is always either entirely in the store or not at all.
+
+from collections import OrderedDict
+
+from limits import format_month, parse_month
+from store import date_to_ordinal, month_of, week_of
+
+UNDATED = "undated"
+
+
+def month_key(date):
+    """Partition of an expense date: its month number (see limits.parse_month), or None if undated."""
+    ordinal = date_to_ordinal(date)
+    return None if ordinal is None else month_of(ordinal)
+
+
+def partition_name(month):
+    return UNDATED if month is None else format_month(month)
+
+
+def parse_partition_name(name):
+    """Month of a partition file name without extension; raises ValueError for other names."""
+    return None if name == UNDATED else parse_month(name)
+
+
+def month_order(month):
+    # Undated expenses sort first, like the store's date index
+    return -1 if month is None else month
+
+
+class Summary:
+    """Count and totals of a set of expenses: overall, per use, per category and per week."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.by_use = {}
+        self.by_category = {}
+        # Week number (see store.week_of) -> total
+        self.weeks = {}
+        self.max_id = 0
+        # Size and mtime of the month file the summary was made from
+        self.size = None
+        self.mtime_ns = None
+
+    @classmethod
+    def of_records(cls, records):
+        summary = cls()
+        for record in records:
+            summary.add(record["id"], record["date"], record["amount"], record["use"], record["category"])
+        return summary
+
+    def add(self, expense_id, date, amount, use, category):
+        self.count += 1
+        self.total += amount
+        self.by_use[use] = self.by_use.get(use, 0.0) + amount
+        self.by_category[category] = self.by_category.get(category, 0.0) + amount
+        ordinal = date_to_ordinal(date)
+        if ordinal is not None:
+            week = week_of(ordinal)
+            self.weeks[week] = self.weeks.get(week, 0.0) + amount
+        self.max_id = max(self.max_id, expense_id)
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        for mine, theirs in ((self.by_use, other.by_use), (self.by_category, other.by_category),
+                             (self.weeks, other.weeks)):
+            for key, total in theirs.items():
+                mine[key] = mine.get(key, 0.0) + total
+        self.max_id = max(self.max_id, other.max_id)
+
+    def total_by_use(self, use):
+        """Compared case-insensitively, like ExpenseStore.total_by_use."""
+        use = use.lower()
+        return sum(total for value, total in self.by_use.items() if value.lower() == use)
+
+    def to_json(self):
+        return {"count": self.count, "total": self.total, "by_use": self.by_use,
+                "by_category": self.by_category, "weeks": {str(week): total for week, total in self.weeks.items()},
+                "max_id": self.max_id, "size": self.size, "mtime_ns": self.mtime_ns}
+
+    @classmethod
+    def from_json(cls, data):
+        summary = cls()
+        summary.count = data["count"]
+        summary.total = data["total"]
+        summary.by_use = data["by_use"]
+        summary.by_category = data["by_category"]
+        summary.weeks = {int(week): total for week, total in data["weeks"].items()}
+        summary.max_id = data["max_id"]
+        summary.size = data.get("size")
+        summary.mtime_ns = data.get("mtime_ns")
+        return summary
+
+
+class Partitions:
+    """The summary of every month on disk, and which months are in the tracker's store."""
+
+    # Months loaded at startup: this one and the ones before it, plus later and undated ones
+    recent_months = 3
+    # Older months kept in the store at most; beyond that the least recently used are dropped
+    max_resident = 24
+
+    def __init__(self):
+        # Month (None: undated) -> Summary
+        self.summaries = {}
+        self.resident = set()
+        # Resident months older than the recent ones, least recently used first
+        self._older = OrderedDict()
+        self._archive = None
+        self.first_recent = parse_month(None) - self.recent_months + 1
+
+    def is_recent(self, month):
+        return month is None or month >= self.first_recent
+
+    def recent(self):
+        """The months to load at startup, oldest first."""
+        return sorted((month for month in self.summaries if self.is_recent(month)), key=month_order)
+
+    def offline(self):
+        """Months on disk but not in the store, oldest first."""
+        return sorted((month for month in self.summaries if month not in self.resident), key=month_order)
+
+    def is_offline(self, month):
+        return month in self.summaries and month not in self.resident
+
+    def archive(self):
+        """One Summary of all the offline months."""
+        if self._archive is None:
+            archive = Summary()
+            for month in self.offline():
+                archive.merge(self.summaries[month])
+            self._archive = archive
+        return self._archive
+
+    def set_summary(self, month, summary):
+        """Record month's summary after it was written; None when its file was removed."""
+        if summary is None:
+            self.summaries.pop(month, None)
+            self.resident.discard(month)
+            self._older.pop(month, None)
+        else:
+            self.summaries[month] = summary
+        self._archive = None
+
+    def loaded(self, months):
+        for month in months:
+            self.resident.add(month)
+            if not self.is_recent(month):
+                self._older[month] = True
+                self._older.move_to_end(month)
+        self._archive = None
+
+    def unloaded(self, months):
+        for month in months:
+            self.resident.discard(month)
+            self._older.pop(month, None)
+        self._archive = None
+
+    def claim_all(self):
+        """Count every month as resident, e.g. once the store replaced them all."""
+        self.loaded(list(self.summaries))
+
+    def touch(self, months):
+        """Mark resident older months as just used."""
+        for month in months:
+            if month in self._older:
+                self._older.move_to_end(month)
+
+    def evictable(self, keep=(), incoming=0):
+        """Older months to drop so that, with incoming more, at most max_resident stay."""
+        excess = len(self._older) + incoming - self.max_resident
+        if excess <= 0:
+            return []
+        return [month for month in self._older if month not in keep][:excess]
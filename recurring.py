@@ -0,0 +1,270 @@
+#Recurring expenses: rent, subscriptions and other repeating costs kept as one
+#rule each instead of one stored expense per occurrence.
+#
+#A rule repeats an expense every `interval` days, weeks, months or years from
+#its start date, up to its end date if it has one. Monthly and yearly rules keep
+#the start's day of the month, moved to the last day of shorter months (from the
+#31st: Jan 31, Feb 28, Mar 31). Rules are saved with the budget, like the monthly
+#limits. Occurrences are never stored. occurrences() generates them lazily, in
+#date order, for listings. Totals come from counting: the number of occurrences
+#between two dates is the difference of two occurrence numbers worked out
+#directly from the dates. So a daily rule over ten years costs a totals query
+#no more than a monthly one.
+#
+#An occurrence counts as spent once its date has come: totals default to
+#occurrences up to today. forecast.py adds the future ones on top of its
+#projection.
+
+import heapq
+from datetime import date as Date
+
+from limits import parse_month
+from store import Expense, as_ordinal, month_of, month_start, week_of
+
+FREQUENCIES = ("daily", "weekly", "monthly", "yearly")
+# Days (daily, weekly) or months (monthly, yearly) per step of interval 1
+_STEPS = {"daily": 1, "weekly": 7, "monthly": 1, "yearly": 12}
+PERIODS = ("month", "week")
+
+
+def _today():
+    return Date.today().toordinal()
+
+
+class RecurringRule:
+    """An expense repeated every `interval` days, weeks, months or years from start to end (inclusive).
+
+    start and end are YYYY-MM-DD strings, dates or ordinals; end None repeats forever.
+    """
+
+    def __init__(self, description, amount, use, category, start, frequency="monthly", interval=1,
+                 end=None, rule_id=None):
+        if frequency not in FREQUENCIES:
+            raise ValueError(f"Unknown frequency {frequency!r}; expected one of {', '.join(FREQUENCIES)}")
+        if isinstance(interval, bool) or not isinstance(interval, int) or interval < 1:
+            raise ValueError(f"Invalid interval {interval!r}, expected a whole number of at least 1")
+        self.description = description
+        self.amount = float(amount)
+        self.use = use
+        self.category = category
+        self.frequency = frequency
+        self.interval = interval
+        self.start = as_ordinal(start)
+        self.end = None if end is None else as_ordinal(end)
+        if self.end is not None and self.end < self.start:
+            raise ValueError("A recurring expense cannot end before it starts")
+        self.id = rule_id
+        self.step = _STEPS[frequency] * interval
+        self.by_month = frequency in ("monthly", "yearly")
+        if self.by_month:
+            self._month = month_of(self.start)
+            self._day = Date.fromordinal(self.start).day
+
+    # --- occurrence numbers: occurrence k falls on date_of(k), k = 0, 1, ... ---
+
+    def date_of(self, k):
+        if not self.by_month:
+            return self.start + k * self.step
+        month = self._month + k * self.step
+        first = month_start(month)
+        return first + min(self._day, month_start(month + 1) - first) - 1
+
+    def _first_from(self, ordinal):
+        """Number of the first occurrence on or after ordinal (ignoring end)."""
+        if ordinal <= self.start:
+            return 0
+        if not self.by_month:
+            return -((self.start - ordinal) // self.step)
+        k = -((self._month - month_of(ordinal)) // self.step)
+        return k + 1 if self.date_of(k) < ordinal else k
+
+    def _last_to(self, ordinal):
+        """Number of the last occurrence on or before ordinal, or -1 if none."""
+        if self.end is not None:
+            ordinal = min(ordinal, self.end)
+        if ordinal < self.start:
+            return -1
+        if not self.by_month:
+            return (ordinal - self.start) // self.step
+        k = (month_of(ordinal) - self._month) // self.step
+        return k - 1 if self.date_of(k) > ordinal else k
+
+    def count_between(self, start, end):
+        """Occurrences dated start..end inclusive (ordinals)."""
+        return max(0, self._last_to(end) - self._first_from(start) + 1)
+
+    def total_between(self, start, end):
+        return self.count_between(start, end) * self.amount
+
+    def dates(self, start, end):
+        """Ordinals of the occurrences dated start..end inclusive, generated lazily."""
+        for k in range(self._first_from(start), self._last_to(end) + 1):
+            yield self.date_of(k)
+
+    def next_after(self, ordinal):
+        """Ordinal of the first occurrence after ordinal, or None once the rule has ended."""
+        k = self._first_from(ordinal + 1)
+        day = self.date_of(k)
+        return None if self.end is not None and day > self.end else day
+
+    def expense(self, ordinal):
+        """The occurrence on ordinal as an Expense (not in any store, so its id is None)."""
+        return Expense(Date.fromordinal(ordinal).isoformat(), self.description, self.amount, self.use,
+                       self.category)
+
+    def period_totals(self, period, until):
+        """{month or week number: total} of the occurrences up to until (see store.month_of/week_of)."""
+        last = self._last_to(until)
+        if last < 0:
+            return {}
+        bucket_of, first_day = (month_of, month_start) if period == "month" else \
+            (week_of, lambda week: week * 7 + 1)
+        totals = {}
+        # Sparse rules: a bucket per occurrence. Dense ones: count each bucket in closed form
+        dense = not self.by_month and self.step < (7 if period == "week" else 28)
+        if not dense:
+            for k in range(last + 1):
+                bucket = bucket_of(self.date_of(k))
+                totals[bucket] = totals.get(bucket, 0.0) + self.amount
+            return totals
+        end = self.date_of(last)
+        for bucket in range(bucket_of(self.start), bucket_of(end) + 1):
+            count = self.count_between(first_day(bucket), min(first_day(bucket + 1) - 1, end))
+            if count:
+                totals[bucket] = count * self.amount
+        return totals
+
+    @property
+    def label(self):
+        unit = {"daily": "day", "weekly": "week", "monthly": "month", "yearly": "year"}[self.frequency]
+        return f"every {unit}" if self.interval == 1 else f"every {self.interval} {unit}s"
+
+    def __str__(self):
+        until = "" if self.end is None else f" until {Date.fromordinal(self.end).isoformat()}"
+        return (f"{self.description}: {self.amount:.2f} {self.label} from "
+                f"{Date.fromordinal(self.start).isoformat()}{until} ({self.use}, {self.category})")
+
+    def to_json(self):
+        return {"id": self.id, "description": self.description, "amount": self.amount, "use": self.use,
+                "category": self.category, "frequency": self.frequency, "interval": self.interval,
+                "start": Date.fromordinal(self.start).isoformat(),
+                "end": None if self.end is None else Date.fromordinal(self.end).isoformat()}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["description"], data["amount"], data["use"], data["category"], data["start"],
+                   data.get("frequency", "monthly"), data.get("interval", 1), data.get("end"), data.get("id"))
+
+
+class RecurringRules:
+    """The tracker's recurring expenses by id. Totals count occurrences up to `until`, today if None."""
+
+    def __init__(self):
+        self.rules = {}
+        self.next_id = 1
+        # Bumped by every change, so derived data (e.g. forecasts) can be cached against it
+        self.version = 0
+        # (period, until) -> period_totals(), valid while version is _periods_version
+        self._periods = {}
+        self._periods_version = None
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __iter__(self):
+        return iter(self.rules.values())
+
+    def add(self, rule):
+        """Add a RecurringRule and return its id."""
+        if rule.id is None:
+            rule.id = self.next_id
+        self.next_id = max(self.next_id, rule.id + 1)
+        self.rules[rule.id] = rule
+        self.version += 1
+        return rule.id
+
+    def remove(self, rule_id):
+        """Remove a rule; returns whether there was one."""
+        removed = self.rules.pop(rule_id, None) is not None
+        self.version += removed
+        return removed
+
+    def get(self, rule_id):
+        return self.rules.get(rule_id)
+
+    def occurrences(self, start, end, until=None):
+        """Expenses of every rule dated start..end inclusive and up to until (ordinals), in date order."""
+        end = min(end, _today() if until is None else until)
+        for day, _, rule in heapq.merge(*(self._tagged(rule, start, end) for rule in self)):
+            yield rule.expense(day)
+
+    @staticmethod
+    def _tagged(rule, start, end):
+        # The id breaks ties between rules due the same day
+        for day in rule.dates(start, end):
+            yield day, rule.id, rule
+
+    def last_date(self, until=None):
+        """Ordinal of the latest occurrence of any rule up to until, or None."""
+        until = _today() if until is None else until
+        return max((rule.date_of(k) for rule in self for k in (rule._last_to(until),) if k >= 0), default=None)
+
+    def total(self, until=None):
+        until = _today() if until is None else until
+        return sum(rule.count_between(rule.start, until) * rule.amount for rule in self)
+
+    def total_between(self, start, end, until=None):
+        end = min(end, _today() if until is None else until)
+        return sum(rule.total_between(start, end) for rule in self)
+
+    def total_by_use(self, use, until=None):
+        """Compared case-insensitively, like ExpenseStore.total_by_use."""
+        until = _today() if until is None else until
+        use = use.lower()
+        return sum(rule.total_between(rule.start, until) for rule in self if rule.use.lower() == use)
+
+    def totals_by_category(self, until=None):
+        until = _today() if until is None else until
+        totals = {}
+        for rule in self:
+            total = rule.total_between(rule.start, until)
+            if total:
+                totals[rule.category] = totals.get(rule.category, 0.0) + total
+        return totals
+
+    def month_spent(self, month, use=None, category=None, until=None):
+        """Total in month (see limits.parse_month), optionally for one use and/or category, like ExpenseStore.month_spent."""
+        month = parse_month(month)
+        end = min(month_start(month + 1) - 1, _today() if until is None else until)
+        use = None if use is None else use.lower()
+        return sum(rule.total_between(month_start(month), end) for rule in self
+                   if (use is None or rule.use.lower() == use) and (category is None or rule.category == category))
+
+    def period_totals(self, period, until=None):
+        """{month or week number: total} over every rule; period is "month" or "week".
+
+        Cached until the rules change; the dictionary must not be modified.
+        """
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period: {period}")
+        until = _today() if until is None else until
+        if self._periods_version != self.version:
+            self._periods = {}
+            self._periods_version = self.version
+        totals = self._periods.get((period, until))
+        if totals is None:
+            totals = self._periods[period, until] = {}
+            for rule in self:
+                for bucket, total in rule.period_totals(period, until).items():
+                    totals[bucket] = totals.get(bucket, 0.0) + total
+        return totals
+
+    def to_json(self):
+        return [rule.to_json() for rule in self]
+
+    @classmethod
+    def from_json(cls, items):
+        rules = cls()
+        for item in items:
+            rules.add(RecurringRule.from_json(item))
+        return rules
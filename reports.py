@@ -0,0 +1,178 @@
+#Pivot reports: spending grouped by period (month, quarter or year) and by
+#category and/or use, with the count, total, mean and percentiles of each group.
+#
+#The grouping goes through the analytics backend, so with BUDGET_ANALYTICS=numpy
+#a chunk of rows is grouped with one sort and a few whole-array operations. With
+#workers > 1 the dated rows are split into chunks that end on period boundaries
+#and grouped in a process pool. Every group then lies within one chunk, so
+#percentiles stay exact and the partial results merge by combining dictionaries.
+#Rows whose date is not YYYY-MM-DD have no period and are left out.
+
+import csv
+import os
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from analytics import PERIOD_MONTHS, get_backend
+from limits import format_month
+from store import month_of, month_start
+
+PERIODS = ("month", "quarter", "year")
+DIMENSIONS = ("category", "use")
+DEFAULT_PERCENTILES = (50, 90)
+# Below this many dated rows a process pool costs more than it saves
+PARALLEL_MIN_ROWS = 200_000
+
+
+def period_label(number, period):
+    if period == "month":
+        return format_month(number)
+    if period == "quarter":
+        return f"{number // 4:04d}-Q{number % 4 + 1}"
+    return f"{number:04d}"
+
+
+class PivotReport:
+    """One row per group: period label, the category and/or use grouped by, then
+    count, total, mean and the percentiles, sorted by period, category and use."""
+
+    def __init__(self, period, by, percentiles, rows):
+        self.period = period
+        self.by = by
+        self.percentiles = percentiles
+        self.rows = rows
+
+    @property
+    def header(self):
+        return ["period", *self.by, "count", "total", "mean", *(f"p{q:g}" for q in self.percentiles)]
+
+    def write_csv(self, file):
+        """Write the report with a header line to a path or an open text file."""
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, "w", newline="", encoding="utf-8") as out:
+                return self.write_csv(out)
+        writer = csv.writer(file)
+        writer.writerow(self.header)
+        writer.writerows(self.rows)
+
+    def format(self):
+        """The report as an aligned text table."""
+        labels = len(self.by) + 1
+        cells = [self.header] + [[str(value) if column < labels + 1 else f"{value:.2f}"
+                                  for column, value in enumerate(row)] for row in self.rows]
+        widths = [max(len(row[column]) for row in cells) for column in range(len(self.header))]
+        return "\n".join("  ".join(cell.ljust(width) if column < labels else cell.rjust(width)
+                                   for column, (cell, width) in enumerate(zip(row, widths)))
+                         for row in cells)
+
+
+def _use_groups(store):
+    """Uses merged case-insensitively, like total_expenses_by_use: (names, group of each use code)."""
+    names, groups, seen = [], array("I"), {}
+    for use in store.use_table.values:
+        group = seen.get(use.lower())
+        if group is None:
+            group = seen[use.lower()] = len(names)
+            names.append(use)
+        groups.append(group)
+    return names, groups
+
+
+def _group(columns, lo, hi, period, by, percentiles, backend_name):
+    """Group stats of the dated rows date_index[lo:hi]."""
+    date_index, amounts, categories, uses, use_groups = columns
+    backend = get_backend(backend_name)
+    ordinals, rows = backend.split_date_keys(date_index[lo:hi])
+    keys = [backend.period_of(ordinals, period)]
+    if "category" in by:
+        keys.append(backend.take(categories, rows))
+    if "use" in by:
+        keys.append(backend.take(use_groups, backend.take(uses, rows)))
+    return backend.group_stats(keys, backend.take(amounts, rows), percentiles)
+
+
+# A pool worker's copy of the columns, set once per process by _init_worker
+_columns = None
+
+
+def _init_worker(columns):
+    global _columns
+    _columns = columns
+
+
+def _group_in_worker(lo, hi, *args):
+    return _group(_columns, lo, hi, *args)
+
+
+def _picklable(column):
+    # A mapped snapshot's columns are memoryviews, which cannot be sent to a worker
+    if isinstance(column, memoryview):
+        copy = array(column.format)
+        copy.frombytes(column.cast("B"))
+        return copy
+    return column
+
+
+def chunk_bounds(date_index, period, chunks):
+    """Split positions of date_index into about `chunks` runs, each ending on a period boundary."""
+    months = PERIOD_MONTHS[period]
+    size = len(date_index)
+    bounds = [0]
+    for n in range(1, chunks):
+        target = n * size // chunks
+        if target <= bounds[-1]:
+            continue
+        # Move the cut forward to where the next period starts
+        number = month_of(date_index[target] >> 32) // months
+        cut = bisect_left(date_index, month_start((number + 1) * months) << 32, target)
+        if bounds[-1] < cut < size:
+            bounds.append(cut)
+    bounds.append(size)
+    return bounds
+
+
+def pivot(store, period="month", by=DIMENSIONS, percentiles=DEFAULT_PERCENTILES, workers=1,
+          backend=None, chunks_per_worker=4):
+    """Group the dated expenses of store by period and by the dimensions in `by`.
+
+    workers > 1 groups chunks of the rows in that many processes; None uses one
+    per CPU once there are at least PARALLEL_MIN_ROWS dated rows.
+    """
+    if period not in PERIODS:
+        raise ValueError(f"Unknown report period: {period}")
+    unknown = set(by) - set(DIMENSIONS)
+    if unknown:
+        raise ValueError(f"Cannot group by {', '.join(sorted(unknown))}")
+    by = tuple(dimension for dimension in DIMENSIONS if dimension in by)
+    percentiles = tuple(percentiles)
+    backend = backend or get_backend()
+    use_names, use_groups = _use_groups(store)
+    columns = (store.date_index, store.amounts, store.categories, store.uses, use_groups)
+    rows = len(store.date_index)
+    if workers is None:
+        workers = (os.cpu_count() or 1) if rows >= PARALLEL_MIN_ROWS else 1
+    args = (period, by, percentiles, backend.name)
+    if workers <= 1 or rows < 2:
+        stats = _group(columns, 0, rows, *args)
+    else:
+        bounds = chunk_bounds(store.date_index, period, workers * chunks_per_worker)
+        stats = {}
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(tuple(map(_picklable, columns)),)) as pool:
+            for part in pool.map(_group_in_worker, bounds[:-1], bounds[1:], *(repeat(arg) for arg in args)):
+                # Chunks end on period boundaries, so no group is in two of them
+                stats.update(part)
+
+    category_names = store.category_table.values
+    report_rows = []
+    for key, (count, total, quantiles) in stats.items():
+        labels = [period_label(key[0], period)]
+        for dimension, code in zip(by, key[1:]):
+            labels.append(category_names[code] if dimension == "category" else use_names[code])
+        report_rows.append((key[0], labels, count, total, quantiles))
+    report_rows.sort(key=lambda row: (row[0], row[1][1:]))
+    return PivotReport(period, by, percentiles,
+                       [(*labels, count, total, total / count, *quantiles)
+                        for _, labels, count, total, quantiles in report_rows])
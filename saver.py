@@ -0,0 +1,146 @@
+#Background saving for the GUI.
+#
+#SaveWorker owns a thread that writes the tracker to disk, so the Tk event loop
+#never waits on a write or an fsync. request() only records that something
+#changed. The worker waits until changes have stopped for `delay` seconds, or
+#until `max_delay` has passed since the first of them, and then saves once, so a
+#burst of edits costs a single journal append. What gets written is taken under
+#the tracker lock (see BudgetTracker.save_expenses), so every save is a
+#consistent snapshot even while the UI keeps changing the expenses.
+
+import threading
+import time
+from collections import deque
+
+
+class SaveWorker:
+    # Wait this long before trying again after a failed save
+    retry_delay = 5.0
+
+    def __init__(self, tracker, expenses_file=None, budget_file=None, delay=0.25, max_delay=2.0):
+        self.tracker = tracker
+        self.expenses_file = expenses_file or tracker.expenses_file
+        self.budget_file = budget_file or tracker.budget_file
+        self.delay = delay
+        self.max_delay = max_delay
+        # Counters of requests: made, handed to a save, and covered by a finished save
+        self.requested = 0
+        self.taken = 0
+        self.saved = 0
+        self.saves = 0
+        self.failures = 0
+        # Seconds per save, most recent last
+        self.latencies = deque(maxlen=100)
+        self._first = None
+        self._last = None
+        self._not_before = 0.0
+        self._flushing = 0
+        self._closing = False
+        self._cond = threading.Condition()
+        # A daemon so a forgotten close() cannot hang the exit; close() flushes first
+        self._thread = threading.Thread(target=self._run, name="save-worker", daemon=True)
+        self._thread.start()
+
+    def request(self):
+        """Note that the tracker changed; cheap enough to call after every mutation."""
+        with self._cond:
+            now = time.monotonic()
+            if self._first is None:
+                self._first = now
+            self._last = now
+            self.requested += 1
+            self._cond.notify_all()
+
+    @property
+    def queue_depth(self):
+        """Requests not yet covered by a finished save."""
+        return self.requested - self.saved
+
+    def _due(self):
+        if self._flushing or self._closing:
+            return self._not_before
+        return max(min(self._last + self.delay, self._first + self.max_delay), self._not_before)
+
+    def _run(self):
+        cond = self._cond
+        while True:
+            with cond:
+                while self.requested == self.taken and not self._closing:
+                    cond.wait()
+                if self.requested == self.taken:
+                    return
+                # Debounce: every new request pushes the save back, up to max_delay
+                while True:
+                    wait = self._due() - time.monotonic()
+                    if wait <= 0:
+                        break
+                    cond.wait(wait)
+                batch = self.taken = self.requested
+                self._first = None
+
+            start = time.perf_counter()
+            saved = self.tracker.save_expenses(self.expenses_file)
+            saved = self.tracker.save_budget(self.budget_file) and saved
+            elapsed = time.perf_counter() - start
+
+            with cond:
+                self.latencies.append(elapsed)
+                self.saves += 1
+                if saved:
+                    self.saved = batch
+                else:
+                    # The tracker kept the unsaved changes; retry them later
+                    self.failures += 1
+                    self.taken = self.saved
+                    self._first = self._last = time.monotonic()
+                    self._not_before = self._first + self.retry_delay
+                cond.notify_all()
+                if self._closing and not saved:
+                    return
+
+    def flush(self, timeout=None):
+        """Save everything requested so far right away and wait for it.
+
+        Returns True once it is durably on disk, False if a save failed or the
+        timeout ran out.
+        """
+        cond = self._cond
+        with cond:
+            target = self.requested
+            failures = self.failures
+            self._flushing += 1
+            self._not_before = 0.0
+            cond.notify_all()
+            try:
+                return cond.wait_for(lambda: self.saved >= target or self.failures > failures
+                                     or not self._thread.is_alive(), timeout) \
+                    and self.saved >= target
+            finally:
+                self._flushing -= 1
+
+    def close(self, timeout=None):
+        """Flush, stop the worker and wait for journal compaction; returns flush()'s result."""
+        saved = self.flush(timeout)
+        with self._cond:
+            # One last immediate attempt at anything a failed flush left behind
+            self._closing = True
+            self._not_before = 0.0
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self.tracker.close()
+        return saved
+
+    def stats(self):
+        """Queue depth and save latency figures (milliseconds) for display."""
+        with self._cond:
+            latencies = sorted(self.latencies)
+            last = self.latencies[-1] if self.latencies else None
+            return {
+                "queue_depth": self.queue_depth,
+                "saving": self.taken > self.saved,
+                "saves": self.saves,
+                "failures": self.failures,
+                "last_ms": None if last is None else last * 1e3,
+                "p50_ms": latencies[len(latencies) // 2] * 1e3 if latencies else None,
+                "max_ms": latencies[-1] * 1e3 if latencies else None,
+            }
@@ -0,0 +1,129 @@
+#Token and prefix index over expense descriptions and categories.
+#
+#Every lowercase word of a row's description and category maps to the set of
+#rows containing it. The distinct tokens are also kept sorted, so a prefix
+#resolves to a contiguous run of tokens found by bisect. The index listens to
+#the ExpenseStore and follows every add, edit and remove.
+
+import heapq
+import re
+from bisect import bisect_left, insort
+from functools import lru_cache
+
+_WORD = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=65536)
+def tokenize(text):
+    # Cached: descriptions and categories repeat a lot across rows
+    return frozenset(_WORD.findall(text.lower())) if text else frozenset()
+
+
+class SearchIndex:
+    # Prefix unions to keep cached; the oldest is dropped beyond this
+    max_cached_prefixes = 64
+
+    def __init__(self, store):
+        self.store = store
+        # Prefix unions are reused between keystrokes and kept current on changes
+        self._prefixes = {}
+        self.rebuild()
+        store.listeners.append(self.on_change)
+
+    def detach(self):
+        self.store.listeners.remove(self.on_change)
+
+    def rebuild(self):
+        self.postings = {}
+        self.tokens = None
+        self._prefixes = {}
+        store = self.store
+        for row in store.order:
+            self._add(row, store.descriptions[row], store.category_table.values[store.categories[row]])
+        self.tokens = sorted(self.postings)
+
+    def _add(self, row, description, category):
+        postings = self.postings
+        for token in tokenize(description) | tokenize(category):
+            for prefix, rows in self._prefixes.items():
+                if token.startswith(prefix):
+                    rows.add(row)
+            rows = postings.get(token)
+            if rows is None:
+                postings[token] = {row}
+                if self.tokens is not None:
+                    insort(self.tokens, token)
+            else:
+                rows.add(row)
+
+    def _remove(self, row, description, category):
+        postings = self.postings
+        tokens = tokenize(description) | tokenize(category)
+        for prefix, rows in self._prefixes.items():
+            # _add puts the row back if its new values still match
+            if any(token.startswith(prefix) for token in tokens):
+                rows.discard(row)
+        for token in tokens:
+            rows = postings.get(token)
+            if rows is None:
+                continue
+            rows.discard(row)
+            if not rows:
+                del postings[token]
+                del self.tokens[bisect_left(self.tokens, token)]
+
+    def on_change(self, op, index, row, values, old):
+        if op == "compact":
+            self.rebuild()
+            return
+        if op == "extend":
+            store = self.store
+            categories = store.category_table.values
+            for new in range(row, len(store.descriptions)):
+                self._add(new, store.descriptions[new], categories[store.categories[new]])
+            return
+        if old is not None:
+            self._remove(row, old[1], old[4])
+        if values is not None:
+            self._add(row, values[1], values[4])
+
+    def prefix_rows(self, prefix):
+        """Set of rows with a token starting with prefix. Do not modify it."""
+        rows = self._prefixes.get(prefix)
+        if rows is not None:
+            return rows
+        tokens = self.tokens
+        start = bisect_left(tokens, prefix)
+        end = bisect_left(tokens, prefix + "\U0010ffff", start)
+        rows = set()
+        for token in tokens[start:end]:
+            rows |= self.postings[token]
+        if len(self._prefixes) >= self.max_cached_prefixes:
+            del self._prefixes[next(iter(self._prefixes))]
+        self._prefixes[prefix] = rows
+        return rows
+
+    def match(self, query):
+        """Set of rows matching every word of query as a word prefix.
+
+        "gro sup" matches a row whose description or category has words starting
+        with "gro" and with "sup". An empty query matches every row.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return set(self.store.order)
+        # Intersect smallest first; longer prefixes usually match fewer rows
+        sets = sorted((self.prefix_rows(term) for term in terms), key=len)
+        result = sets[0]
+        for rows in sets[1:]:
+            if not result:
+                break
+            result = result & rows
+        return result
+
+    def rows(self, query, limit=None):
+        """Matching rows in display order, only the first limit of them if given."""
+        result = self.match(query)
+        if limit is not None and limit < len(result):
+            return heapq.nsmallest(limit, result)
+        return sorted(result)
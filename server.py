@@ -0,0 +1,426 @@
+#Local HTTP/JSON API over one shared BudgetTracker.
+#
+#    python server.py [--host 127.0.0.1] [--port 8765] [--expenses FILE] [--budget FILE]
+#
+#A single asyncio event loop owns the tracker and serves any number of
+#keep-alive connections. Requests are handled one at a time on the loop, so
+#they never interleave, and each is only an index or rollup lookup on the
+#store. Writes are not saved per request: a SaveWorker (saver.py) batches
+#everything that changed within --save-delay seconds into one journal append or
+#transaction, and POST /save waits until all changes so far are on disk. The
+#server locks the expense and budget files (BudgetTracker.lock), so a CLI or GUI
+#started on the same files refuses to run instead of overwriting its changes.
+#
+#Expenses are {"id", "date", "description", "amount", "use", "category"}.
+#  GET    /expenses         {"count", "expenses"}; filters ?start=&end= (YYYY-MM-DD),
+#                           ?q= (search), ?use=, ?category=, paged by ?offset=&limit=
+#  POST   /expenses         one expense or a list of them, without ids; {"ids": [...]}
+#  GET    /expenses/ID
+#  PUT    /expenses/ID      replace every field
+#  PATCH  /expenses/ID      replace the fields given
+#  DELETE /expenses/ID
+#  GET    /totals           total, per use and per category, budget and remaining;
+#                           with ?start=&end=, only the total between those dates
+#  GET    /totals/monthly   {"YYYY-MM": amount}
+#  GET    /totals/weekly    {"YYYY-MM-DD" of the Monday: amount}
+#  GET    /budget           the budget, the recurring expenses and the monthly budgets
+#                           for ?month= (this month)
+#  PUT    /budget           {"amount"}, or {"amount", "category" or "use", "month"}
+#                           for a monthly budget; an amount of null removes it
+#  POST   /save             write pending changes now; {"saved": bool}
+#  GET    /metrics          latency figures and counters, and the save queue
+
+import argparse
+import asyncio
+import inspect
+import json
+import logging
+import signal
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from budget import BudgetTracker
+from commands import expense_json, expense_values
+from filelock import LockedError
+from metrics import count, setup_logging, snapshot, timer
+from saver import SaveWorker
+from store import Expense
+
+log = logging.getLogger("budget.server")
+
+DEFAULT_PORT = 8765
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 10000
+# Larger request bodies are refused with 413
+MAX_BODY = 16 << 20
+MAX_HEADERS = 100
+
+# Path -> {method: handler name}; "{id}" matches an expense id
+ROUTES = {
+    "/expenses": {"GET": "list_expenses", "POST": "add_expenses"},
+    "/expenses/{id}": {"GET": "get_expense", "PUT": "replace_expense", "PATCH": "patch_expense",
+                       "DELETE": "remove_expense"},
+    "/totals": {"GET": "totals"},
+    "/totals/monthly": {"GET": "monthly_totals"},
+    "/totals/weekly": {"GET": "weekly_totals"},
+    "/budget": {"GET": "get_budget", "PUT": "set_budget"},
+    "/save": {"POST": "save"},
+    "/metrics": {"GET": "metrics"},
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class BudgetAPI:
+    """The endpoints, as methods from (query, body, *path args) to (status, JSON).
+
+    A method that has to wait returns an awaitable of (status, JSON) instead.
+    """
+
+    def __init__(self, tracker, save_worker):
+        self.tracker = tracker
+        self.save_worker = save_worker
+
+    def handle(self, method, target, body):
+        """Answer one request; returns (status, JSON-able payload or None), or an awaitable of it."""
+        url = urlsplit(target)
+        parts = url.path.strip("/").split("/")
+        args = ()
+        if len(parts) == 2 and parts[0] == "expenses":
+            try:
+                args = (int(parts[1]),)
+            except ValueError:
+                return 404, {"error": f"No expense with id {parts[1]!r}"}
+            path = "/expenses/{id}"
+        else:
+            path = "/" + "/".join(parts)
+        methods = ROUTES.get(path)
+        if methods is None:
+            return 404, {"error": f"No such endpoint {url.path}"}
+        name = methods.get(method)
+        if name is None:
+            return 405, {"error": f"{method} is not allowed on {path}; use {', '.join(methods)}"}
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        with timer(f"api {method} {path}"):
+            try:
+                data = json.loads(body) if body else None
+            except ValueError as e:
+                return 400, {"error": f"Invalid JSON: {e}"}
+            try:
+                return getattr(self, name)(query, data, *args)
+            except HTTPError as e:
+                return e.status, {"error": str(e)}
+            except ValueError as e:
+                return 400, {"error": str(e)}
+
+    def _requested(self):
+        # Something changed: have the save worker write it out soon
+        self.save_worker.request()
+
+    # --- expenses ---
+
+    def list_expenses(self, query, data):
+        try:
+            offset = int(query.get("offset", 0))
+            limit = min(int(query.get("limit", DEFAULT_LIMIT)), MAX_LIMIT)
+        except ValueError:
+            raise HTTPError(400, "offset and limit must be integers") from None
+        if offset < 0 or limit < 0:
+            raise HTTPError(400, "offset and limit must not be negative")
+        tracker = self.tracker
+        if "q" in query:
+            expenses = tracker.search_expenses(query["q"])
+        elif "start" in query or "end" in query:
+            expenses = tracker.expenses_between(query.get("start", "0001-01-01"), query.get("end", "9999-12-31"))
+        else:
+            expenses = None
+        use, category = query.get("use"), query.get("category")
+        if expenses is None and use is None and category is None:
+            # The plain listing pages straight through the store
+            store = tracker.expenses
+            return 200, {"count": len(store),
+                         "expenses": [expense_json(e) for e in store[offset:offset + limit]]}
+        if expenses is None:
+            expenses = tracker.expenses
+        if use is not None:
+            use = use.casefold()
+            expenses = [e for e in expenses if e.use.casefold() == use]
+        if category is not None:
+            expenses = [e for e in expenses if e.category == category]
+        return 200, {"count": len(expenses),
+                     "expenses": [expense_json(e) for e in expenses[offset:offset + limit]]}
+
+    def add_expenses(self, query, data):
+        tracker = self.tracker
+        if isinstance(data, list):
+            rows = [expense_values(item) for item in data]
+            first = tracker.expenses.next_id
+            added = tracker.add_expenses(rows)
+            ids = list(range(first, first + added))
+        else:
+            expense = Expense(*expense_values(data))
+            tracker.add_expense(expense)
+            ids = [expense.id]
+        self._requested()
+        return 201, {"ids": ids}
+
+    def _expense(self, expense_id):
+        expense = self.tracker.get_expense(expense_id)
+        if expense is None:
+            raise HTTPError(404, f"No expense with id {expense_id}")
+        return expense
+
+    def get_expense(self, query, data, expense_id):
+        return 200, expense_json(self._expense(expense_id))
+
+    def replace_expense(self, query, data, expense_id, patch=False):
+        expense = self._expense(expense_id)
+        values = expense_values(data, expense.values() if patch else None)
+        self.tracker.edit_expense_by_id(expense_id, *values)
+        self._requested()
+        return 200, expense_json(expense)
+
+    def patch_expense(self, query, data, expense_id):
+        return self.replace_expense(query, data, expense_id, patch=True)
+
+    def remove_expense(self, query, data, expense_id):
+        if not self.tracker.remove_expense_by_id(expense_id):
+            raise HTTPError(404, f"No expense with id {expense_id}")
+        self._requested()
+        return 204, None
+
+    # --- totals and budget ---
+
+    def totals(self, query, data):
+        tracker = self.tracker
+        if "start" in query or "end" in query:
+            start, end = query.get("start", "0001-01-01"), query.get("end", "9999-12-31")
+            return 200, {"start": start, "end": end, "total": tracker.total_between(start, end)}
+        total = tracker.total_expenses()
+        return 200, {"total": total,
+                     "by_use": tracker.total_expenses_by_uses(),
+                     "by_category": tracker.total_expenses_by_categories(),
+                     "budget": tracker.budget,
+                     "remaining": None if tracker.budget is None else tracker.budget - total}
+
+    def monthly_totals(self, query, data):
+        return 200, self.tracker.monthly_totals()
+
+    def weekly_totals(self, query, data):
+        return 200, self.tracker.weekly_totals()
+
+    def get_budget(self, query, data):
+        tracker = self.tracker
+        return 200, {"budget": tracker.budget,
+                     "limits": tracker.limits.to_json(),
+                     "recurring": tracker.recurring.to_json(),
+                     "monthly": [{"scope": s.scope, "name": s.name, "limit": s.limit, "spent": s.spent,
+                                  "remaining": s.remaining, "exceeded": s.exceeded}
+                                 for s in tracker.check_limits(query.get("month"))]}
+
+    def set_budget(self, query, data):
+        if not isinstance(data, dict) or "amount" not in data:
+            raise HTTPError(400, 'Expected {"amount": ...}')
+        amount = data["amount"]
+        if amount is not None and (isinstance(amount, bool) or not isinstance(amount, (int, float))):
+            raise HTTPError(400, f"Invalid amount {amount!r}")
+        tracker = self.tracker
+        if any(key in data for key in ("category", "use", "month")):
+            tracker.set_monthly_budget(amount, category=data.get("category"), use=data.get("use"),
+                                       month=data.get("month"))
+        else:
+            tracker.set_budget(amount)
+        self._requested()
+        return self.get_budget(query, None)
+
+    # --- server ---
+
+    def save(self, query, data):
+        # Waits on another thread, so the loop keeps serving while the save runs
+        return asyncio.get_running_loop().run_in_executor(None, self._flush)
+
+    def _flush(self):
+        return 200, {"saved": self.save_worker.flush()}
+
+    def metrics(self, query, data):
+        return 200, {**snapshot(), "save": self.save_worker.stats(), "expenses": len(self.tracker.expenses)}
+
+
+class Server:
+    """Serves a BudgetAPI over HTTP/1.1 with keep-alive."""
+
+    def __init__(self, api, host="127.0.0.1", port=DEFAULT_PORT):
+        self.api = api
+        self.host = host
+        self.port = port
+        self._server = None
+        self._writers = set()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port, limit=1 << 16)
+        # Port 0 picks a free port
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    @property
+    def connections(self):
+        return len(self._writers)
+
+    def close(self):
+        """Stop listening and hang up on the open connections."""
+        if self._server is not None:
+            self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+
+    async def _serve(self, reader, writer):
+        self._writers.add(writer)
+        count("api_connections")
+        try:
+            while await self._serve_request(reader, writer):
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # Shutting down; asyncio would log a cancelled connection handler as an error
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _serve_request(self, reader, writer):
+        """Read and answer one request; returns whether to keep the connection open."""
+        try:
+            line = await reader.readline()
+            while line in (b"\r\n", b"\n"):
+                line = await reader.readline()
+            if not line:
+                return False
+            method, target, version = line.decode("latin-1").split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                if len(headers) == MAX_HEADERS:
+                    raise HTTPError(431, "Too many headers")
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+        except (ValueError, asyncio.LimitOverrunError):
+            await self._respond(writer, 400, {"error": "Malformed request"}, False)
+            return False
+        except HTTPError as e:
+            await self._respond(writer, e.status, {"error": str(e)}, False)
+            return False
+        keep_alive = headers.get("connection", "").lower() != "close" if version == "HTTP/1.1" \
+            else headers.get("connection", "").lower() == "keep-alive"
+        if "transfer-encoding" in headers:
+            await self._respond(writer, 411, {"error": "Send a Content-Length instead of chunks"}, False)
+            return False
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            length = -1
+        if not 0 <= length <= MAX_BODY:
+            await self._respond(writer, 413 if length > MAX_BODY else 400,
+                                {"error": "Invalid or too large Content-Length"}, False)
+            return False
+        body = await reader.readexactly(length) if length else b""
+        count("api_requests")
+        try:
+            result = self.api.handle(method.upper(), target, body)
+            status, payload = await result if inspect.isawaitable(result) else result
+        except Exception:
+            log.exception(f"{method} {target} failed")
+            status, payload = 500, {"error": "Internal error"}
+        await self._respond(writer, status, payload, keep_alive)
+        return keep_alive
+
+    @staticmethod
+    async def _respond(writer, status, payload, keep_alive):
+        body = b"" if payload is None else json.dumps(payload).encode()
+        head = (f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+
+def open_tracker(expenses_file=None, budget_file=None):
+    """A tracker locked to and loaded from the given files.
+
+    Raises LockedError if they are in use, and RuntimeError if one exists but
+    cannot be read: serving an empty tracker would save over it.
+    """
+    tracker = BudgetTracker()
+    if expenses_file:
+        tracker.expenses_file = expenses_file
+    if budget_file:
+        tracker.budget_file = budget_file
+    tracker.lock()
+    if not (tracker.load_expenses() and tracker.load_budget()):
+        tracker.close()
+        raise RuntimeError("Could not load the expenses or the budget")
+    return tracker
+
+
+async def serve(tracker, host="127.0.0.1", port=DEFAULT_PORT, save_delay=0.05, max_save_delay=1.0,
+                started=None):
+    """Serve tracker until cancelled, then save what is pending.
+
+    started, if given, is called with the Server once it is listening.
+    """
+    save_worker = SaveWorker(tracker, delay=save_delay, max_delay=max_save_delay)
+    server = await Server(BudgetAPI(tracker, save_worker), host, port).start()
+    log.info(f"Serving the budget API on http://{server.host}:{server.port}")
+    try:
+        # Stop like on Ctrl+C, saving first
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass
+    if started is not None:
+        started(server)
+    try:
+        await server.serve_forever()
+    finally:
+        server.close()
+        if not save_worker.close():
+            log.error("Some changes could not be saved.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Budget Tracker API server")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"default {DEFAULT_PORT}")
+    parser.add_argument("--expenses", help=f"expense file (default {BudgetTracker.expenses_file})")
+    parser.add_argument("--budget", help=f"budget file (default {BudgetTracker.budget_file})")
+    parser.add_argument("--save-delay", type=float, default=0.05,
+                        help="seconds of quiet before pending writes are saved (default 0.05)")
+    parser.add_argument("--log-level", help="DEBUG, INFO (default), WARNING or ERROR")
+    args = parser.parse_args()
+    setup_logging(args.log_level)
+    try:
+        tracker = open_tracker(args.expenses, args.budget)
+    except LockedError as e:
+        log.error(f"{e}. Close the other Budget Tracker using these files first.")
+        raise SystemExit(1)
+    except RuntimeError as e:
+        log.error(f"{e}; not serving, so nothing overwrites them.")
+        raise SystemExit(1)
+    try:
+        asyncio.run(serve(tracker, args.host, args.port, args.save_delay))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+
+if __name__ == "__main__":
+    main()
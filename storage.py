@@ -0,0 +1,556 @@
+#Storage backends for the tracker's expenses and budget.
+#
+#  JSONStorage    a .json/.jsonl or binary .bin snapshot (formats.py) with an
+#                 append-only journal (journal.py)
+#  SQLiteStorage  an SQLite database (.db, .sqlite, .sqlite3) holding expenses
+#                 and budget
+#  PartitionedStorage
+#                 a directory (.parts) with a JSON Lines file per month, of which
+#                 only the recent months are loaded up front (see partitions.py)
+#
+#open_storage(filename) picks the backend from the extension. All take the same
+#calls from BudgetTracker: load() streams the saved expenses into a store,
+#save() writes the operations recorded since the last save (see
+#BudgetTracker._record), or the whole store when asked to rewrite it, and
+#load_budget()/save_budget() keep the budget.
+
+import json
+import os
+import threading
+
+from formats import BinarySnapshot, RecordReader, is_binary, snapshot_chunks
+from journal import Journal, read_snapshot, write_atomic
+from partitions import Partitions, Summary, month_key, month_order, parse_partition_name, partition_name
+from store import FIELDS
+
+_UNSAVED = object()
+_DATABASE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+_PARTITIONED_EXTENSION = ".parts"
+
+
+def expense_values(record):
+    return (record["date"], record["description"], record["amount"], record["use"], record["category"])
+
+
+def replay(store, records):
+    # Edits and removes name the expense by id; journals from before ids by index
+    for record in records:
+        op = record["op"]
+        if op == "add":
+            store.append(*expense_values(record["expense"]), expense_id=record["expense"].get("id"))
+        elif op == "edit":
+            if "id" in record:
+                store.update_row(store.row_of_id(record["id"]), *expense_values(record["expense"]))
+            else:
+                store.update(record["index"], *expense_values(record["expense"]))
+        elif op == "remove":
+            if "id" in record:
+                store.delete_row(store.row_of_id(record["id"]))
+            else:
+                store.delete(record["index"])
+
+
+def is_database(filename):
+    return filename.lower().endswith(_DATABASE_EXTENSIONS)
+
+
+def is_partitioned(filename):
+    return filename.lower().rstrip("/\\").endswith(_PARTITIONED_EXTENSION) or os.path.isdir(filename)
+
+
+def open_storage(filename):
+    if is_database(filename):
+        return SQLiteStorage(filename)
+    if is_partitioned(filename):
+        return PartitionedStorage(filename)
+    return JSONStorage(filename)
+
+
+class JSONStorage:
+    # Every expense is loaded, so there are no partitions to page in
+    partitions = None
+
+    def __init__(self, filename):
+        self.filename = filename
+        # None until the file has been loaded or fully written
+        self.journal = None
+        self.saved_budget = _UNSAVED
+
+    def matches(self, filename):
+        return os.path.abspath(filename) == os.path.abspath(self.filename)
+
+    def load(self, store, chunk_rows=5000):
+        """Stream the snapshot into store, replay the journal, and yield the row count per chunk.
+
+        A binary snapshot is mapped into the store in one go instead.
+        """
+        if is_binary(self.filename):
+            snapshot = BinarySnapshot(self.filename)
+            yield store.map_snapshot(snapshot)
+            crc = snapshot.crc
+        else:
+            crc = yield from self._stream(store, chunk_rows)
+        journal = Journal(self.filename)
+        replay(store, journal.recover(crc))
+        self.journal = journal
+
+    def _stream(self, store, chunk_rows):
+        with open(self.filename, "rb") as file:
+            reader = RecordReader(file)
+            rows, ids = [], []
+            count = 0
+            for expense in reader:
+                rows.append(expense_values(expense))
+                ids.append(expense.get("id"))
+                if len(rows) == chunk_rows:
+                    count += self._extend(store, rows, ids)
+                    rows, ids = [], []
+                    yield count
+            if rows:
+                self._extend(store, rows, ids)
+        return reader.crc
+
+    @staticmethod
+    def _extend(store, rows, ids):
+        # Files written before expenses had ids get fresh ones
+        return store.extend(rows, None if None in ids else ids)
+
+    def needs_snapshot(self, rows, pending):
+        """Whether save() must be given a copy of the store along with pending records."""
+        return self.journal is None or self.journal.should_compact(rows, pending)
+
+    def save(self, pending, snapshot):
+        """Append pending to the journal; with pending None, rewrite the file from snapshot.
+
+        A snapshot given with pending is folded into the file in the background.
+        """
+        if pending is not None and self.journal is not None:
+            self.journal.append(pending)
+            if snapshot is not None:
+                self.journal.compact(snapshot_chunks(snapshot, self.filename))
+            return
+        if self.journal is not None:
+            self.journal.close()
+        journal = Journal(self.filename)
+        journal.reset(write_atomic(self.filename, snapshot_chunks(snapshot, self.filename)))
+        self.journal = journal
+
+    def load_budget(self):
+        data, crc = read_snapshot(self.filename)
+        if data is None:
+            raise FileNotFoundError(self.filename)
+        budget = json.loads(data)
+        journal = Journal(self.filename)
+        for record in journal.recover(crc):
+            if record["op"] == "budget":
+                budget = record["amount"]
+        self.journal = journal
+        self.saved_budget = budget
+        return budget
+
+    def save_budget(self, budget):
+        journal = self.journal
+        if journal is not None:
+            if budget != self.saved_budget:
+                journal.append([{"op": "budget", "amount": budget}])
+                if journal.should_compact(0):
+                    journal.compact([json.dumps(budget)], background=False)
+        else:
+            journal = Journal(self.filename)
+            journal.reset(write_atomic(self.filename, [json.dumps(budget)]))
+            self.journal = journal
+        self.saved_budget = budget
+
+    def close(self):
+        """Wait for background compaction and release the journal file."""
+        if self.journal is not None:
+            self.journal.close()
+
+
+class SQLiteStorage:
+    """Expenses and budget in one SQLite database.
+
+    The INTEGER PRIMARY KEY is the expense id, so the operations the tracker
+    records are applied as INSERT/UPDATE/DELETE by key, and rows keep their
+    insertion order. All the operations of one save run in a single
+    transaction on one connection that is kept open. Queries are answered by
+    the loaded store like for the other backends; count() and total() are only
+    for checking a migration.
+    """
+
+    # Rows per executemany call when rewriting the whole table
+    batch_rows = 5000
+    partitions = None
+
+    def __init__(self, filename):
+        self.filename = filename
+        # Whether the table matches the store as of the last save or load
+        self.synced = False
+        self.saved_budget = _UNSAVED
+        self._connection = None
+        # The save worker writes from its own thread
+        self._lock = threading.RLock()
+
+    def matches(self, filename):
+        return os.path.abspath(filename) == os.path.abspath(self.filename)
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            # sqlite3 is only imported once a database is actually used
+            import sqlite3
+            connection = sqlite3.connect(self.filename, check_same_thread=False,
+                                         isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # FULL: a committed save survives power loss, like the fsynced journal
+            connection.execute("PRAGMA synchronous=FULL")
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS expenses (
+                    id INTEGER PRIMARY KEY,
+                    date TEXT NOT NULL,
+                    description TEXT NOT NULL,
+                    amount REAL NOT NULL,
+                    use TEXT NOT NULL,
+                    category TEXT NOT NULL
+                );
+                -- Earlier versions indexed these for SQL aggregates nothing queries; they only slowed writes
+                DROP INDEX IF EXISTS expenses_date;
+                DROP INDEX IF EXISTS expenses_category;
+                DROP INDEX IF EXISTS expenses_use;
+                CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """)
+            self._connection = connection
+        return self._connection
+
+    def _transaction(self, statements):
+        """Run statements(cursor) inside one transaction."""
+        with self._lock:
+            cursor = self.connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                statements(cursor)
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+
+    def _require_file(self):
+        # Loading must not create an empty database in place of a missing one
+        if self._connection is None and not os.path.exists(self.filename):
+            raise FileNotFoundError(self.filename)
+
+    # --- expenses ---
+
+    def load(self, store, chunk_rows=5000):
+        self._require_file()
+        count = 0
+        with self._lock:
+            cursor = self.connection.execute(
+                "SELECT id, date, description, amount, use, category FROM expenses ORDER BY id")
+            rows = cursor.fetchmany(chunk_rows)
+            while rows:
+                store.extend([row[1:] for row in rows], [row[0] for row in rows])
+                count += len(rows)
+                yield count
+                rows = cursor.fetchmany(chunk_rows)
+        self.synced = True
+
+    def needs_snapshot(self, rows, pending):
+        # Until the rows have been loaded or written the table may not match the store
+        return not self.synced
+
+    def save(self, pending, snapshot):
+        """Apply pending in one transaction; with pending None, replace every row with snapshot."""
+        if pending is None or not self.synced:
+            self.synced = False
+            self._transaction(lambda cursor: self._rewrite(cursor, snapshot))
+            self.synced = True
+            return
+        if not pending:
+            return
+        # Until the transaction commits; a failed save rewrites everything
+        self.synced = False
+
+        def apply(cursor):
+            adds = []
+            for record in pending:
+                op = record["op"]
+                if op == "add":
+                    adds.append((record["expense"]["id"], *expense_values(record["expense"])))
+                    continue
+                if adds:
+                    self._insert(cursor, adds)
+                    adds = []
+                if op == "edit":
+                    cursor.execute("UPDATE expenses SET date=?, description=?, amount=?, use=?, category=? "
+                                   "WHERE id=?", (*expense_values(record["expense"]), record["id"]))
+                elif op == "remove":
+                    cursor.execute("DELETE FROM expenses WHERE id=?", (record["id"],))
+            if adds:
+                self._insert(cursor, adds)
+
+        self._transaction(apply)
+        self.synced = True
+
+    @staticmethod
+    def _insert(cursor, rows):
+        cursor.executemany("INSERT INTO expenses (id, date, description, amount, use, category) "
+                           "VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def _rewrite(self, cursor, snapshot):
+        cursor.execute("DELETE FROM expenses")
+        batch = []
+        for record in snapshot.records():
+            batch.append((record["id"], *(record[field] for field in FIELDS)))
+            if len(batch) == self.batch_rows:
+                self._insert(cursor, batch)
+                batch = []
+        if batch:
+            self._insert(cursor, batch)
+
+    # --- budget ---
+
+    def load_budget(self):
+        self._require_file()
+        with self._lock:
+            row = self.connection.execute("SELECT value FROM settings WHERE key='budget'").fetchone()
+        if row is None:
+            raise FileNotFoundError(self.filename)
+        self.saved_budget = json.loads(row[0])
+        return self.saved_budget
+
+    def save_budget(self, budget):
+        if budget == self.saved_budget:
+            return
+        self._transaction(lambda cursor: cursor.execute(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES ('budget', ?)", (json.dumps(budget),)))
+        self.saved_budget = budget
+
+    # --- checks computed by SQLite, for migrate.py ---
+
+    def _scalar(self, sql, params=()):
+        with self._lock:
+            return self.connection.execute(sql, params).fetchone()[0]
+
+    def count(self):
+        return self._scalar("SELECT COUNT(*) FROM expenses")
+
+    def total(self):
+        return self._scalar("SELECT TOTAL(amount) FROM expenses")
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+class PartitionedStorage:
+    """Expenses in a directory with one JSON Lines file per month, loaded month by month.
+
+    load() reads the recent months only; read_month() fetches the others when
+    the tracker needs them, and `partitions` keeps the summary of every month.
+    save() rewrites, atomically, just the month files the pending records
+    touch, then the manifest. The budget is kept in budget.json inside the
+    directory.
+    """
+
+    manifest_name = "manifest.json"
+
+    def __init__(self, filename):
+        self.filename = filename.rstrip("/\\") or filename
+        self.partitions = Partitions()
+        # Whether partitions.resident matches the tracker's store, as after a load or save
+        self.loaded = False
+        self.next_id = 1
+        # Month of each expense in the store, for applying edits and removes
+        self._month_of_id = {}
+        self._budget = JSONStorage(os.path.join(self.filename, "budget.json"))
+
+    def matches(self, filename):
+        return os.path.abspath(filename.rstrip("/\\") or filename) == os.path.abspath(self.filename)
+
+    def _path(self, month):
+        return os.path.join(self.filename, partition_name(month) + ".jsonl")
+
+    # --- expenses ---
+
+    def _read_records(self, month):
+        try:
+            with open(self._path(month), "rb") as file:
+                return list(RecordReader(file))
+        except FileNotFoundError:
+            return []
+
+    def read_month(self, month):
+        """The (rows, ids) of a month's expenses, in the order they were added."""
+        rows, ids = [], []
+        for record in self._read_records(month):
+            rows.append(expense_values(record))
+            ids.append(record["id"])
+            self._month_of_id[record["id"]] = month
+        return rows, ids
+
+    def _scan(self):
+        """Read the manifest, summarising again any month file changed since it was written."""
+        try:
+            with open(os.path.join(self.filename, self.manifest_name), "rb") as file:
+                manifest = json.load(file)
+        except FileNotFoundError:
+            manifest = {"next_id": 1, "months": {}}
+        saved = manifest["months"]
+        summaries = {}
+        stale = False
+        for entry in os.scandir(self.filename):
+            name, extension = os.path.splitext(entry.name)
+            if extension != ".jsonl":
+                continue
+            try:
+                month = parse_partition_name(name)
+            except ValueError:
+                continue
+            stat = entry.stat()
+            summary = Summary.from_json(saved[name]) if name in saved else None
+            if summary is None or (summary.size, summary.mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+                # Written after the manifest, e.g. by a save interrupted before it got there
+                summary = self._summarise(month, self._read_records(month))
+                stale = True
+            summaries[month] = summary
+        stale = stale or len(summaries) != len(saved)
+        if not summaries and not saved and not os.path.exists(os.path.join(self.filename, self.manifest_name)):
+            raise FileNotFoundError(self.filename)
+        for month, summary in summaries.items():
+            self.partitions.set_summary(month, summary)
+        self.next_id = max([manifest["next_id"]] + [summary.max_id + 1 for summary in summaries.values()])
+        if stale:
+            self._write_manifest()
+
+    def load(self, store, chunk_rows=5000):
+        """Load the recent months into store, yielding the row count after each month."""
+        if not os.path.isdir(self.filename):
+            raise FileNotFoundError(self.filename)
+        self._scan()
+        count = 0
+        months = self.partitions.recent()
+        for month in months:
+            rows, ids = self.read_month(month)
+            store.extend(rows, ids)
+            count += len(rows)
+            yield count
+        store.next_id = max(store.next_id, self.next_id)
+        self.partitions.loaded(months)
+        self.loaded = True
+
+    def needs_snapshot(self, rows, pending):
+        return not self.loaded
+
+    def save(self, pending, snapshot):
+        """Apply pending to the month files it touches; with pending None, write snapshot.
+
+        A snapshot replaces the months it has and the months in the store;
+        other months on disk are only kept when they are offline partitions of
+        this same store.
+        """
+        os.makedirs(self.filename, exist_ok=True)
+        if pending is None or not self.loaded:
+            self._write_snapshot(snapshot)
+        elif pending:
+            self._apply(pending)
+
+    def _write_snapshot(self, snapshot):
+        months = {}
+        for record in snapshot.records():
+            months.setdefault(month_key(record["date"]), []).append(record)
+        if self.loaded:
+            gone = self.partitions.resident - set(months)
+        else:
+            # A store saved here for the first time holds every expense
+            self._scan_existing()
+            gone = set(self.partitions.summaries) - set(months)
+        self._month_of_id = {}
+        for month, records in months.items():
+            self._write_month(month, records)
+            for record in records:
+                self._month_of_id[record["id"]] = month
+        for month in gone:
+            self._write_month(month, [])
+        self.partitions.loaded(months)
+        self.next_id = max(self.next_id, snapshot.next_id)
+        self._write_manifest()
+        self.loaded = True
+
+    def _scan_existing(self):
+        try:
+            self._scan()
+        except FileNotFoundError:
+            pass
+
+    def _apply(self, pending):
+        months = {}
+
+        def month(key):
+            records = months.get(key)
+            if records is None:
+                records = months[key] = {record["id"]: record for record in self._read_records(key)}
+            return records
+
+        month_of_id = self._month_of_id
+        for record in pending:
+            op = record["op"]
+            if op == "add" or op == "edit":
+                expense = record["expense"]
+                key = month_key(expense["date"])
+                old = month_of_id.get(expense["id"], key)
+                if old != key:
+                    del month(old)[expense["id"]]
+                # An edit within the month keeps the expense in its place
+                month(key)[expense["id"]] = expense
+                month_of_id[expense["id"]] = key
+                self.next_id = max(self.next_id, expense["id"] + 1)
+            elif op == "remove":
+                del month(month_of_id.pop(record["id"]))[record["id"]]
+        self.partitions.loaded(months)
+        for key, records in months.items():
+            self._write_month(key, list(records.values()))
+        self._write_manifest()
+
+    def _write_month(self, month, records):
+        path = self._path(month)
+        if not records:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.partitions.set_summary(month, None)
+            return
+        encode = json.JSONEncoder().encode
+        write_atomic(path, (encode(record) + "\n" for record in records))
+        self.partitions.set_summary(month, self._summarise(month, records))
+
+    def _summarise(self, month, records):
+        summary = Summary.of_records(records)
+        try:
+            stat = os.stat(self._path(month))
+            summary.size, summary.mtime_ns = stat.st_size, stat.st_mtime_ns
+        except FileNotFoundError:
+            pass
+        return summary
+
+    def _write_manifest(self):
+        summaries = self.partitions.summaries
+        manifest = {"next_id": self.next_id,
+                    "months": {partition_name(month): summaries[month].to_json()
+                               for month in sorted(summaries, key=month_order)}}
+        write_atomic(os.path.join(self.filename, self.manifest_name), [json.dumps(manifest)])
+
+    # --- budget ---
+
+    def load_budget(self):
+        return self._budget.load_budget()
+
+    def save_budget(self, budget):
+        os.makedirs(self.filename, exist_ok=True)
+        self._budget.save_budget(budget)
+
+    def close(self):
+        self._budget.close()
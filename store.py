@@ -0,0 +1,792 @@
+#Columnar expense storage: each field lives in its own contiguous array instead of
+#one Python object per expense. Expense is a small row view over the columns.
+
+import math
+from array import array
+from bisect import bisect_left
+from datetime import date as Date
+
+FIELDS = ("date", "description", "amount", "use", "category")
+# The fixed-width columns of ExpenseStore and their array typecodes, as saved in
+# binary snapshots (see formats.py)
+COLUMNS = (("ids", "q"), ("amounts", "d"), ("date_index", "q"), ("dates", "i"),
+           ("categories", "I"), ("uses", "H"))
+
+
+class StringTable:
+    """Dictionary encoding for repeated strings (uses, categories, odd dates)."""
+
+    __slots__ = ("values", "codes")
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.codes[value] = code
+        return code
+
+    def decode(self, code):
+        return self.values[code]
+
+    def __len__(self):
+        return len(self.values)
+
+
+def date_to_ordinal(text):
+    """Return the proleptic ordinal of a YYYY-MM-DD string, or None if it is not one."""
+    try:
+        parsed = Date.fromisoformat(text)
+    except (TypeError, ValueError):
+        return None
+    # fromisoformat also accepts forms like 20240105; only take exact round trips
+    if parsed.isoformat() != text:
+        return None
+    return parsed.toordinal()
+
+
+def as_ordinal(value):
+    """Accept a datetime.date, a YYYY-MM-DD string or an ordinal and return the ordinal."""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, Date):
+        return value.toordinal()
+    ordinal = date_to_ordinal(value)
+    if ordinal is None:
+        raise ValueError(f"Invalid date {value!r}, expected YYYY-MM-DD")
+    return ordinal
+
+
+def month_of(ordinal):
+    """Months counted from year 0: year * 12 + month - 1."""
+    day = Date.fromordinal(ordinal)
+    return day.year * 12 + day.month - 1
+
+
+def month_start(month):
+    return Date(month // 12, month % 12 + 1, 1).toordinal()
+
+
+def week_of(ordinal):
+    # Ordinal 1 (0001-01-01) is a Monday, so weeks run Monday to Sunday
+    return (ordinal - 1) // 7
+
+
+def _as_amount(value):
+    # What an array("d") slot takes (a real number, not a numeric string), checked
+    # before any column changes so a bad amount cannot leave them misaligned
+    if isinstance(value, (str, bytes, bytearray)):
+        raise TypeError(f"Invalid amount {value!r}, expected a number")
+    return float(value)
+
+
+_ROW_BITS = 32
+_ROW_MASK = (1 << _ROW_BITS) - 1
+
+
+def _column(index, name):
+    def fget(self):
+        if self._store is None:
+            return self._fields[index]
+        return self._store.get_field(self._row, name)
+
+    def fset(self, value):
+        if self._store is None:
+            self._fields[index] = value
+        else:
+            self._store.set_field(self._row, name, value)
+
+    return property(fget, fset)
+
+
+class Expense:
+    """A single expense.
+
+    A freshly constructed Expense holds its own values. Once added to a tracker it
+    becomes a view over a row of the tracker's ExpenseStore, so reading or assigning
+    an attribute goes straight to the columns, and it gets a stable `id`.
+    """
+
+    __slots__ = ("_store", "_row", "_fields")
+
+    def __init__(self, date, description, amount, use, category):
+        self._store = None
+        self._row = None
+        self._fields = [date, description, amount, use, category]
+
+    date = _column(0, "date")
+    description = _column(1, "description")
+    amount = _column(2, "amount")
+    use = _column(3, "use")
+    category = _column(4, "category")
+
+    @property
+    def id(self):
+        """The expense's unique id, or None until it is added to a store."""
+        return None if self._store is None else self._store.ids[self._row]
+
+    def to_dict(self):
+        return dict(zip(FIELDS, self.values()))
+
+    def values(self):
+        if self._store is None:
+            return tuple(self._fields)
+        return self._store.row(self._row)
+
+    def __repr__(self):
+        return "Expense({!r}, {!r}, {!r}, {!r}, {!r})".format(*self.values())
+
+
+class ExpenseStore:
+    """Expenses stored column by column.
+
+    Dates are kept as date ordinals in an int32 array. Strings that are not valid
+    YYYY-MM-DD dates are dictionary-encoded and stored as negative codes so they
+    round-trip unchanged. Amounts are float64, and use/category are small integer
+    codes into StringTables. Descriptions stay as a plain list of str.
+
+    Each expense occupies a physical row of the columns. Deleting only marks the
+    row dead (a tombstone), so rows never shift and secondary indexes can refer
+    to them. `order` lists the live rows, so the public API still works with
+    positions 0..len-1. Once dead rows outnumber live ones, the columns are
+    compacted and `generation` is bumped; Expense views from before then are
+    invalid.
+
+    Every expense also has a unique integer id, kept in the `ids` column and
+    saved with it. Ids never change or get reused, so unlike positions and
+    row numbers they survive deletes, compaction and reloads; `rows_by_id`
+    maps them back to rows for O(1) lookup.
+
+    The overall total and the sums per use code and per category code are kept
+    up to date on every append, update and delete. So is `date_index`, a sorted
+    array of (ordinal << 32 | row) keys for dated rows, together with per-month
+    and per-week totals and counts. `cell_totals` is a materialised rollup of
+    dated rows by (month, use code, category code), so the spending of a month
+    for a category or a use is a handful of dictionary lookups (see
+    month_spent), whatever the number of rows.
+
+    `version` is bumped by every change, so derived data can be cached against it.
+    Callables in `listeners` are called as listener(op, index, row, values, old)
+    after every change, with op one of "add", "edit" or "remove", index the
+    position, row the physical row, values the new row tuple (None for removals)
+    and old the previous one (None for additions). extend() sends one
+    ("extend", index, row, None, None) for a whole batch, where index and row are
+    those of the first new expense and the new rows run from there to the end.
+    After a compaction they get ("compact", None, None, None, None).
+
+    A store loaded from a binary snapshot keeps its fixed-width columns as
+    read-only memoryviews of the mapped file (see map_snapshot) until the first
+    change copies them into arrays; `mapped` tells which.
+    """
+
+    # Compact once there are this many tombstones and more dead rows than live ones
+    compact_threshold = 1024
+
+    def __init__(self):
+        self.dates = array("i")
+        self.amounts = array("d")
+        self.uses = array("H")
+        self.categories = array("I")
+        self.descriptions = []
+        self.alive = bytearray()
+        self.order = array("i")
+        self.ids = array("q")
+        self.rows_by_id = {}
+        self.next_id = 1
+        self.dead = 0
+        self.mapped = False
+        self.use_table = StringTable()
+        self.category_table = StringTable()
+        self.raw_dates = StringTable()
+        # Distinct dates are few compared to rows, so parsing and formatting are memoised
+        self._ordinals = {}
+        self._date_texts = {}
+        self._months = {}
+        self.total = 0.0
+        self.use_sums = []
+        self.category_sums = []
+        self.date_index = array("q")
+        self.month_totals = {}
+        self.month_counts = {}
+        self.week_totals = {}
+        self.week_counts = {}
+        self.cell_totals = {}
+        self.cell_counts = {}
+        self.version = 0
+        self.generation = 0
+        self.listeners = []
+
+    # --- encoding ---
+
+    def encode_date(self, text):
+        ordinal = self._ordinals.get(text)
+        if ordinal is None:
+            ordinal = date_to_ordinal(text)
+            if ordinal is None:
+                return -1 - self.raw_dates.encode(text)
+            self._ordinals[text] = ordinal
+        return ordinal
+
+    def decode_date(self, value):
+        text = self._date_texts.get(value)
+        if text is None:
+            if value < 0:
+                return self.raw_dates.decode(-1 - value)
+            text = self._date_texts[value] = Date.fromordinal(value).isoformat()
+        return text
+
+    def month_of(self, ordinal):
+        month = self._months.get(ordinal)
+        if month is None:
+            month = self._months[ordinal] = month_of(ordinal)
+        return month
+
+    # --- sequence protocol ---
+
+    def __len__(self):
+        return len(self.order)
+
+    def __iter__(self):
+        for row in self.order:
+            yield self.view(row)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.view(row) for row in self.order[index]]
+        return self.view(self.order[self._check(index)])
+
+    def _check(self, index):
+        size = len(self.order)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("expense index out of range")
+        return index
+
+    def index_of(self, row):
+        """Position of a live row (order is always ascending)."""
+        return bisect_left(self.order, row)
+
+    def row_of_id(self, expense_id):
+        """Row of the live expense with this id; raises KeyError if there is none."""
+        return self.rows_by_id[expense_id]
+
+    def _claim_id(self, expense_id, row):
+        if expense_id is None:
+            expense_id = self.next_id
+        elif expense_id in self.rows_by_id:
+            raise ValueError(f"Duplicate expense id {expense_id}")
+        if expense_id >= self.next_id:
+            self.next_id = expense_id + 1
+        self.ids.append(expense_id)
+        self.rows_by_id[expense_id] = row
+
+    def view(self, row):
+        expense = Expense.__new__(Expense)
+        expense._store = self
+        expense._row = row
+        expense._fields = None
+        return expense
+
+    # --- row access ---
+
+    def row(self, row):
+        return (self.decode_date(self.dates[row]),
+                self.descriptions[row],
+                self.amounts[row],
+                self.use_table.values[self.uses[row]],
+                self.category_table.values[self.categories[row]])
+
+    def get_field(self, row, name):
+        if name == "date":
+            return self.decode_date(self.dates[row])
+        if name == "description":
+            return self.descriptions[row]
+        if name == "amount":
+            return self.amounts[row]
+        if name == "use":
+            return self.use_table.values[self.uses[row]]
+        return self.category_table.values[self.categories[row]]
+
+    def set_field(self, row, name, value):
+        values = list(self.row(row))
+        values[FIELDS.index(name)] = value
+        self.update_row(row, *values)
+
+    def records(self):
+        ids = self.ids
+        for row in self.order:
+            record = {"id": ids[row]}
+            record.update(zip(FIELDS, self.row(row)))
+            yield record
+
+    # --- aggregates ---
+
+    def _encode_use(self, use):
+        code = self.use_table.encode(use)
+        if code == len(self.use_sums):
+            self.use_sums.append(0.0)
+        return code
+
+    def _encode_category(self, category):
+        code = self.category_table.encode(category)
+        if code == len(self.category_sums):
+            self.category_sums.append(0.0)
+        return code
+
+    def _account(self, amount, use_code, category_code):
+        self.total += amount
+        self.use_sums[use_code] += amount
+        self.category_sums[category_code] += amount
+
+    def _index_date(self, row, ordinal, amount, use_code, category_code, sign):
+        """Add (sign=1) or remove (sign=-1) a dated row from the date index and rollups."""
+        if ordinal <= 0:
+            return
+        key = ordinal << _ROW_BITS | row
+        if sign > 0:
+            index = self.date_index
+            if not index or index[-1] < key:
+                index.append(key)
+            else:
+                index.insert(bisect_left(index, key), key)
+        else:
+            del self.date_index[bisect_left(self.date_index, key)]
+        month = self.month_of(ordinal)
+        for totals, counts, period in ((self.month_totals, self.month_counts, month),
+                                       (self.week_totals, self.week_counts, week_of(ordinal)),
+                                       (self.cell_totals, self.cell_counts, (month, use_code, category_code))):
+            count = counts.get(period, 0) + sign
+            if count:
+                counts[period] = count
+                totals[period] = totals.get(period, 0.0) + sign * amount
+            else:
+                del counts[period]
+                del totals[period]
+
+    def total_by_use(self, use):
+        """Sum for a use, compared case-insensitively like the CLI and GUI inputs."""
+        use = use.lower()
+        return sum(total for value, total in zip(self.use_table.values, self.use_sums)
+                   if value.lower() == use)
+
+    def totals_by_category(self):
+        return {value: total for value, total
+                in zip(self.category_table.values, self.category_sums) if total}
+
+    def month_spent(self, month, use=None, category=None):
+        """Total of the rows dated in month (see month_of), optionally for one use and/or category.
+
+        Answered from the rollups alone. Uses compare case-insensitively, as in
+        total_by_use; categories compare exactly, as in totals_by_category.
+        """
+        if use is None and category is None:
+            return self.month_totals.get(month, 0.0)
+        if use is None:
+            use_codes = range(len(self.use_table))
+        else:
+            use = use.lower()
+            use_codes = [code for code, value in enumerate(self.use_table.values) if value.lower() == use]
+        if category is None:
+            category_codes = range(len(self.category_table))
+        else:
+            code = self.category_table.codes.get(category)
+            if code is None:
+                return 0.0
+            category_codes = (code,)
+        cells = self.cell_totals
+        if len(use_codes) * len(category_codes) > len(cells):
+            # More code pairs than cells; walk the cells instead
+            wanted_uses, wanted_categories = set(use_codes), set(category_codes)
+            return sum(total for (period, use_code, category_code), total in cells.items()
+                       if period == month and use_code in wanted_uses and category_code in wanted_categories)
+        return sum(cells.get((month, use_code, category_code), 0.0)
+                   for use_code in use_codes for category_code in category_codes)
+
+    def recompute_totals(self):
+        """Full rescan of the columns; returns (total, use_sums, category_sums)."""
+        use_rows = [[] for _ in self.use_sums]
+        category_rows = [[] for _ in self.category_sums]
+        amounts, uses, categories = self.amounts, self.uses, self.categories
+        live = []
+        for row in self.order:
+            amount = amounts[row]
+            live.append(amount)
+            use_rows[uses[row]].append(amount)
+            category_rows[categories[row]].append(amount)
+        return (math.fsum(live),
+                [math.fsum(rows) for rows in use_rows],
+                [math.fsum(rows) for rows in category_rows])
+
+    def check_totals(self, rel_tol=1e-9, abs_tol=1e-6):
+        """Raise AssertionError if a running total drifted from a full recompute."""
+        total, use_sums, category_sums = self.recompute_totals()
+
+        def close(a, b):
+            return math.isclose(a, b, rel_tol=rel_tol, abs_tol=abs_tol)
+
+        if not close(self.total, total):
+            raise AssertionError(f"Running total {self.total} != recomputed {total}")
+        for code, (kept, fresh) in enumerate(zip(self.use_sums, use_sums)):
+            if not close(kept, fresh):
+                raise AssertionError(
+                    f"Running total for use {self.use_table.values[code]!r} {kept} != recomputed {fresh}")
+        for code, (kept, fresh) in enumerate(zip(self.category_sums, category_sums)):
+            if not close(kept, fresh):
+                raise AssertionError(
+                    f"Running total for category {self.category_table.values[code]!r} {kept} != recomputed {fresh}")
+        months, cells = {}, {}
+        for key in self.date_index:
+            row = key & _ROW_MASK
+            month = self.month_of(key >> _ROW_BITS)
+            cell = (month, self.uses[row], self.categories[row])
+            months[month] = months.get(month, 0.0) + self.amounts[row]
+            cells[cell] = cells.get(cell, 0.0) + self.amounts[row]
+        if months.keys() != self.month_totals.keys() or not all(
+                close(self.month_totals[month], total) for month, total in months.items()):
+            raise AssertionError("Monthly rollups do not match the date index")
+        if cells.keys() != self.cell_totals.keys() or not all(
+                close(self.cell_totals[cell], total) for cell, total in cells.items()):
+            raise AssertionError("Month/use/category rollups do not match the date index")
+
+    # --- date queries ---
+
+    def _date_bounds(self, start, end):
+        """Slice of date_index covering ordinals start..end inclusive."""
+        index = self.date_index
+        return (bisect_left(index, start << _ROW_BITS),
+                bisect_left(index, (end + 1) << _ROW_BITS))
+
+    def rows_between(self, start, end):
+        """Rows dated start..end inclusive (ordinals), in date order."""
+        lo, hi = self._date_bounds(start, end)
+        return [key & _ROW_MASK for key in self.date_index[lo:hi]]
+
+    def _sum_between(self, start, end):
+        if start > end:
+            return 0.0
+        lo, hi = self._date_bounds(start, end)
+        amounts = self.amounts
+        return math.fsum(amounts[key & _ROW_MASK] for key in self.date_index[lo:hi])
+
+    def total_between(self, start, end):
+        """Sum of rows dated start..end inclusive (ordinals).
+
+        Whole months come from the monthly rollups; only the rows in the partial
+        months at either end are scanned.
+        """
+        if start > end:
+            return 0.0
+        first = self.month_of(start)
+        last = self.month_of(end)
+        if last - first < 2:
+            return self._sum_between(start, end)
+        inner_start = month_start(first + 1)
+        inner_end = month_start(last) - 1
+        totals = self.month_totals
+        if len(totals) < last - first:
+            inner = sum(total for month, total in totals.items() if first < month < last)
+        else:
+            inner = sum(totals.get(month, 0.0) for month in range(first + 1, last))
+        return self._sum_between(start, inner_start - 1) + inner + self._sum_between(inner_end + 1, end)
+
+    # --- memory-mapped snapshots ---
+
+    def map_snapshot(self, snapshot):
+        """Load an empty store from a formats.BinarySnapshot without copying its columns.
+
+        The fixed-width columns become views of the mapped file and the totals,
+        rollups and string tables come from its header, so nothing is parsed per
+        row; only the descriptions and rows_by_id are built. Totals and date
+        range queries then run straight off the mapping.
+        """
+        if len(self.amounts):
+            raise ValueError("Can only map a snapshot into an empty store")
+        header = snapshot.header
+        count = header["rows"]
+        for name, typecode in COLUMNS:
+            setattr(self, name, snapshot.column(name))
+        self.mapped = True
+        strings = snapshot.strings()
+        self.descriptions = list(map(strings.__getitem__, snapshot.column("descriptions")))
+        self.alive = bytearray(b"\x01") * count
+        self.order = array("i", range(count))
+        self.rows_by_id = dict(zip(self.ids, range(count)))
+        self.next_id = max(self.next_id, header["next_id"])
+        for name, values in (("use_table", header["uses"]), ("category_table", header["categories"]),
+                             ("raw_dates", header["raw_dates"])):
+            table = getattr(self, name)
+            table.values = values
+            table.codes = {value: code for code, value in enumerate(values)}
+        self.total = header["total"]
+        self.use_sums = header["use_sums"]
+        self.category_sums = header["category_sums"]
+        for totals, counts, rollup in ((self.month_totals, self.month_counts, header["months"]),
+                                       (self.week_totals, self.week_counts, header["weeks"])):
+            for period, total, period_count in rollup:
+                totals[period] = total
+                counts[period] = period_count
+        for month, use_code, category_code, total, cell_count in header["cells"]:
+            self.cell_totals[month, use_code, category_code] = total
+            self.cell_counts[month, use_code, category_code] = cell_count
+        self.version += 1
+        if self.listeners and count:
+            self._notify("extend", 0, 0, None, None)
+        return count
+
+    def thaw(self):
+        """Copy mapped columns into arrays of the store's own, so they can change."""
+        if not self.mapped:
+            return
+        for name, typecode in COLUMNS:
+            column = array(typecode)
+            column.frombytes(getattr(self, name).cast("B"))
+            setattr(self, name, column)
+        self.mapped = False
+
+    # --- mutation ---
+
+    def append(self, date, description, amount, use, category, expense_id=None):
+        """Append an expense and return its row.
+
+        expense_id is for reloading saved expenses; new ones get the next free id.
+        """
+        if self.mapped:
+            self.thaw()
+        # Everything that can raise comes before the first column changes
+        amount = _as_amount(amount)
+        use_code = self._encode_use(use)
+        category_code = self._encode_category(category)
+        ordinal = self.encode_date(date)
+        row = len(self.amounts)
+        self._claim_id(expense_id, row)
+        self.dates.append(ordinal)
+        self.descriptions.append(description)
+        self.amounts.append(amount)
+        self.uses.append(use_code)
+        self.categories.append(category_code)
+        self.alive.append(1)
+        self.order.append(row)
+        self._account(amount, use_code, category_code)
+        self._index_date(row, ordinal, amount, use_code, category_code, 1)
+        self.version += 1
+        if self.listeners:
+            self._notify("add", len(self.order) - 1, row, (date, description, amount, use, category), None)
+        return row
+
+    def extend(self, rows, ids=None):
+        """Append an iterable of (date, description, amount, use, category) rows; return how many.
+
+        Unlike calling append() per row, the date index is merged once for the
+        whole batch and listeners get a single "extend" notification carrying
+        the index and row of the first new expense (the rest follow it). The
+        new expenses get consecutive ids, or the ones in the ids list when
+        reloading saved expenses. The batch is checked and encoded before any
+        column changes, so a bad row or id leaves the store as it was.
+        """
+        if ids is not None and (len(set(ids)) != len(ids) or not self.rows_by_id.keys().isdisjoint(ids)):
+            raise ValueError("Duplicate expense id")
+        if self.mapped:
+            self.thaw()
+        first = len(self.amounts)
+        first_index = len(self.order)
+        encode_use = self._encode_use
+        encode_category = self._encode_category
+        encode_date = self.encode_date
+        ordinals = self._ordinals
+        use_codes, category_codes = {}, {}
+        # The batch's columns, appended to the store's once every row went in
+        dates, amounts = array(self.dates.typecode), array(self.amounts.typecode)
+        uses, categories = array(self.uses.typecode), array(self.categories.typecode)
+        descriptions = []
+        keys = []
+        # (ordinal, use code, category code) -> [total, count] for the batch;
+        # undated rows too, under their negative date code
+        cells = {}
+        total = 0.0
+        for row, (date, description, amount, use, category) in enumerate(rows, first):
+            use_code = use_codes.get(use)
+            if use_code is None:
+                use_code = use_codes[use] = encode_use(use)
+            category_code = category_codes.get(category)
+            if category_code is None:
+                category_code = category_codes[category] = encode_category(category)
+            ordinal = ordinals.get(date)
+            if ordinal is None:
+                ordinal = encode_date(date)
+            # Raises TypeError for an amount that is not a number, like the store's column would
+            amounts.append(amount)
+            dates.append(ordinal)
+            descriptions.append(description)
+            uses.append(use_code)
+            categories.append(category_code)
+            amount = amounts[-1]
+            total += amount
+            if ordinal > 0:
+                keys.append(ordinal << _ROW_BITS | row)
+            cell = cells.get((ordinal, use_code, category_code))
+            if cell is None:
+                cells[ordinal, use_code, category_code] = [amount, 1]
+            else:
+                cell[0] += amount
+                cell[1] += 1
+        count = len(amounts)
+        if not count:
+            return 0
+        if ids is None:
+            ids = range(self.next_id, self.next_id + count)
+        elif len(ids) != count:
+            raise ValueError(f"{len(ids)} ids given for {count} rows")
+
+        self.dates.extend(dates)
+        self.descriptions.extend(descriptions)
+        self.amounts.extend(amounts)
+        self.uses.extend(uses)
+        self.categories.extend(categories)
+        # Fold the per-day sums into the sums and rollups: one update per distinct
+        # day and use/category pair, not per row
+        use_sums, category_sums = self.use_sums, self.category_sums
+        for (ordinal, use_code, category_code), (amount, cell_count) in cells.items():
+            use_sums[use_code] += amount
+            category_sums[category_code] += amount
+            if ordinal <= 0:
+                continue
+            month = self.month_of(ordinal)
+            for totals, counts, period in ((self.month_totals, self.month_counts, month),
+                                           (self.week_totals, self.week_counts, week_of(ordinal)),
+                                           (self.cell_totals, self.cell_counts,
+                                            (month, use_code, category_code))):
+                counts[period] = counts.get(period, 0) + cell_count
+                totals[period] = totals.get(period, 0.0) + amount
+        self.total += total
+        self.alive.extend(b"\x01" * count)
+        self.order.extend(range(first, first + count))
+        self.ids.extend(ids)
+        self.rows_by_id.update(zip(ids, range(first, first + count)))
+        self.next_id = max(self.next_id, max(ids) + 1)
+        keys.sort()
+        index = self.date_index
+        if keys and (not index or index[-1] < keys[0]):
+            index.extend(keys)
+        elif keys:
+            # Both runs are sorted, so this sort is a single linear merge
+            index.extend(keys)
+            self.date_index = array("q", sorted(index))
+        self.version += 1
+        if self.listeners:
+            self._notify("extend", first_index, first, None, None)
+        return count
+
+    def append_expense(self, expense):
+        """Append a detached Expense and turn it into a view of the new row."""
+        row = self.append(*expense.values())
+        expense._store = self
+        expense._row = row
+        expense._fields = None
+        return row
+
+    def update(self, index, date, description, amount, use, category):
+        self.update_row(self.order[self._check(index)], date, description, amount, use, category)
+
+    def update_row(self, row, date, description, amount, use, category):
+        if self.mapped:
+            self.thaw()
+        # Everything that can raise comes before the old values are taken out of the totals
+        amount = _as_amount(amount)
+        use_code = self._encode_use(use)
+        category_code = self._encode_category(category)
+        ordinal = self.encode_date(date)
+        old = self.row(row) if self.listeners else None
+        self._account(-self.amounts[row], self.uses[row], self.categories[row])
+        self._index_date(row, self.dates[row], self.amounts[row], self.uses[row], self.categories[row], -1)
+        self.dates[row] = ordinal
+        self.descriptions[row] = description
+        self.amounts[row] = amount
+        self.uses[row] = use_code
+        self.categories[row] = category_code
+        self._account(amount, use_code, category_code)
+        self._index_date(row, ordinal, amount, use_code, category_code, 1)
+        self.version += 1
+        if self.listeners:
+            self._notify("edit", self.index_of(row), row, (date, description, amount, use, category), old)
+
+    def delete(self, index):
+        self.delete_row(self.order[self._check(index)])
+
+    def delete_row(self, row):
+        if self.mapped:
+            self.thaw()
+        index = self.index_of(row)
+        old = self.row(row) if self.listeners else None
+        self._account(-self.amounts[row], self.uses[row], self.categories[row])
+        self._index_date(row, self.dates[row], self.amounts[row], self.uses[row], self.categories[row], -1)
+        del self.order[index]
+        del self.rows_by_id[self.ids[row]]
+        self.alive[row] = 0
+        self.descriptions[row] = None
+        self.dead += 1
+        self.version += 1
+        if self.listeners:
+            self._notify("remove", index, row, None, old)
+        if self.dead >= self.compact_threshold and self.dead > len(self.order):
+            self.compact()
+
+    def compact(self):
+        """Drop tombstoned rows and renumber the live ones; invalidates existing views."""
+        if not self.dead:
+            return
+        order = self.order
+        self.dates = array("i", (self.dates[row] for row in order))
+        self.amounts = array("d", (self.amounts[row] for row in order))
+        self.uses = array("H", (self.uses[row] for row in order))
+        self.categories = array("I", (self.categories[row] for row in order))
+        self.descriptions = [self.descriptions[row] for row in order]
+        self.ids = array("q", (self.ids[row] for row in order))
+        self.rows_by_id = dict(zip(self.ids, range(len(order))))
+        # Rows keep their relative order, so remapped index keys stay sorted
+        remap = {row: new for new, row in enumerate(order)}
+        self.date_index = array("q", (key >> _ROW_BITS << _ROW_BITS | remap[key & _ROW_MASK]
+                                      for key in self.date_index))
+        self.order = array("i", range(len(order)))
+        self.alive = bytearray(b"\x01") * len(order)
+        self.dead = 0
+        self.generation += 1
+        self.version += 1
+        if self.listeners:
+            self._notify("compact", None, None, None, None)
+
+    def copy(self):
+        """Compacted, independent copy (without listeners), cheap enough to snapshot from."""
+        # Copying the arrays is a memcpy; copying views would go element by element
+        self.thaw()
+        other = ExpenseStore.__new__(ExpenseStore)
+        other.__dict__.update(self.__dict__)
+        other.dates = array("i", self.dates)
+        other.amounts = array("d", self.amounts)
+        other.uses = array("H", self.uses)
+        other.categories = array("I", self.categories)
+        other.descriptions = list(self.descriptions)
+        other.alive = bytearray(self.alive)
+        other.order = array("i", self.order)
+        other.ids = array("q", self.ids)
+        other.date_index = array("q", self.date_index)
+        for name in ("use_table", "category_table", "raw_dates"):
+            table = StringTable()
+            table.values = list(getattr(self, name).values)
+            table.codes = dict(getattr(self, name).codes)
+            setattr(other, name, table)
+        for name in ("_ordinals", "_date_texts", "_months", "use_sums", "category_sums", "rows_by_id",
+                     "month_totals", "month_counts", "week_totals", "week_counts",
+                     "cell_totals", "cell_counts"):
+            setattr(other, name, type(getattr(self, name))(getattr(self, name)))
+        other.listeners = []
+        other.compact()
+        return other
+
+    def _notify(self, op, index, row, values, old):
+        for listener in self.listeners:
+            listener(op, index, row, values, old)
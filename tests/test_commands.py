@@ -0,0 +1,100 @@
+#The non-interactive commands: input validation, batches that keep going past a
+#bad command, and never saving over a file that could not be loaded.
+
+import argparse
+import io
+import json
+
+import pytest
+
+import commands
+from budget import BudgetTracker
+from limits import parse_month
+
+EXPENSE = {"date": "2024-05-01", "description": "Coffee", "amount": 3.5, "use": "Personal", "category": "Dining"}
+
+
+def run(tracker, *lines):
+    out = io.StringIO()
+    failed, changed = commands.run_batch(tracker, [json.dumps(line) if isinstance(line, dict) else line
+                                                   for line in lines], out)
+    return failed, changed, [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def cli(*argv):
+    parser = argparse.ArgumentParser()
+    commands.add_arguments(parser)
+    out = io.StringIO()
+    status = commands.main(BudgetTracker(), parser.parse_args(argv), out)
+    return status, [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+@pytest.mark.parametrize("data", [
+    None, [], {**EXPENSE, "amount": "3.5"}, {**EXPENSE, "amount": True}, {**EXPENSE, "amount": float("nan")},
+    {**EXPENSE, "date": "01/05/2024"}, {**EXPENSE, "use": ""}, {**EXPENSE, "category": ["x"]},
+    {**EXPENSE, "colour": "red"}, {key: value for key, value in EXPENSE.items() if key != "amount"}])
+def test_expense_values_rejects(data):
+    with pytest.raises(ValueError):
+        commands.expense_values(data)
+
+
+def test_expense_values_patch():
+    values = commands.expense_values({"amount": 4}, tuple(EXPENSE.values()))
+    assert values == ("2024-05-01", "Coffee", 4.0, "Personal", "Dining")
+
+
+@pytest.mark.parametrize("month", [[1], {"a": 1}, 2024.5, "2024-13", "May"])
+def test_parse_month_rejects(month):
+    with pytest.raises(ValueError):
+        parse_month(month)
+
+
+def test_batch_keeps_going():
+    tracker = BudgetTracker()
+    failed, changed, results = run(
+        tracker,
+        "not json",
+        {"op": "fly"},
+        {"op": "check", "month": [1]},
+        {"op": "budget", "amount": 5, "category": ["x"]},
+        {"op": "totals", "start": 5},
+        {"op": "remove", "id": 99},
+        {"op": "add", "expense": {**EXPENSE, "amount": "lots"}},
+        {"op": "add", "expense": EXPENSE, "ref": "a"},
+        {"op": "add", "expenses": [EXPENSE, {**EXPENSE, "date": "nope"}]},
+        {"op": "totals"})
+    assert failed == 8 and changed
+    assert [result["ok"] for result in results] == [False] * 7 + [True, False, True]
+    assert results[7]["ref"] == "a"
+    assert all(result["error"].startswith("line ") for result in results if not result["ok"])
+    # The bad batch add left nothing behind
+    assert len(tracker.expenses) == 1 and results[-1]["total"] == 3.5
+
+
+def test_batch_reports_unexpected_errors(monkeypatch):
+    tracker = BudgetTracker()
+
+    def broken():
+        raise ZeroDivisionError("boom")
+
+    monkeypatch.setattr(tracker, "total_expenses", broken)
+    failed, _, results = run(tracker, {"op": "check"}, {"op": "add", "expense": EXPENSE})
+    assert failed == 1
+    assert "ZeroDivisionError" in results[0]["error"] and results[1]["ok"]
+
+
+def test_add_then_totals(tmp_path):
+    files = ("--expenses", str(tmp_path / "e.json"), "--budget", str(tmp_path / "b.json"))
+    assert cli("add", *map(str, EXPENSE.values()), *files)[0] == 0
+    status, results = cli("totals", *files)
+    assert status == 0 and results == [{"total": 3.5, "by_use": {"Personal": 3.5, "Joint": 0},
+                                        "by_category": {"Dining": 3.5}}]
+
+
+def test_unreadable_file_is_not_overwritten(tmp_path):
+    expenses = tmp_path / "e.json"
+    expenses.write_text('[{"date": "2024')
+    status, results = cli("add", *map(str, EXPENSE.values()), "--expenses", str(expenses),
+                          "--budget", str(tmp_path / "b.json"))
+    assert status == 1 and "error" in results[0]
+    assert expenses.read_text() == '[{"date": "2024'
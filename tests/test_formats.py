@@ -0,0 +1,95 @@
+#Every expense file format must load back the same expenses as JSON, including
+#odd dates, unicode, removed rows (tombstones) and changes replayed from the
+#binary snapshot's journal.
+
+import math
+
+import pytest
+
+from budget import BudgetTracker, Expense
+from journal import Journal
+
+ROWS = [("2024-01-05", "rent", 950.0, "Joint", "Rent"),
+        ("2024-01-06", "café ☃ \U0001F600", 3.2, "Personal", "Dining"),
+        ("2024-02-29", "", 0.0, "Personal", ""),
+        ("not a date", "undated", 1.25, "Joint", "Gifts"),
+        ("", "empty date", -3.5, "personal", "Dining"),
+        ("2023-12-31", "train", 42.0, "Personal", "Transport")]
+
+
+def load(filename):
+    tracker = BudgetTracker()
+    assert tracker.load_expenses(filename)
+    return tracker
+
+
+def assert_same(expected, actual):
+    assert list(actual.expenses.records()) == list(expected.expenses.records())
+    assert actual.expenses.next_id == expected.expenses.next_id
+    assert math.isclose(actual.total_expenses(), expected.total_expenses(), abs_tol=1e-9)
+    assert actual.monthly_totals() == pytest.approx(expected.monthly_totals())
+    assert actual.total_expenses_by_categories() == pytest.approx(expected.total_expenses_by_categories())
+    actual.expenses.check_totals()
+
+
+def saved(tracker, path):
+    assert tracker.save_expenses(str(path))
+    tracker.close()
+    return str(path)
+
+
+@pytest.mark.parametrize("suffix", ["jsonl", "bin"])
+def test_round_trip(tmp_path, suffix):
+    tracker = BudgetTracker()
+    tracker.add_expenses(ROWS)
+    json_file = saved(tracker, tmp_path / "expenses.json")
+    other = saved(load(json_file), tmp_path / f"expenses.{suffix}")
+    assert_same(load(json_file), load(other))
+    # And back to JSON again
+    again = saved(load(other), tmp_path / "again.json")
+    assert_same(load(json_file), load(again))
+
+
+@pytest.mark.parametrize("suffix", ["json", "jsonl", "bin"])
+def test_empty_store(tmp_path, suffix):
+    loaded = load(saved(BudgetTracker(), tmp_path / f"expenses.{suffix}"))
+    assert len(loaded.expenses) == 0
+    assert loaded.total_expenses() == 0
+    loaded.add_expense(Expense("2024-01-01", "first", 1.0, "Joint", "Rent"))
+    assert loaded.expenses.ids[loaded.expenses.order[0]] == 1
+
+
+@pytest.mark.parametrize("suffix", ["jsonl", "bin"])
+def test_tombstones(tmp_path, suffix):
+    tracker = BudgetTracker()
+    tracker.add_expenses(ROWS * 5)
+    for index in (0, 3, 7, 12, 20):
+        tracker.remove_expense(index)
+    assert tracker.expenses.dead
+    json_file = saved(tracker, tmp_path / "expenses.json")
+    tracker = load(json_file)
+    for index in (1, 2):
+        tracker.remove_expense(index)
+    expected = saved(tracker, tmp_path / "expected.json")
+    tracker = load(json_file)
+    for index in (1, 2):
+        tracker.remove_expense(index)
+    assert_same(load(expected), load(saved(tracker, tmp_path / f"expenses.{suffix}")))
+
+
+def test_binary_journal_and_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(Journal, "compact_threshold", 10)
+    tracker = BudgetTracker()
+    tracker.add_expenses(ROWS * 4)
+    bin_file = saved(tracker, tmp_path / "expenses.bin")
+    tracker = load(bin_file)
+    for i in range(30):
+        if i % 3 == 0:
+            tracker.add_expense(Expense("2024-03-01", f"added {i}", 2.5, "Joint", "Rent"))
+        elif i % 3 == 1:
+            tracker.edit_expense(i % len(tracker.expenses), "2023-12-31", f"edited {i}", 4.0, "Personal", "Travel")
+        else:
+            tracker.remove_expense(i % len(tracker.expenses))
+        assert tracker.save_expenses(bin_file)
+    expected = saved(tracker, tmp_path / "expected.json")
+    assert_same(load(expected), load(bin_file))
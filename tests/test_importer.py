@@ -0,0 +1,57 @@
+#Re-importing a statement must not duplicate what the tracker already holds,
+#including months of a partitioned file that are still on disk.
+
+from budget import BudgetTracker
+from importer import import_statement
+from partitions import Partitions
+
+ROWS = [(f"20{year}-{month:02d}-15", f"bill {year}-{month}", float(month), "Joint", "Bills")
+        for year in (22, 23) for month in range(1, 13)]
+
+
+def write_statement(path, rows):
+    # Debits are negative on a bank statement
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("Date,Description,Amount\n")
+        for date, description, amount, *_ in rows:
+            file.write(f"{date},{description},{-amount}\n")
+    return str(path)
+
+
+def test_reimport_is_deduplicated(tmp_path):
+    tracker = BudgetTracker()
+    statement = write_statement(tmp_path / "statement.csv", ROWS[:5])
+    first = import_statement(tracker, statement)
+    assert (first.added, first.duplicates) == (5, 0)
+    second = import_statement(tracker, statement)
+    assert (second.added, second.duplicates) == (0, 5)
+    assert len(tracker.expenses) == 5
+
+
+def test_repeated_rows_in_one_statement_are_kept(tmp_path):
+    tracker = BudgetTracker()
+    statement = write_statement(tmp_path / "statement.csv", [ROWS[0], ROWS[0], ROWS[1]])
+    assert import_statement(tracker, statement).added == 3
+    # Only as many as the tracker already holds count as re-imports
+    statement = write_statement(tmp_path / "again.csv", [ROWS[0], ROWS[0], ROWS[0]])
+    report = import_statement(tracker, statement)
+    assert (report.added, report.duplicates) == (1, 2)
+
+
+def test_reimport_into_months_on_disk(tmp_path, monkeypatch):
+    monkeypatch.setattr(Partitions, "max_resident", 2)
+    full = BudgetTracker()
+    full.add_expenses(ROWS)
+    filename = str(tmp_path / "expenses.parts")
+    assert full.save_expenses(filename)
+    full.close()
+
+    tracker = BudgetTracker()
+    assert tracker.load_expenses(filename)
+    assert tracker._partitions.offline()
+    extra = ("2022-03-16", "new one", 9.5, "Joint", "Bills")
+    report = import_statement(tracker, write_statement(tmp_path / "statement.csv", ROWS[:6] + [extra]))
+    assert (report.added, report.duplicates) == (1, 6)
+    tracker.load_history()
+    assert len(tracker.expenses) == len(ROWS) + 1
+    tracker.verify()
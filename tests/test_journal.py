@@ -0,0 +1,72 @@
+#Changes saved to a snapshot's journal must replay to the same expenses, ids
+#included, whatever the order of adds, edits and removes.
+
+import os
+
+from budget import BudgetTracker, Expense
+from store import FIELDS, ExpenseStore
+from storage import replay
+
+ROWS = [(f"2024-01-{day:02d}", f"item {day}", float(day), "Joint" if day % 2 else "Personal", "Bills")
+        for day in range(1, 21)]
+
+
+def load(filename):
+    tracker = BudgetTracker()
+    assert tracker.load_expenses(filename)
+    return tracker
+
+
+def test_replay_by_id(tmp_path):
+    filename = str(tmp_path / "expenses.json")
+    tracker = BudgetTracker()
+    tracker.add_expenses(ROWS)
+    assert tracker.save_expenses(filename)
+    snapshot = open(filename, "rb").read()
+
+    ids = [tracker.expenses.ids[row] for row in tracker.expenses.order]
+    # Removing early rows shifts every later index; the journal must still find the right expense
+    tracker.remove_expense_by_id(ids[0])
+    tracker.remove_expense_by_id(ids[1])
+    assert tracker.save_expenses(filename)
+    tracker.edit_expense_by_id(ids[5], "2024-02-01", "edited", 99.0, "Personal", "Travel")
+    tracker.add_expense(Expense("2024-03-01", "added", 7.5, "Joint", "Rent"))
+    assert tracker.save_expenses(filename)
+    tracker.remove_expense_by_id(ids[10])
+    assert tracker.save_expenses(filename)
+    tracker.close()
+
+    # The snapshot was left alone; the changes are in the journal
+    assert open(filename, "rb").read() == snapshot
+    assert os.path.getsize(filename + ".journal")
+    loaded = load(filename)
+    assert list(loaded.expenses.records()) == list(tracker.expenses.records())
+    assert loaded.get_expense(ids[5]).values() == ("2024-02-01", "edited", 99.0, "Personal", "Travel")
+    assert loaded.get_expense(ids[0]) is None and loaded.get_expense(ids[10]) is None
+    assert loaded.expenses.next_id == tracker.expenses.next_id
+    loaded.expenses.check_totals()
+
+
+def test_stale_journal_is_ignored(tmp_path):
+    filename = str(tmp_path / "expenses.json")
+    tracker = BudgetTracker()
+    tracker.add_expenses(ROWS)
+    assert tracker.save_expenses(filename)
+    tracker.remove_expense(0)
+    assert tracker.save_expenses(filename)
+    tracker.close()
+    # A snapshot rewritten behind the journal's back no longer matches its header
+    with open(filename, "a", encoding="utf-8") as file:
+        file.write("\n")
+    assert len(load(filename).expenses) == len(ROWS)
+
+
+def test_replay_of_index_records():
+    # Journals written before expenses had ids name them by position
+    store = ExpenseStore()
+    store.extend(ROWS[:3])
+    replay(store, [{"op": "remove", "index": 0},
+                   {"op": "edit", "index": 1, "expense": dict(zip(FIELDS, ("2024-05-05", "moved", 5.0, "Joint", "Rent")))},
+                   {"op": "add", "expense": dict(zip(FIELDS, ("2024-06-01", "new", 1.0, "Joint", "Rent")))}])
+    assert [store.row(row)[1] for row in store.order] == ["item 2", "moved", "new"]
+    store.check_totals()